@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+"""本机回环基准测试
+
+在进程内启动一个模拟从站，用SyncModbusClient和AioModbusClient以不同的帧格式和请求组合压测，
+输出每秒请求数、每秒字节数和延迟分位数(JSON)。
+
+    python -m benchmarks --requests 5000 --output result.json
+    python -m benchmarks --baseline result.json
+"""
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import argparse
+import json
+import platform
+import sys
+from benchmarks import bench
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='xmodbus本机回环基准测试')
+    parser.add_argument('--requests', type=int, default=2000, help='每个用例的请求数')
+    parser.add_argument('--warmup', type=int, default=None, help='每个用例的预热请求数')
+    parser.add_argument('--concurrency', type=int, default=16, help='aio客户端的并发请求数')
+    parser.add_argument('--clients', default=','.join([bench.CLIENT_SYNC, bench.CLIENT_AIO]))
+    parser.add_argument('--framers', default=','.join(bench.framer_classes))
+    parser.add_argument('--mixes', default=','.join(bench.mixes))
+    parser.add_argument('--output', help='结果写入文件，默认输出到标准输出')
+    parser.add_argument('--baseline', help='与基线结果文件比较，每秒请求数下降超过阈值时返回1')
+    parser.add_argument('--threshold', type=float, default=0.1, help='判定为性能下降的比例')
+    args = parser.parse_args(argv)
+
+    results = list()
+    for client in args.clients.split(','):
+        for framer in args.framers.split(','):
+            for mix in args.mixes.split(','):
+                result = bench.run_case(client, framer, mix, args.requests, args.warmup, args.concurrency)
+                results.append(result)
+                print('{client:>5} {framer:>7} {mix:>11}: {rps:>10} req/s  p99 {p99} us'.format(
+                    p99=result['latency_us']['p99'], **result), file=sys.stderr)
+
+    regressions = list()
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = bench.compare(results, json.load(file)['results'], args.threshold)
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'requests': args.requests,
+        'results': results,
+    }
+    if args.baseline:
+        report['regressions'] = [bench.case_key(r) for r in regressions]
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text)
+    else:
+        print(text)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
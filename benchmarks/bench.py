@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import asyncio
+import math
+import time
+import xmodbus.pdu as pdu
+from xmodbus.channel.ch_tcp import TCPChannel
+from xmodbus.client.client_aio import AioModbusClient
+from xmodbus.client.client_sync import SyncModbusClient
+from xmodbus.framer.framer_ascii import AsciiFramer
+from xmodbus.framer.framer_rtu import RTUFramer
+from xmodbus.framer.framer_socket import SocketFramer
+from benchmarks.slave import LoopbackSlave, FRAMER_SOCKET, FRAMER_RTU, FRAMER_ASCII
+
+
+UNIT_ID = 1
+
+framer_classes = {
+    FRAMER_SOCKET: SocketFramer,
+    FRAMER_RTU: RTUFramer,
+    FRAMER_ASCII: AsciiFramer,
+}
+
+# 请求组合，每个组合为依次循环发送的请求PDU列表
+mixes = {
+    'read_small': [pdu.ReadHoldingRegistersRequest(0, 4)],
+    'read_large': [pdu.ReadHoldingRegistersRequest(0, 125)],
+    'read_coils': [pdu.ReadCoilsRequest(0, 2000)],
+    'write': [
+        pdu.WriteSingleRegisterRequest(0, 0x1234),
+        pdu.WriteMultiRegistersRequest(0, list(range(100))),
+        pdu.WriteMultipleCoilsRequest(0, [1, 0] * 400),
+    ],
+    'mixed': [
+        pdu.ReadHoldingRegistersRequest(0, 4),
+        pdu.ReadHoldingRegistersRequest(0, 125),
+        pdu.ReadCoilsRequest(0, 2000),
+        pdu.WriteSingleCoilRequest(0, 'on'),
+        pdu.WriteMultiRegistersRequest(0, list(range(100))),
+    ],
+}
+
+CLIENT_SYNC = 'sync'
+CLIENT_AIO = 'aio'
+
+
+def percentile(sorted_values, p):
+    """按最近秩法取分位数，sorted_values需已排序"""
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(p * len(sorted_values)) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def summarize(latencies, errors, elapsed, bytes_count):
+    """汇总一次压测的结果，延迟单位为微秒"""
+    latencies.sort()
+    count = len(latencies) + errors
+    return {
+        'requests': count,
+        'errors': errors,
+        'elapsed': round(elapsed, 6),
+        'rps': round(count / elapsed, 1) if elapsed else None,
+        'bytes_per_s': round(bytes_count / elapsed, 1) if elapsed else None,
+        'latency_us': dict((name, None if value is None else round(value * 1e6, 1)) for name, value in (
+            ('p50', percentile(latencies, 0.5)),
+            ('p99', percentile(latencies, 0.99)),
+            ('p999', percentile(latencies, 0.999)),
+            ('max', latencies[-1] if latencies else None),
+        )),
+    }
+
+
+def _run_sync(port, framer_cls, requests, count, warmup):
+    c = SyncModbusClient(TCPChannel('127.0.0.1', port), framer_cls=framer_cls, timeout=5)
+    try:
+        def one(request_pdu):
+            adu = c.framer.build_request_adu(request_pdu, UNIT_ID)
+            return c.process_adu_request(adu)
+
+        for i in range(warmup):
+            one(requests[i % len(requests)])
+
+        latencies = list()
+        errors = 0
+        clock = time.perf_counter
+        started = clock()
+        for i in range(count):
+            begin = clock()
+            try:
+                one(requests[i % len(requests)])
+            except Exception:
+                errors += 1
+            else:
+                latencies.append(clock() - begin)
+        return latencies, errors, clock() - started
+    finally:
+        c.channel.close()
+
+
+async def _run_aio(port, framer_cls, requests, count, warmup, concurrency):
+    c = AioModbusClient(TCPChannel('127.0.0.1', port), framer_cls=framer_cls, auto_open=False,
+                        timeout=5, max_in_flight=concurrency)
+    await c.open()
+    try:
+        for i in range(warmup):
+            await c.execute(requests[i % len(requests)], UNIT_ID)
+
+        latencies = list()
+        errors = [0]
+        clock = time.perf_counter
+        counter = iter(range(count))
+
+        async def worker():
+            for i in counter:
+                begin = clock()
+                try:
+                    await c.execute(requests[i % len(requests)], UNIT_ID)
+                except Exception:
+                    errors[0] += 1
+                else:
+                    latencies.append(clock() - begin)
+
+        started = clock()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        return latencies, errors[0], clock() - started
+    finally:
+        c.close()
+
+
+def run_case(client, framer, mix, count, warmup=None, concurrency=None):
+    """压测一种客户端/帧格式/请求组合，返回结果字典"""
+    warmup = min(count, 100) if warmup is None else warmup
+    concurrency = concurrency or 1
+    requests = mixes[mix]
+    framer_cls = framer_classes[framer]
+
+    slave = LoopbackSlave(framer).start()
+    try:
+        if client == CLIENT_SYNC:
+            latencies, errors, elapsed = _run_sync(slave.port, framer_cls, requests, count, warmup)
+        else:
+            latencies, errors, elapsed = asyncio.run(
+                _run_aio(slave.port, framer_cls, requests, count, warmup, concurrency))
+    finally:
+        slave.stop()
+
+    # 预热请求的字节数按比例扣除
+    total = warmup + count
+    bytes_count = (slave.stats.bytes_in + slave.stats.bytes_out) * count / total if total else 0
+
+    result = {'client': client, 'framer': framer, 'mix': mix,
+              'concurrency': concurrency if client == CLIENT_AIO else 1}
+    result.update(summarize(latencies, errors, elapsed, bytes_count))
+    return result
+
+
+def case_key(result):
+    return result['client'], result['framer'], result['mix'], result['concurrency']
+
+
+def compare(results, baseline, threshold=None):
+    """与基线结果比较，返回每秒请求数下降超过threshold的用例"""
+    threshold = 0.1 if threshold is None else threshold
+    base = dict((case_key(r), r) for r in baseline)
+    regressions = list()
+    for result in results:
+        old = base.get(case_key(result))
+        if not old or not old['rps'] or not result['rps']:
+            continue
+        change = result['rps'] / old['rps'] - 1
+        result['rps_change'] = round(change, 4)
+        if change < -threshold:
+            regressions.append(result)
+    return regressions
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import asyncio
+import binascii
+import logging
+import struct
+import threading
+import xmodbus.common as common
+import xmodbus.pdu as pdu
+import xmodbus.utilities as utilities
+from xmodbus.datastore import MemoryDatastore
+from xmodbus.server import AioModbusServer, ServerStats
+
+
+_logger = logging.getLogger()
+
+FRAMER_SOCKET = 'socket'
+FRAMER_RTU = 'rtu'
+FRAMER_ASCII = 'ascii'
+
+
+def execute_request_pdu(datastore, unit_id, request_pdu):
+    """执行请求PDU，返回应答PDU"""
+    try:
+        return pdu.decode_request_pdu(request_pdu).execute(datastore, unit_id)
+    except common.XModbusExceptionError as e:
+        return pdu.encode_exception_pdu(request_pdu[0], e.code)
+
+
+def _rtu_request_length(buffer):
+    """返回缓冲区开头的RTU请求帧长度，数据不足时返回None"""
+    if len(buffer) < 2:
+        return None
+    if buffer[1] in (0x0F, 0x10):
+        if len(buffer) < 7:
+            return None
+        return 7 + buffer[6] + 2
+    return 8
+
+
+class SerialLineSlaveProtocol(asyncio.Protocol):
+    """经TCP透传的RTU/ASCII从站连接"""
+    def __init__(self, slave):
+        self.slave = slave
+        self.transport = None
+        self.buffer = bytearray()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        stats = self.slave.stats
+        stats.bytes_in += len(data)
+        self.buffer.extend(data)
+
+        responses = list()
+        while True:
+            frame = self._next_frame()
+            if frame is None:
+                break
+            unit_id, request_pdu = frame
+            if not self.slave.datastore.has_unit(unit_id):
+                continue
+            stats.requests += 1
+            response = bytes([unit_id]) + execute_request_pdu(self.slave.datastore, unit_id, request_pdu)
+            responses.append(self._encode(response))
+
+        if responses:
+            data = b''.join(responses)
+            stats.bytes_out += len(data)
+            self.transport.write(data)
+
+    def _next_frame(self):
+        if self.slave.framer == FRAMER_RTU:
+            length = _rtu_request_length(self.buffer)
+            if length is None or len(self.buffer) < length:
+                return None
+            frame = bytes(self.buffer[:length])
+            del self.buffer[:length]
+            return frame[0], frame[1:-2]
+
+        end = self.buffer.find(b'\r\n')
+        if end < 0:
+            return None
+        frame = binascii.a2b_hex(bytes(self.buffer[self.buffer.index(b':') + 1:end]))
+        del self.buffer[:end + 2]
+        return frame[0], frame[1:-1]
+
+    def _encode(self, frame):
+        if self.slave.framer == FRAMER_RTU:
+            return frame + struct.pack('>H', utilities.computeCRC(frame))
+        lrc = struct.pack('B', utilities.computeLRC(frame))
+        return b''.join([b':', binascii.hexlify(frame + lrc).upper(), b'\r\n'])
+
+
+class LoopbackSlave:
+    """在后台线程中运行的模拟从站
+
+    socket帧使用AioModbusServer，rtu/ascii帧经TCP透传，
+    所有从站共享同一个MemoryDatastore。
+    """
+    def __init__(self, framer, unit_ids=None, host=None):
+        self.framer = framer
+        self.host = host or '127.0.0.1'
+        self.port = None
+        self.datastore = MemoryDatastore(unit_ids or [1])
+        self.stats = ServerStats()
+
+        self._loop = None
+        self._thread = None
+        self._server = None
+        self._error = None
+
+    def start(self):
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(ready,), daemon=True)
+        self._thread.start()
+        ready.wait()
+        if self._error is not None:
+            # 启动失败，在调用方线程中抛出
+            error, self._error = self._error, None
+            self._thread.join()
+            self._loop = None
+            raise error
+        return self
+
+    def _run(self, ready):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._start())
+        except BaseException as e:
+            self._error = e
+            self._loop.close()
+            return
+        finally:
+            ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            self._loop.close()
+
+    async def _start(self):
+        if self.framer == FRAMER_SOCKET:
+            server = AioModbusServer(self.datastore, self.host, 0)
+            server.stats = self.stats
+            await server.start()
+            self._server = server
+            self.port = server.sockets[0][1]
+        else:
+            loop = asyncio.get_running_loop()
+            self._server = await loop.create_server(lambda: SerialLineSlaveProtocol(self), self.host, 0)
+            self.port = self._server.sockets[0].getsockname()[1]
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import socket
+import struct
+import threading
+import time
+import pytest
+import xmodbus.utilities as utilities
+from benchmarks.slave import LoopbackSlave
+
+
+@pytest.fixture
+def start_slave():
+    """启动回环模拟从站，测试结束后停止"""
+    slaves = list()
+
+    def start(framer, unit_ids=None):
+        slave = LoopbackSlave(framer, unit_ids).start()
+        slaves.append(slave)
+        return slave
+
+    yield start
+    for slave in slaves:
+        slave.stop()
+
+
+class RawSlave:
+    """只接受一个连接的原始TCP从站，handler(conn)在后台线程中处理连接，用于构造异常的时序"""
+    def __init__(self, handler):
+        self.handler = handler
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(1)
+        self.port = self.sock.getsockname()[1]
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        conn, _ = self.sock.accept()
+        with conn:
+            try:
+                self.handler(conn)
+            except OSError:
+                pass
+
+    def close(self):
+        self.sock.close()
+
+
+@pytest.fixture
+def raw_slave():
+    slaves = list()
+
+    def start(handler):
+        slave = RawSlave(handler)
+        slaves.append(slave)
+        return slave
+
+    yield start
+    for slave in slaves:
+        slave.close()
+
+
+def recv_exactly(conn, n):
+    data = b''
+    while len(data) < n:
+        chunk = conn.recv(n - len(data))
+        if not chunk:
+            raise OSError('connection closed')
+        data += chunk
+    return data
+
+
+def rtu(frame):
+    return frame + struct.pack('>H', utilities.computeCRC(frame))
+
+
+def delayed_first_rtu_reply(conn):
+    """RTU透传从站，第一个请求0.6秒后才应答，应答值为请求的起始地址"""
+    first = True
+    while True:
+        request = recv_exactly(conn, 8)
+        address, = struct.unpack('>H', request[2:4])
+        if first:
+            time.sleep(0.6)
+            first = False
+        conn.sendall(rtu(request[:2] + b'\x02' + struct.pack('>H', address)))
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import asyncio
+import struct
+import time
+import pytest
+import xmodbus.arbiter as arbiter
+import xmodbus.common as common
+import xmodbus.pdu as pdu
+from xmodbus.channel.ch_tcp import TCPChannel
+from xmodbus.client.client_aio import AioModbusClient
+from xmodbus.framer.framer_socket import AduRequest, SocketFramer
+from conftest import recv_exactly
+
+
+def read_adu(unit_id, address=0):
+    return AduRequest(pdu.ReadHoldingRegistersRequest(address, 1), unit_id)
+
+
+def write_adu(unit_id, address=0):
+    return AduRequest(pdu.WriteSingleRegisterRequest(address, 1), unit_id)
+
+
+class RecordingBus:
+    """按执行顺序记录请求的总线"""
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.executed = list()
+
+    async def __call__(self, request_adu):
+        self.executed.append((request_adu.pdu.fx, request_adu.unit_id, request_adu.pdu.address))
+        await asyncio.sleep(self.delay)
+        return request_adu
+
+
+def test_writes_before_reads():
+    async def run():
+        bus = RecordingBus()
+        a = arbiter.BusArbiter(bus)
+        futures = [a.submit(read_adu(1, 0)), a.submit(read_adu(1, 1)), a.submit(write_adu(1, 2)),
+                   a.submit(read_adu(1, 3), arbiter.PRIORITY_LOW), a.submit(read_adu(1, 4), arbiter.PRIORITY_HIGH)]
+        await asyncio.gather(*futures)
+        a.close()
+        return bus.executed
+
+    assert asyncio.run(run()) == [(6, 1, 2), (3, 1, 4), (3, 1, 0), (3, 1, 1), (3, 1, 3)]
+
+
+def test_units_take_turns():
+    async def run():
+        bus = RecordingBus()
+        a = arbiter.BusArbiter(bus)
+        futures = [a.submit(read_adu(1, i)) for i in range(3)]
+        futures += [a.submit(read_adu(2, i)) for i in range(2)]
+        futures.append(a.submit(read_adu(3, 0)))
+        await asyncio.gather(*futures)
+        a.close()
+        return [(unit_id, address) for _, unit_id, address in bus.executed]
+
+    assert asyncio.run(run()) == [(1, 0), (2, 0), (3, 0), (1, 1), (2, 1), (1, 2)]
+
+
+def test_expired_requests_are_dropped():
+    async def run():
+        loop = asyncio.get_running_loop()
+        bus = RecordingBus(0.2)
+        a = arbiter.BusArbiter(bus)
+        busy = a.submit(read_adu(1, 0))
+        # 排队期间截止时刻已过，不再占用总线
+        late = a.submit(read_adu(1, 1), deadline=loop.time() + 0.1)
+        expired = a.submit(read_adu(1, 2), deadline=loop.time() - 1)
+        ok = a.submit(read_adu(1, 3), deadline=loop.time() + 5)
+
+        await busy
+        with pytest.raises(common.XModbusQueueTimeoutError):
+            await late
+        with pytest.raises(common.XModbusQueueTimeoutError):
+            await expired
+        await ok
+        a.close()
+        assert a.dropped == 2
+        assert a.executed == 2
+        return [address for _, _, address in bus.executed]
+
+    assert asyncio.run(run()) == [0, 3]
+
+
+def late_reply_slave(conn):
+    """第一个请求正常应答，第二个请求的应答延迟到请求超时之后，其后的请求立即应答"""
+    n = 0
+    while True:
+        head = conn.recv(7)
+        if len(head) < 7:
+            return
+        tid, _, length, unit_id = struct.unpack('>HHHB', head)
+        body = recv_exactly(conn, length - 1)
+        if n == 1:
+            time.sleep(0.7)
+        if body[0] == 3:
+            conn.sendall(struct.pack('>HHHBBBH', tid, 0, 5, unit_id, 3, 2, tid))
+        else:
+            conn.sendall(struct.pack('>HHHB', tid, 0, len(body) + 1, unit_id) + body)
+        n += 1
+
+
+def test_late_reply_of_reordered_request_is_dropped(raw_slave):
+    slave = raw_slave(late_reply_slave)
+
+    async def run():
+        c = AioModbusClient(TCPChannel('127.0.0.1', slave.port), SocketFramer, timeout=0.5)
+        await c.read_holding_registers(0, 1, 1)
+        # 读请求先分配事务标识符，写请求优先执行并超时，其迟到的应答的事务标识符比读请求的大
+        read = c.execute(pdu.ReadHoldingRegistersRequest(0, 1), 1, timeout=2)
+        write = c.execute(pdu.WriteSingleRegisterRequest(0, 1), 1)
+        results = await asyncio.gather(read, write, return_exceptions=True)
+        c.close()
+        return results
+
+    response, error = asyncio.run(run())
+    assert isinstance(error, common.XModbusTimeoutError)
+    # 应答值为其事务标识符，读请求得到的是自己的应答而不是写请求迟到的应答
+    assert list(response.pdu.values) == [1]
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import asyncio
+import struct
+import threading
+import time
+import xmodbus.common as common
+import xmodbus.pdu as pdu
+from benchmarks.slave import FRAMER_SOCKET
+from xmodbus.cache import ReadCache
+from xmodbus.channel.ch_tcp import TCPChannel
+from xmodbus.client.client_aio import AioModbusClient
+from xmodbus.client.client_sync import SyncModbusClient
+from xmodbus.framer.framer_socket import SocketFramer
+from conftest import recv_exactly
+
+
+def make_client(slave, cache):
+    return SyncModbusClient(TCPChannel('127.0.0.1', slave.port), SocketFramer, timeout=2, cache=cache)
+
+
+def test_contained_range_is_served_from_cache(start_slave):
+    slave = start_slave(FRAMER_SOCKET)
+    slave.datastore.set_values(1, 'holding_registers', 0, list(range(20)))
+    slave.datastore.set_values(1, 'coils', 0, [True, False, True, True])
+    cache = ReadCache(ttl=10)
+    c = make_client(slave, cache)
+
+    assert list(c.read_holding_registers(0, 20, 1).pdu.values) == list(range(20))
+    assert list(c.read_holding_registers(5, 3, 1).pdu.values) == [5, 6, 7]
+    assert list(c.read_coils(0, 4, 1).pdu.bits[:4]) == [True, False, True, True]
+    assert list(c.read_coils(1, 3, 1).pdu.bits[:3]) == [False, True, True]
+    assert cache.as_dict()['hits'] == 2
+    assert cache.as_dict()['misses'] == 2
+    c.close()
+
+
+def test_entries_expire(start_slave):
+    slave = start_slave(FRAMER_SOCKET)
+    cache = ReadCache(ttl=0.05, ttls={common.INPUT_REGISTERS: 0})
+    c = make_client(slave, cache)
+
+    c.read_holding_registers(0, 1, 1)
+    c.read_holding_registers(0, 1, 1)
+    time.sleep(0.1)
+    c.read_holding_registers(0, 1, 1)
+    c.read_input_register(0, 1, 1)
+    c.read_input_register(0, 1, 1)
+    assert cache.as_dict()['hits'] == 1
+    assert cache.as_dict()['entries'] == 1
+    c.close()
+
+
+def test_write_invalidates_overlapping_entries(start_slave):
+    slave = start_slave(FRAMER_SOCKET)
+    cache = ReadCache(ttl=10)
+    c = make_client(slave, cache)
+
+    c.read_holding_registers(0, 10, 1)
+    c.read_holding_registers(20, 10, 1)
+    c.write_single_register(5, 55, 1)
+    assert cache.as_dict()['invalidations'] == 1
+    assert list(c.read_holding_registers(5, 1, 1).pdu.values) == [55]
+    c.read_holding_registers(25, 1, 1)
+    assert cache.as_dict()['hits'] == 1
+    c.close()
+
+
+def test_least_recently_used_entries_are_evicted(start_slave):
+    slave = start_slave(FRAMER_SOCKET)
+    cache = ReadCache(ttl=10, max_entries=2)
+    c = make_client(slave, cache)
+
+    c.read_holding_registers(0, 1, 1)
+    c.read_holding_registers(1, 1, 1)
+    c.read_holding_registers(0, 1, 1)
+    c.read_holding_registers(2, 1, 1)
+    assert cache.as_dict()['evictions'] == 1
+    c.read_holding_registers(0, 1, 1)
+    assert cache.as_dict()['hits'] == 2
+    c.close()
+
+
+def test_batch_read_after_write_is_not_served_from_cache(start_slave):
+    slave = start_slave(FRAMER_SOCKET)
+    cache = ReadCache(ttl=10)
+    c = make_client(slave, cache)
+
+    c.read_holding_registers(0, 4, 1)
+    results = c.execute_many([
+        (pdu.ReadHoldingRegistersRequest(0, 4), 1),
+        (pdu.WriteSingleRegisterRequest(2, 77), 1),
+        (pdu.ReadHoldingRegistersRequest(0, 4), 1),
+    ])
+    assert list(results[0].pdu.values) == [0, 0, 0, 0]
+    assert list(results[2].pdu.values) == [0, 0, 77, 0]
+    assert list(c.read_holding_registers(2, 1, 1).pdu.values) == [77]
+    c.close()
+
+
+def test_concurrent_reads_are_sent_once(start_slave):
+    slave = start_slave(FRAMER_SOCKET)
+    cache = ReadCache(ttl=10)
+
+    async def run():
+        c = AioModbusClient(TCPChannel('127.0.0.1', slave.port), SocketFramer, timeout=2, cache=cache)
+        requests = slave.stats.requests
+        responses = await asyncio.gather(*[c.read_holding_registers(0, 4, 1) for _ in range(5)])
+        assert all(response.is_success() for response in responses)
+        assert slave.stats.requests - requests == 1
+        assert cache.as_dict()['collapsed'] == 4
+        c.close()
+
+    asyncio.run(run())
+
+
+class DelayedReadSlave:
+    """socket从站，读请求在收到时取值、0.3秒后才应答，写请求立即执行并应答；error为真时读请求返回异常应答"""
+    def __init__(self, error=False):
+        self.error = error
+        self.registers = [1] * 8
+        self.lock = threading.Lock()
+
+    def send(self, conn, tid, unit_id, data):
+        with self.lock:
+            conn.sendall(struct.pack('>HHHB', tid, 0, len(data) + 1, unit_id) + data)
+
+    def __call__(self, conn):
+        while True:
+            tid, _, length, unit_id = struct.unpack('>HHHB', recv_exactly(conn, 7))
+            request = recv_exactly(conn, length - 1)
+            address, value = struct.unpack('>HH', request[1:5])
+            if request[0] == 0x06:
+                self.registers[address] = value
+                self.send(conn, tid, unit_id, request)
+                continue
+            if self.error:
+                data = b'\x83\x02'
+            else:
+                values = self.registers[address:address + value]
+                data = struct.pack('>BB%dH' % len(values), 0x03, len(values) * 2, *values)
+            threading.Timer(0.3, self.send, (conn, tid, unit_id, data)).start()
+
+
+def test_read_after_write_does_not_join_earlier_read(raw_slave):
+    slave = raw_slave(DelayedReadSlave())
+    cache = ReadCache(ttl=10)
+
+    async def run():
+        c = AioModbusClient(TCPChannel('127.0.0.1', slave.port), SocketFramer, timeout=2, max_in_flight=4,
+                            cache=cache)
+        earlier = asyncio.ensure_future(c.read_holding_registers(0, 1, 1))
+        await asyncio.sleep(0.05)
+        await c.write_single_register(0, 42, 1)
+        response = await c.read_holding_registers(0, 1, 1)
+        assert list(response.pdu.values) == [42]
+        assert list((await earlier).pdu.values) == [1]
+        assert cache.as_dict()['collapsed'] == 0
+        # 写入前的读应答没有进入缓存
+        assert list((await c.read_holding_registers(0, 1, 1)).pdu.values) == [42]
+        c.close()
+
+    asyncio.run(run())
+
+
+def test_collapsed_error_response_belongs_to_each_caller(raw_slave):
+    slave = raw_slave(DelayedReadSlave(error=True))
+    cache = ReadCache(ttl=10)
+
+    async def run():
+        c = AioModbusClient(TCPChannel('127.0.0.1', slave.port), SocketFramer, timeout=2, max_in_flight=4,
+                            cache=cache)
+        adus = [c.framer.build_request_adu(pdu.ReadHoldingRegistersRequest(0, 1), 1) for _ in range(3)]
+        responses = await asyncio.gather(*[c.process_adu_request(request_adu) for request_adu in adus])
+        assert cache.as_dict()['collapsed'] == 2
+        assert [response.request for response in responses] == adus
+        assert all(response.pdu.error_code == common.ILLEGAL_DATA_ADDRESS for response in responses)
+        c.close()
+
+    asyncio.run(run())
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import asyncio
+import socket
+import struct
+import pytest
+import xmodbus.common as common
+import xmodbus.pdu as pdu
+from benchmarks.slave import FRAMER_SOCKET
+from xmodbus.channel.ch_tcp import TCPChannel
+from xmodbus.client.client_aio import AioModbusClient
+from xmodbus.framer.framer_socket import SocketFramer
+from conftest import recv_exactly
+
+
+@pytest.mark.parametrize('max_in_flight', [1, 8])
+def test_request_waits_for_auto_open(start_slave, max_in_flight):
+    slave = start_slave(FRAMER_SOCKET)
+    slave.datastore.set_values(1, 'holding_registers', 0, [11, 22])
+
+    async def run():
+        c = AioModbusClient(TCPChannel('127.0.0.1', slave.port), SocketFramer, timeout=2, max_in_flight=max_in_flight)
+        response = await c.read_holding_registers(0, 2, 1)
+        assert list(response.pdu.values) == [11, 22]
+        c.close()
+
+    asyncio.run(run())
+
+
+def test_pipelined_requests(start_slave):
+    slave = start_slave(FRAMER_SOCKET)
+    slave.datastore.set_values(1, 'holding_registers', 0, list(range(100)))
+
+    async def run():
+        c = AioModbusClient(TCPChannel('127.0.0.1', slave.port), SocketFramer, timeout=2, max_in_flight=4)
+        responses = await asyncio.gather(*[c.execute(pdu.ReadHoldingRegistersRequest(i * 10, 10), 1)
+                                           for i in range(10)])
+        assert [list(r.pdu.values) for r in responses] == [list(range(i * 10, i * 10 + 10)) for i in range(10)]
+        c.close()
+
+    asyncio.run(run())
+
+
+def test_open_failure_is_raised_to_requests():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    async def run():
+        c = AioModbusClient(TCPChannel('127.0.0.1', port), SocketFramer, timeout=1, max_in_flight=4)
+        with pytest.raises(OSError):
+            await c.read_holding_registers(0, 1, 1)
+
+    asyncio.run(run())
+
+
+def answer_then_close(conn):
+    """应答第一个请求，收到第二个请求后关闭连接"""
+    for n in range(2):
+        head = recv_exactly(conn, 7)
+        tid, _, length, unit_id = struct.unpack('>HHHB', head)
+        recv_exactly(conn, length - 1)
+        if n == 0:
+            conn.sendall(struct.pack('>HHHBBBH', tid, 0, 5, unit_id, 3, 2, 7))
+
+
+def test_requests_fail_after_peer_closes(raw_slave):
+    slave = raw_slave(answer_then_close)
+
+    async def run():
+        c = AioModbusClient(TCPChannel('127.0.0.1', slave.port), SocketFramer, max_in_flight=4)
+        assert list((await c.read_holding_registers(0, 1, 1)).pdu.values) == [7]
+        # 在途请求随连接关闭失败
+        with pytest.raises(common.XModbusError):
+            await asyncio.wait_for(c.read_holding_registers(0, 1, 1), 2)
+        # 之后的请求立即失败，而不是等待永远不会到达的应答
+        for _ in range(2):
+            with pytest.raises(common.XModbusError, match='response reader stopped'):
+                await asyncio.wait_for(c.read_holding_registers(0, 1, 1), 2)
+        c.close()
+
+    asyncio.run(run())
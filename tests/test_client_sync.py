@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import struct
+import time
+import pytest
+import xmodbus.common as common
+import xmodbus.pdu as pdu
+from benchmarks.slave import FRAMER_SOCKET
+from xmodbus.channel.ch_tcp import TCPChannel
+from xmodbus.client.client_sync import SyncModbusClient
+from xmodbus.framer.framer_socket import SocketFramer
+from xmodbus.policy import STATE_CLOSED, CircuitBreaker, RetryPolicy
+from conftest import recv_exactly
+
+
+class SilentFirst:
+    """不应答第一个请求的socket从站，应答值为请求的起始地址，记录收到的请求地址"""
+    def __init__(self):
+        self.addresses = list()
+
+    def __call__(self, conn):
+        while True:
+            tid, _, length, unit_id = struct.unpack('>HHHB', recv_exactly(conn, 7))
+            request = recv_exactly(conn, length - 1)
+            address, = struct.unpack('>H', request[1:3])
+            self.addresses.append(address)
+            if len(self.addresses) > 1:
+                data = b'\x03\x02' + struct.pack('>H', address)
+                conn.sendall(struct.pack('>HHHB', tid, 0, len(data) + 1, unit_id) + data)
+
+
+def reads(*addresses):
+    return [(pdu.ReadHoldingRegistersRequest(address, 1), 1) for address in addresses]
+
+
+def test_execute_many(start_slave):
+    slave = start_slave(FRAMER_SOCKET, unit_ids=[1, 2])
+    slave.datastore.set_values(2, 'holding_registers', 0, list(range(50)))
+    c = SyncModbusClient(TCPChannel('127.0.0.1', slave.port), SocketFramer, timeout=2)
+    requests = [(pdu.ReadHoldingRegistersRequest(i, 2), 2) for i in range(40)]
+    requests.append((pdu.ReadHoldingRegistersRequest(0, 200), 2))
+    results = c.execute_many(requests, max_in_flight=8, return_exceptions=True)
+    assert [list(r.pdu.values) for r in results[:40]] == [[i, i + 1] for i in range(40)]
+    assert results[40].pdu.error_code == common.ILLEGAL_DATA_VALUE
+    c.close()
+
+
+def test_execute_many_retries_each_request(raw_slave):
+    handler = SilentFirst()
+    slave = raw_slave(handler)
+    c = SyncModbusClient(TCPChannel('127.0.0.1', slave.port), SocketFramer, timeout=0.3,
+                         retry=RetryPolicy(retries=1, backoff=0.01))
+    results = c.execute_many(reads(1, 2, 3), max_in_flight=2)
+    assert [list(r.pdu.values) for r in results] == [[1], [2], [3]]
+    assert sorted(handler.addresses) == [1, 1, 2, 3]
+    c.close()
+
+
+def test_execute_many_probes_before_half_open_window(raw_slave):
+    handler = SilentFirst()
+    slave = raw_slave(handler)
+    breaker = CircuitBreaker(threshold=1, cooldown=0.2)
+    c = SyncModbusClient(TCPChannel('127.0.0.1', slave.port), SocketFramer, timeout=0.3, breaker=breaker)
+    with pytest.raises(common.XModbusTimeoutError):
+        c.read_holding_registers(7, 1, 1)
+
+    results = c.execute_many(reads(10, 11), return_exceptions=True)
+    assert all(isinstance(r, common.XModbusUnavailableError) for r in results)
+
+    time.sleep(0.25)
+    results = c.execute_many(reads(10, 11, 12), max_in_flight=4)
+    assert [list(r.pdu.values) for r in results] == [[10], [11], [12]]
+    # 默认探测请求读地址0，在整批请求之前发出
+    assert handler.addresses == [7, 0, 10, 11, 12]
+    assert breaker.state((c.channel, 1)) == STATE_CLOSED
+    c.close()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import asyncio
+import time
+import xmodbus.pdu as pdu
+from benchmarks.slave import FRAMER_SOCKET
+from xmodbus.channel.ch_tcp import TCPChannel
+from xmodbus.client.client_aio import AioModbusClient
+from xmodbus.framer.framer_socket import SocketFramer
+
+
+def make_client(slave, **kwargs):
+    return AioModbusClient(TCPChannel('127.0.0.1', slave.port), SocketFramer, timeout=2, write_window=0.05, **kwargs)
+
+
+def test_writes_are_merged(start_slave):
+    slave = start_slave(FRAMER_SOCKET)
+
+    async def run():
+        c = make_client(slave)
+        requests = slave.stats.requests
+        futures = [c.write_single_register(address, address * 2, 1) for address in range(200)]
+        futures.append(c.write_single_register(5, 999, 1))
+        futures.extend(c.write_single_coil(address, address % 3 == 0, 1) for address in range(20))
+        futures.append(c.write_single_register(1000, 7, 1))
+        responses = await asyncio.gather(*futures)
+        assert all(response.is_success() for response in responses)
+        # 200个连续寄存器分为123 + 77两个请求，线圈一个请求，孤立地址一个请求
+        assert slave.stats.requests - requests == 4
+        assert c.write_buffer.as_dict()['collapsed'] == 1
+        assert responses[5].pdu.as_dict()['data'] == {'address': 5, 'value': 10}
+        c.close()
+
+    asyncio.run(run())
+    assert slave.datastore.get_values(1, 'holding_registers', 4, 3) == [8, 999, 12]
+    assert slave.datastore.get_values(1, 'holding_registers', 1000, 1) == [7]
+    assert slave.datastore.get_values(1, 'coils', 0, 4) == [True, False, False, True]
+
+
+def test_unbuffered_write_waits_for_buffered_write(start_slave):
+    slave = start_slave(FRAMER_SOCKET)
+
+    async def run():
+        c = make_client(slave)
+        c.write_single_register(0, 111, 1)
+        await c.write_multiple_registers(0, [222], 1)
+        response = await c.read_holding_registers(0, 1, 1)
+        assert list(response.pdu.values) == [222]
+        c.close()
+
+    asyncio.run(run())
+
+
+def test_read_inside_window_sees_buffered_write(start_slave):
+    slave = start_slave(FRAMER_SOCKET)
+    slave.datastore.set_values(1, 'holding_registers', 0, [1, 2, 3])
+
+    async def run():
+        c = make_client(slave, max_in_flight=4)
+        future = c.write_single_register(1, 20, 1)
+        # 地址不重叠的读请求不需要等待
+        response = await c.read_holding_registers(2, 1, 1)
+        assert list(response.pdu.values) == [3]
+        assert not future.done()
+        response = await c.execute(pdu.ReadHoldingRegistersRequest(0, 3), 1)
+        assert list(response.pdu.values) == [1, 20, 3]
+        assert future.done()
+        c.close()
+
+    asyncio.run(run())
+
+
+def test_close_cancels_writes_in_flight(raw_slave):
+    # 从站只接收请求不应答
+    slave = raw_slave(lambda conn: conn.recv(4096) and time.sleep(2))
+
+    async def run():
+        c = AioModbusClient(TCPChannel('127.0.0.1', slave.port), SocketFramer, timeout=5, write_window=0.01)
+        futures = [c.write_single_register(address, address, 1) for address in range(3)]
+        await asyncio.sleep(0.3)
+        assert c.write_buffer.as_dict()['requests'] == 1
+        c.close()
+        done, pending = await asyncio.wait(futures, timeout=1)
+        assert not pending
+        assert all(future.cancelled() for future in done)
+
+    asyncio.run(run())
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import pytest
+import xmodbus.common as common
+from xmodbus.datastore import MemoryDatastore, MmapDatastore
+
+
+@pytest.fixture(params=['memory', 'mmap', 'file'])
+def datastore(request, tmp_path):
+    if request.param == 'memory':
+        store = MemoryDatastore([1, 2], block_size=16)
+    elif request.param == 'mmap':
+        store = MmapDatastore([1, 2])
+    else:
+        store = MmapDatastore([1, 2], str(tmp_path / 'units.dat'))
+    yield store
+    if isinstance(store, MmapDatastore):
+        store.close()
+
+
+def test_values_round_trip(datastore):
+    # 跨越MemoryDatastore的数据块边界
+    datastore.set_values(1, common.HOLDING_REGISTERS, 10, list(range(100, 120)))
+    datastore.set_values(2, common.COILS, 14, [True, False, True])
+    assert datastore.get_values(1, common.HOLDING_REGISTERS, 8, 4) == [0, 0, 100, 101]
+    assert datastore.get_values(1, common.HOLDING_REGISTERS, 28, 3) == [118, 119, 0]
+    assert bytes(datastore.read(2, common.COILS, 13, 5)) == b'\x00\x01\x00\x01\x00'
+    assert datastore.get_values(1, common.INPUT_REGISTERS, 10, 2) == [0, 0]
+
+
+def test_odd_register_data_is_rejected(datastore):
+    with pytest.raises(common.XModbusExceptionError) as e:
+        datastore.write(1, common.HOLDING_REGISTERS, 0, b'\x00\x01\x02')
+    assert e.value.code == common.ILLEGAL_DATA_VALUE
+    assert datastore.get_values(1, common.HOLDING_REGISTERS, 0, 2) == [0, 0]
+
+
+def test_out_of_range_is_rejected(datastore):
+    with pytest.raises(common.XModbusExceptionError) as e:
+        datastore.read(1, common.HOLDING_REGISTERS, 0xFFFF, 2)
+    assert e.value.code == common.ILLEGAL_DATA_ADDRESS
+
+
+def test_mmap_close_with_views_in_use(tmp_path):
+    path = str(tmp_path / 'units.dat')
+    store = MmapDatastore([1], path)
+    store.set_values(1, common.HOLDING_REGISTERS, 0, [7, 8])
+    view = store.read(1, common.HOLDING_REGISTERS, 0, 2)
+    store.close()
+    assert bytes(view) == b'\x00\x07\x00\x08'
+    view.release()
+
+    store = MmapDatastore([1], path)
+    assert store.get_values(1, common.HOLDING_REGISTERS, 0, 2) == [7, 8]
+    store.close()
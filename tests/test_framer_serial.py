@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import binascii
+import struct
+import pytest
+import xmodbus.common as common
+import xmodbus.pdu as pdu
+import xmodbus.utilities as utilities
+from xmodbus.framer.framer_ascii import AsciiFramer
+from xmodbus.framer.framer_rtu import RTUFramer
+from conftest import rtu
+
+
+def ascii_frame(frame):
+    lrc = struct.pack('B', utilities.computeLRC(frame))
+    return b':' + binascii.hexlify(frame + lrc).upper() + b'\r\n'
+
+
+def feed(framer, request_adu, data, chunk):
+    """按chunk字节分块把应答交给帧产生器，返回读取的块数"""
+    framer.reset()
+    reads = 0
+    while True:
+        need = framer.response_need_bytes_count(request_adu)
+        if need <= 0:
+            return reads
+        n = min(need, chunk, len(data))
+        buffer = framer.receive_buffer(n)
+        buffer[:n] = data[:n]
+        framer.received(n)
+        data = data[n:]
+        reads += 1
+
+
+def test_rtu_request_encoding():
+    request_adu = RTUFramer(None, None).build_request_adu(pdu.ReadHoldingRegistersRequest(0, 1), 1)
+    assert request_adu.encode() == b'\x01\x03\x00\x00\x00\x01\x84\x0a'
+
+
+@pytest.mark.parametrize('chunk', [1, 3, 256])
+def test_rtu_response_round_trip(chunk):
+    framer = RTUFramer(None, None)
+    request_adu = framer.build_request_adu(pdu.ReadHoldingRegistersRequest(0, 2), 1)
+    feed(framer, request_adu, rtu(b'\x01\x03\x04\x00\x0a\xff\xff'), chunk)
+    assert framer.is_response_ready(request_adu)
+    assert list(framer.get_response_adu(request_adu).pdu.values) == [10, 0xFFFF]
+
+    # 异常应答按异常应答的长度接收
+    feed(framer, request_adu, rtu(b'\x01\x83\x02'), chunk)
+    assert framer.get_response_adu(request_adu).pdu.error_code == common.ILLEGAL_DATA_ADDRESS
+
+
+def test_rtu_rejects_bad_crc():
+    framer = RTUFramer(None, None)
+    request_adu = framer.build_request_adu(pdu.ReadHoldingRegistersRequest(0, 1), 1)
+    frame = bytearray(rtu(b'\x01\x03\x02\x00\x0a'))
+    frame[-1] ^= 0xFF
+    feed(framer, request_adu, bytes(frame), 256)
+    with pytest.raises(common.XModbusChecksumError):
+        framer.get_response_adu(request_adu)
+
+
+def test_ascii_request_encoding():
+    request_adu = AsciiFramer(None, None).build_request_adu(pdu.ReadHoldingRegistersRequest(0, 1), 1)
+    assert request_adu.encode() == b':010300000001FB\r\n'
+
+
+@pytest.mark.parametrize('chunk', [1, 2, 5, 256])
+def test_ascii_response_round_trip(chunk):
+    framer = AsciiFramer(None, None)
+    request_adu = framer.build_request_adu(pdu.ReadCoilsRequest(0, 10), 1)
+    # ':'之前的字符被丢弃
+    feed(framer, request_adu, b'\x00' + ascii_frame(b'\x01\x01\x02\x05\x03'), chunk)
+    assert framer.is_response_ready(request_adu)
+    assert framer.get_response_adu(request_adu).pdu.as_bools() == [True, False, True] + [False] * 5 + [True, True]
+
+
+def test_ascii_rejects_bad_lrc():
+    framer = AsciiFramer(None, None)
+    request_adu = framer.build_request_adu(pdu.ReadHoldingRegistersRequest(0, 1), 1)
+    frame = b':01030200' + b'0A' + b'00\r\n'
+    feed(framer, request_adu, frame, 256)
+    with pytest.raises(common.XModbusChecksumError):
+        framer.get_response_adu(request_adu)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import asyncio
+import struct
+import time
+import pytest
+import xmodbus.common as common
+import xmodbus.pdu as pdu
+from xmodbus.channel.ch_tcp import TCPChannel
+from xmodbus.client.client_aio import AioModbusClient
+from xmodbus.client.client_sync import SyncModbusClient
+from xmodbus.framer.framer_socket import MBAPDecoder, SocketFramer
+from conftest import recv_exactly
+
+
+def mbap(tid, unit_id, pdu_data):
+    return struct.pack('>HHHB', tid, 0, len(pdu_data) + 1, unit_id) + pdu_data
+
+
+def test_decoder_partial_frames():
+    decoder = MBAPDecoder()
+    frame = mbap(7, 1, b'\x03\x04\x00\x01\x00\x02')
+    for b in frame[:-1]:
+        decoder.feed(bytes([b]))
+        assert decoder.frames() == []
+    decoder.feed(frame[-1:])
+    frames = decoder.frames()
+    assert len(frames) == 1
+    assert frames[0].transaction_identifier == 7
+    assert frames[0].unit_id == 1
+    assert bytes(frames[0].adu) == frame
+    assert len(decoder) == 0
+
+
+def test_decoder_concatenated_frames():
+    decoder = MBAPDecoder()
+    first = mbap(1, 1, b'\x03\x02\x00\x05')
+    second = mbap(2, 2, b'\x83\x02')
+    third = mbap(3, 3, b'\x06\x00\x01\x00\x02')
+    decoder.feed(first + second + third[:4])
+    frames = decoder.frames()
+    assert [f.transaction_identifier for f in frames] == [1, 2]
+    assert [bytes(f.adu) for f in frames] == [first, second]
+    decoder.feed(third[4:])
+    frames = decoder.frames()
+    assert [bytes(f.adu) for f in frames] == [third]
+
+
+@pytest.mark.parametrize('header', [
+    struct.pack('>HHHB', 1, 1, 2, 1),  # 协议标识符错误
+    struct.pack('>HHHB', 1, 0, 1, 1),  # 长度过短
+    struct.pack('>HHHB', 1, 0, 255, 1),  # 长度过长
+])
+def test_decoder_rejects_bad_header(header):
+    decoder = MBAPDecoder()
+    decoder.feed(header + b'\x03')
+    with pytest.raises(common.XModbusError):
+        decoder.frames()
+
+
+def delayed_first_reply(conn):
+    """第一个请求0.6秒后才应答，其余立即应答"""
+    first = True
+    while True:
+        head = recv_exactly(conn, 7)
+        tid, _, length, unit_id = struct.unpack('>HHHB', head)
+        request = recv_exactly(conn, length - 1)
+        address, = struct.unpack('>H', request[1:3])
+        if first:
+            time.sleep(0.6)
+            first = False
+        conn.sendall(mbap(tid, unit_id, b'\x03\x02' + struct.pack('>H', address)))
+
+
+def test_sync_client_drops_late_response(raw_slave):
+    slave = raw_slave(delayed_first_reply)
+    c = SyncModbusClient(TCPChannel('127.0.0.1', slave.port), framer_cls=SocketFramer, timeout=0.4)
+    with pytest.raises(common.XModbusTimeoutError):
+        c.read_holding_registers(0, 1, 1)
+    for address in (1, 2, 3):
+        response = c.read_holding_registers(address, 1, 1)
+        assert list(response.pdu.values) == [address]
+    c.channel.close()
+
+
+def test_aio_client_drops_late_response(raw_slave):
+    slave = raw_slave(delayed_first_reply)
+
+    async def run():
+        c = AioModbusClient(TCPChannel('127.0.0.1', slave.port), framer_cls=SocketFramer, auto_open=False,
+                            timeout=0.4)
+        await c.open()
+        with pytest.raises(common.XModbusTimeoutError):
+            await c.execute(pdu.ReadHoldingRegistersRequest(0, 1), 1)
+        for address in (1, 2, 3):
+            response = await c.execute(pdu.ReadHoldingRegistersRequest(address, 1), 1)
+            assert list(response.pdu.values) == [address]
+        c.close()
+
+    asyncio.run(run())
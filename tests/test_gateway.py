@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import asyncio
+import struct
+import time
+import xmodbus.pdu as pdu
+from xmodbus.channel.ch_tcp import TCPChannel
+from xmodbus.client.client_aio import AioModbusClient
+from xmodbus.framer.framer_socket import SocketFramer
+from xmodbus.gateway import AioModbusGateway, GATEWAY_TARGET_FAILED
+from conftest import delayed_first_rtu_reply, recv_exactly, rtu
+
+
+def test_gateway_discards_late_bus_reply(raw_slave):
+    bus = raw_slave(delayed_first_rtu_reply)
+
+    async def run():
+        gateway = await AioModbusGateway(TCPChannel('127.0.0.1', bus.port), host='127.0.0.1', port=0,
+                                         timeout=0.4).start()
+        port = gateway._server.sockets[0].getsockname()[1]
+        c = AioModbusClient(TCPChannel('127.0.0.1', port), SocketFramer, timeout=2)
+        response = await c.execute(pdu.ReadHoldingRegistersRequest(0, 1), 1)
+        assert response.pdu.error_code == GATEWAY_TARGET_FAILED
+        # 等待迟到的应答到达总线通道
+        await asyncio.sleep(0.4)
+        for address in (1, 2):
+            response = await c.execute(pdu.ReadHoldingRegistersRequest(address, 1), 1)
+            assert list(response.pdu.values) == [address]
+        assert gateway.stats.timeouts == 1
+        c.close()
+        gateway.close()
+
+    asyncio.run(run())
+
+
+class SlowBus:
+    """经TCP透传的RTU从站，每个请求0.1秒后应答，记录总线上的请求(功能码, 地址)"""
+    def __init__(self):
+        self.registers = [0] * 16
+        self.requests = list()
+
+    def __call__(self, conn):
+        while True:
+            request = recv_exactly(conn, 8)
+            fx, address, value = struct.unpack('>BHH', request[1:6])
+            self.requests.append((fx, address))
+            time.sleep(0.1)
+            if fx == 0x06:
+                self.registers[address] = value
+                conn.sendall(request)
+            else:
+                values = self.registers[address:address + value]
+                conn.sendall(rtu(request[:2] + struct.pack('>B%dH' % len(values), len(values) * 2, *values)))
+
+
+async def start_gateway(bus):
+    gateway = await AioModbusGateway(TCPChannel('127.0.0.1', bus.port), host='127.0.0.1', port=0, timeout=2).start()
+    port = gateway._server.sockets[0].getsockname()[1]
+
+    def master():
+        return AioModbusClient(TCPChannel('127.0.0.1', port), SocketFramer, timeout=5, max_in_flight=8)
+    return gateway, master
+
+
+def test_gateway_merges_queued_reads(raw_slave):
+    handler = SlowBus()
+    bus = raw_slave(handler)
+
+    async def run():
+        gateway, master = await start_gateway(bus)
+        a, b = master(), master()
+        busy = asyncio.ensure_future(a.read_holding_registers(5, 1, 1))
+        await asyncio.sleep(0.03)
+        queued = asyncio.ensure_future(a.read_holding_registers(0, 2, 1))
+        await asyncio.sleep(0.03)
+        # 排队中的相同读请求合并，正在执行的不合并
+        results = await asyncio.gather(b.read_holding_registers(0, 2, 1), b.read_holding_registers(5, 1, 1),
+                                       busy, queued)
+        assert all(result.is_success() for result in results)
+        assert gateway.stats.merged == 1
+        assert handler.requests == [(3, 5), (3, 0), (3, 5)]
+        a.close()
+        b.close()
+        gateway.close()
+
+    asyncio.run(run())
+
+
+def test_gateway_read_after_own_write_is_not_merged(raw_slave):
+    handler = SlowBus()
+    bus = raw_slave(handler)
+
+    async def run():
+        gateway, master = await start_gateway(bus)
+        a, b = master(), master()
+        busy = asyncio.ensure_future(a.read_holding_registers(5, 1, 1))
+        await asyncio.sleep(0.03)
+        earlier = asyncio.ensure_future(a.read_holding_registers(0, 1, 1))
+        await asyncio.sleep(0.03)
+        write = asyncio.ensure_future(b.write_single_register(0, 42, 1))
+        read = asyncio.ensure_future(b.read_holding_registers(0, 1, 1))
+        await asyncio.gather(busy, earlier, write)
+        assert list((await read).pdu.values) == [42]
+        assert gateway.stats.merged == 0
+        a.close()
+        b.close()
+        gateway.close()
+
+    asyncio.run(run())
+
+
+def test_gateway_round_robin_between_connections(raw_slave):
+    handler = SlowBus()
+    bus = raw_slave(handler)
+
+    async def run():
+        gateway, master = await start_gateway(bus)
+        a, b = master(), master()
+        busy = [asyncio.ensure_future(a.read_holding_registers(address, 1, 1)) for address in range(1, 6)]
+        await asyncio.sleep(0.03)
+        other = await b.read_holding_registers(10, 1, 1)
+        assert other.is_success()
+        # 另一个连接的请求不必等待第一个连接的所有请求
+        assert handler.requests.index((3, 10)) <= 2
+        await asyncio.gather(*busy)
+        assert [address for _, address in handler.requests if address != 10] == [1, 2, 3, 4, 5]
+        a.close()
+        b.close()
+        gateway.close()
+
+    asyncio.run(run())
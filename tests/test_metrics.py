@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import pytest
+import xmodbus.common as common
+import xmodbus.metrics as metrics
+from benchmarks.slave import FRAMER_SOCKET
+from xmodbus.channel.ch_tcp import TCPChannel
+from xmodbus.client.client_sync import SyncModbusClient
+from xmodbus.framer.framer_socket import SocketFramer
+from xmodbus.metrics import Histogram, Metrics
+from xmodbus.policy import RetryPolicy
+
+
+def test_histogram_buckets():
+    # 小于32us的值各占一个桶
+    assert [Histogram._index(value) for value in range(32)] == list(range(32))
+    previous = Histogram._index(31)
+    for value in range(32, 1 << 20):
+        index = Histogram._index(value)
+        # 桶连续且单调，桶内最大值与记录值的相对误差不超过1/32
+        assert index in (previous, previous + 1)
+        assert value <= Histogram._highest(index) <= value + value / 32
+        previous = index
+    assert Histogram._highest(Histogram._index(64)) == Histogram._highest(Histogram._index(65)) == 65
+    assert Histogram._index(66) == Histogram._index(65) + 1
+
+
+def test_histogram_percentiles():
+    h = Histogram()
+    assert h.percentile(0.5) is None
+    for us in range(1, 1001):
+        h.record((us + 0.5) / 1e6)
+    assert h.count == 1000
+    assert (h.min, h.max) == (1, 1000)
+    assert h.percentile(0.5) == pytest.approx(500, rel=1 / 32)
+    assert h.percentile(0.99) == pytest.approx(990, rel=1 / 32)
+    assert h.percentile(1) == 1000
+    assert h.percentile(0) == 1
+    h.record(-1)
+    assert h.min == 0
+
+    other = Histogram()
+    other.record(5)
+    h.merge(other)
+    assert h.count == 1002
+    assert h.max == 5000000
+    assert h.as_dict()['p50'] == h.percentile(0.5)
+
+
+def test_client_records_per_unit_and_function(start_slave):
+    slave = start_slave(FRAMER_SOCKET, unit_ids=[1, 2])
+    m = Metrics()
+    traces = list()
+    m.add_hook(lambda trace, response, error: traces.append((trace.unit_id, trace.fx, error is None)))
+    c = SyncModbusClient(TCPChannel('127.0.0.1', slave.port), SocketFramer, timeout=0.2, metrics=m,
+                         retry=RetryPolicy(retries=1, backoff=0.01))
+    c.read_holding_registers(0, 2, 1)
+    c.read_holding_registers(0, 200, 1)
+    c.write_single_register(0, 7, 2)
+    # 不存在的从站不应答，超时后重试一次
+    with pytest.raises(common.XModbusTimeoutError):
+        c.read_holding_registers(0, 1, 3)
+    c.close()
+
+    read = m.get(1, 3)
+    assert (read.requests, read.responses, read.exceptions) == (2, 1, 1)
+    # MBAP头7字节 + PDU 5字节; 成功应答 7 + 2 + 4, 异常应答 7 + 2
+    assert read.bytes_out == 24
+    assert read.bytes_in == 13 + 9
+    assert read.first_byte.count == 2
+    assert read.latency.count == 2
+
+    write = m.get(2, 6)
+    assert (write.requests, write.responses, write.bytes_out, write.bytes_in) == (1, 1, 12, 12)
+
+    lost = m.get(3, 3)
+    assert (lost.requests, lost.timeouts, lost.retries, lost.responses) == (1, 1, 1, 0)
+    assert lost.bytes_out == 24
+    assert lost.first_byte.count == 0
+
+    assert m.get(1, 6) is None
+    assert m.total().requests == 4
+    assert sorted(m.as_dict()) == ['1/3', '2/6', '3/3']
+    assert traces == [(1, 3, True), (1, 3, True), (2, 6, True), (3, 3, False)]
+
+
+def test_nothing_recorded_without_metrics(start_slave, monkeypatch):
+    calls = list()
+    clock = metrics.clock
+    monkeypatch.setattr(metrics, 'clock', lambda: calls.append(1) or clock())
+    slave = start_slave(FRAMER_SOCKET)
+    c = SyncModbusClient(TCPChannel('127.0.0.1', slave.port), SocketFramer, timeout=2)
+    c.read_holding_registers(0, 2, 1)
+    c.write_single_register(0, 7, 1)
+    c.close()
+    # 未启用统计时客户端不计时
+    assert calls == []
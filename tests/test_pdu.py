@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import struct
+import pytest
+import xmodbus.pdu as pdu
+import xmodbus.utilities as utilities
+
+
+def test_registers_as_numpy():
+    numpy = pytest.importorskip('numpy')
+    values = [0, 1, 0x1234, 0x8000, 0xffff]
+    data = struct.pack('>B5H', 10, *values)
+    response = pdu.ReadHoldingRegistersResponse(pdu.ReadHoldingRegistersRequest(0, 5), 3, data)
+    registers = response.as_numpy()
+    assert registers.dtype == numpy.uint16
+    assert registers.tolist() == list(response.as_array()) == values
+    # numpy数组是values的视图，不复制数据
+    response.values[0] = 7
+    assert registers[0] == 7
+
+
+@pytest.mark.parametrize('response_cls, request_cls', [(pdu.ReadCoilsResponse, pdu.ReadCoilsRequest),
+                                                       (pdu.ReadDiscreteInputsResponse, pdu.ReadDiscreteInputsRequest)])
+def test_bits_as_numpy(response_cls, request_cls):
+    numpy = pytest.importorskip('numpy')
+    bools = [True, False, True, True, False, False, False, False, False, True]
+    packed = utilities.pack_bits(bools)
+    response = response_cls(request_cls(0, len(bools)), request_cls.fx, bytes([len(packed)]) + packed)
+    bits = response.as_numpy()
+    assert bits.dtype == numpy.bool_
+    assert bits.tolist() == response.as_bools() == bools
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import asyncio
+import pytest
+import xmodbus.common as common
+from benchmarks.slave import FRAMER_RTU, FRAMER_SOCKET
+from xmodbus.channel.ch_tcp import TCPChannel
+from xmodbus.client.client_aio import AioModbusClient
+from xmodbus.client.client_sync import SyncModbusClient
+from xmodbus.framer.framer_rtu import RTUFramer
+from xmodbus.framer.framer_socket import SocketFramer
+from xmodbus.planner import ReadBlock, ReadPlanner
+
+
+def blocks(needs, request_cost=None):
+    return ReadPlanner(request_cost).plan(needs).blocks
+
+
+def test_gap_fill_by_request_cost():
+    needs = [(1, common.HOLDING_REGISTERS, 0, 2), (1, common.HOLDING_REGISTERS, 22, 2)]
+    # 20个寄存器的空洞多读40字节，不超过默认代价时合并
+    assert blocks(needs) == [ReadBlock(1, common.HOLDING_REGISTERS, 0, 24)]
+    assert blocks(needs, request_cost=39) == [ReadBlock(1, common.HOLDING_REGISTERS, 0, 2),
+                                              ReadBlock(1, common.HOLDING_REGISTERS, 22, 2)]
+    # 位数据的空洞按位计算
+    bits = [(1, common.COILS, 0, 1), (1, common.COILS, 320, 1)]
+    assert blocks(bits) == [ReadBlock(1, common.COILS, 0, 321)]
+    assert len(blocks(bits, request_cost=39)) == 2
+
+
+def test_units_and_tables_are_not_merged():
+    needs = [(1, common.HOLDING_REGISTERS, 0, 1), (2, common.HOLDING_REGISTERS, 1, 1),
+             (1, common.INPUT_REGISTERS, 1, 1)]
+    assert len(blocks(needs)) == 3
+
+
+@pytest.mark.parametrize('table, limit', [(common.HOLDING_REGISTERS, common.MAX_READ_REGISTERS),
+                                          (common.COILS, common.MAX_READ_BITS)])
+def test_blocks_respect_request_limit(table, limit):
+    result = blocks([(1, table, 0, limit * 2 + 10)])
+    assert [b.quantity for b in result] == [limit, limit, 10]
+    assert [b.address for b in result] == [0, limit, limit * 2]
+
+    # 能在需求之间断开时不把需求拆到两个请求中
+    result = blocks([(1, table, 0, limit - 5), (1, table, limit - 4, 10)])
+    assert [(b.address, b.quantity) for b in result] == [(0, limit - 5), (limit - 4, 10)]
+
+
+def test_invalid_needs():
+    with pytest.raises(ValueError):
+        ReadPlanner().plan([(1, 'unknown', 0, 1)])
+    with pytest.raises(ValueError):
+        ReadPlanner().plan([(1, common.COILS, 0, 0)])
+
+
+def test_execute_slices_values(start_slave):
+    slave = start_slave(FRAMER_SOCKET)
+    slave.datastore.set_values(1, common.HOLDING_REGISTERS, 0, list(range(300)))
+    slave.datastore.set_values(1, common.COILS, 0, [True, False, True])
+    plan = ReadPlanner().plan([(1, common.HOLDING_REGISTERS, 10, 3), (1, common.HOLDING_REGISTERS, 120, 10),
+                               (1, common.HOLDING_REGISTERS, 280, 5), (1, common.COILS, 1, 2)])
+    c = SyncModbusClient(TCPChannel('127.0.0.1', slave.port), SocketFramer, timeout=2)
+    values = plan.execute(c)
+    assert values[plan.needs[0]] == [10, 11, 12]
+    assert values[plan.needs[1]] == list(range(120, 130))
+    assert values[plan.needs[2]] == list(range(280, 285))
+    assert values[plan.needs[3]] == [False, True]
+    c.close()
+
+
+class CountingClient(AioModbusClient):
+    """记录同时在执行的请求数"""
+    active = peak = 0
+
+    async def process_adu_request(self, request_adu, *args, **kwargs):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            return await super().process_adu_request(request_adu, *args, **kwargs)
+        finally:
+            self.active -= 1
+
+
+@pytest.mark.parametrize('framer, framer_cls, max_in_flight, peak', [(FRAMER_RTU, RTUFramer, None, 1),
+                                                                     (FRAMER_SOCKET, SocketFramer, 8, 4)])
+def test_aio_execute(start_slave, framer, framer_cls, max_in_flight, peak):
+    slave = start_slave(framer)
+    slave.datastore.set_values(1, common.INPUT_REGISTERS, 0, list(range(500)))
+    needs = [(1, common.INPUT_REGISTERS, address, 4) for address in (0, 100, 200, 300)]
+    plan = ReadPlanner(request_cost=0).plan(needs)
+
+    async def run():
+        c = CountingClient(TCPChannel('127.0.0.1', slave.port), framer_cls, timeout=2, max_in_flight=max_in_flight)
+        values = await plan.aio_execute(c)
+        assert [values[need] for need in plan.needs] == [list(range(a, a + 4)) for a in (0, 100, 200, 300)]
+        assert c.peak == peak
+        c.close()
+
+    asyncio.run(run())
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import asyncio
+import time
+import pytest
+import xmodbus.common as common
+import xmodbus.pdu as pdu
+from benchmarks.slave import FRAMER_RTU, FRAMER_SOCKET
+from xmodbus.channel.ch_tcp import TCPChannel
+from xmodbus.client.client_aio import AioModbusClient
+from xmodbus.client.client_sync import SyncModbusClient
+from xmodbus.framer.framer_rtu import RTUFramer
+from xmodbus.framer.framer_socket import SocketFramer
+from xmodbus.policy import STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, CircuitBreaker, RetryPolicy
+from conftest import delayed_first_rtu_reply, recv_exactly, rtu
+
+
+def test_retry_policy_delay():
+    policy = RetryPolicy(retries=2, backoff=0.1, multiplier=2, max_backoff=0.15)
+    timeout = common.XModbusTimeoutError('timeout')
+    assert policy.delay(0, timeout) == 0.1
+    assert policy.delay(1, timeout) == 0.15
+    assert policy.delay(2, timeout) is None
+    assert policy.delay(0, common.XModbusError('other')) is None
+    assert policy.delay(0, common.XModbusQueueTimeoutError('queued')) is None
+
+
+def test_sync_client_discards_late_rtu_reply(raw_slave):
+    slave = raw_slave(delayed_first_rtu_reply)
+    c = SyncModbusClient(TCPChannel('127.0.0.1', slave.port), framer_cls=RTUFramer, timeout=0.4)
+    with pytest.raises(common.XModbusTimeoutError):
+        c.read_holding_registers(0, 1, 1)
+    # 等待迟到的应答到达
+    time.sleep(0.4)
+    assert list(c.read_holding_registers(1, 1, 1).pdu.values) == [1]
+    assert list(c.read_holding_registers(2, 1, 1).pdu.values) == [2]
+    c.channel.close()
+
+
+def test_aio_client_discards_late_rtu_reply(raw_slave):
+    slave = raw_slave(delayed_first_rtu_reply)
+
+    async def run():
+        c = AioModbusClient(TCPChannel('127.0.0.1', slave.port), framer_cls=RTUFramer, auto_open=False,
+                            timeout=0.4)
+        await c.open()
+        with pytest.raises(common.XModbusTimeoutError):
+            await c.execute(pdu.ReadHoldingRegistersRequest(0, 1), 1)
+        await asyncio.sleep(0.4)
+        for address in (1, 2):
+            response = await c.execute(pdu.ReadHoldingRegistersRequest(address, 1), 1)
+            assert list(response.pdu.values) == [address]
+        c.close()
+
+    asyncio.run(run())
+
+
+def send_then_echo(conn):
+    """连接建立后先发出一段数据，之后原样回送收到的数据"""
+    conn.sendall(b'late reply')
+    while True:
+        data = conn.recv(4096)
+        if not data:
+            return
+        conn.sendall(data)
+
+
+def test_aio_discard_input_keeps_later_data(raw_slave):
+    slave = raw_slave(send_then_echo)
+
+    async def run():
+        ch = TCPChannel('127.0.0.1', slave.port)
+        await ch.aio_open(None)
+        await asyncio.sleep(0.1)
+        await ch.aio_discard_input()
+        # 没有已到达的数据时不阻塞，之后到达的数据仍可正常读取
+        await asyncio.wait_for(ch.aio_discard_input(), 1)
+        await ch.aio_write(b'next')
+        assert await asyncio.wait_for(ch.aio_read(4), 1) == b'next'
+        ch.close()
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize('framer, framer_cls, sync_discards, aio_discards',
+                         [(FRAMER_SOCKET, SocketFramer, 0, 0), (FRAMER_RTU, RTUFramer, 4, 2)])
+def test_only_framers_without_tid_discard_input(start_slave, framer, framer_cls, sync_discards, aio_discards):
+    slave = start_slave(framer)
+    calls = list()
+    c = SyncModbusClient(TCPChannel('127.0.0.1', slave.port), framer_cls=framer_cls, timeout=2)
+    discard = c.channel.sync_discard_input
+    c.channel.sync_discard_input = lambda: calls.append('sync') or discard()
+    c.read_holding_registers(0, 1, 1)
+    c.execute_many([(pdu.ReadHoldingRegistersRequest(0, 1), 1)] * 3, max_in_flight=2)
+    c.channel.close()
+    # 有事务标识符的帧格式按事务标识符丢弃迟到的应答，RTU每个请求前清空一次
+    assert len(calls) == sync_discards
+
+    async def run():
+        a = AioModbusClient(TCPChannel('127.0.0.1', slave.port), framer_cls=framer_cls, timeout=2)
+        await a.read_holding_registers(0, 1, 1)
+        discard = a.channel.aio_discard_input
+
+        async def counted():
+            calls.append('aio')
+            await discard()
+
+        a.channel.aio_discard_input = counted
+        await a.read_holding_registers(0, 1, 1)
+        await a.read_holding_registers(0, 1, 1)
+        a.close()
+
+    asyncio.run(run())
+    assert calls.count('aio') == aio_discards
+
+
+def test_breaker_state_transitions():
+    breaker = CircuitBreaker(threshold=2, cooldown=0.1)
+    key = (None, 1)
+    timeout = common.XModbusTimeoutError('timeout')
+    assert not breaker.before_request(key)
+    assert breaker.record_failure(key, timeout)
+    assert breaker.state(key) == STATE_CLOSED
+    breaker.record_failure(key, timeout)
+    assert breaker.state(key) == STATE_OPEN
+    assert breaker.is_open(key)
+    with pytest.raises(common.XModbusUnavailableError):
+        breaker.before_request(key)
+
+    # 冷却结束后只允许一个探测
+    time.sleep(0.12)
+    assert breaker.before_request(key)
+    assert breaker.state(key) == STATE_HALF_OPEN
+    with pytest.raises(common.XModbusUnavailableError):
+        breaker.before_request(key)
+    # 探测失败重新冷却
+    breaker.record_failure(key, timeout)
+    assert breaker.is_open(key)
+
+    time.sleep(0.12)
+    assert breaker.before_request(key)
+    breaker.record_success(key)
+    assert breaker.state(key) == STATE_CLOSED
+    assert not breaker.before_request(key)
+
+
+@pytest.mark.parametrize('reply_error', [common.XModbusExceptionError(common.ILLEGAL_DATA_ADDRESS),
+                                         common.XModbusResponseError('从站地址不匹配')])
+def test_breaker_resets_on_reply(reply_error):
+    breaker = CircuitBreaker(threshold=2)
+    key = (None, 1)
+    timeout = common.XModbusTimeoutError('timeout')
+    breaker.record_failure(key, timeout)
+    assert not breaker.record_failure(key, reply_error)
+    breaker.record_failure(key, timeout)
+    assert breaker.state(key) == STATE_CLOSED
+    breaker.record_failure(key, timeout)
+    assert breaker.state(key) == STATE_OPEN
+
+
+def test_breaker_ignores_requests_not_sent():
+    breaker = CircuitBreaker(threshold=1)
+    key = (None, 1)
+    assert not breaker.record_failure(key, common.XModbusQueueTimeoutError('queued'))
+    assert not breaker.record_failure(key, common.XModbusError('other'))
+    assert breaker.state(key) == STATE_CLOSED
+
+
+def test_mismatched_reply_is_response_error(raw_slave):
+    def other_unit(conn):
+        while True:
+            request = recv_exactly(conn, 8)
+            conn.sendall(rtu(b'\x09' + request[1:2] + b'\x02\x00\x01'))
+
+    slave = raw_slave(other_unit)
+    breaker = CircuitBreaker(threshold=2)
+    c = SyncModbusClient(TCPChannel('127.0.0.1', slave.port), framer_cls=RTUFramer, timeout=0.4, breaker=breaker)
+    for _ in range(3):
+        with pytest.raises(common.XModbusResponseError):
+            c.read_holding_registers(0, 1, 1)
+    assert breaker.state((c.channel, 1)) == STATE_CLOSED
+    c.channel.close()
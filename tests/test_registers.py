@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import struct
+import pytest
+import xmodbus.registers as registers
+from xmodbus.registers import BinAccessProtocol, BitAccessProtocol
+
+
+# 字节序 -> 0x11223344和0x1122334455667788的寄存器排列
+LAYOUTS = {
+    registers.ORDER_ABCD: ([0x1122, 0x3344], [0x1122, 0x3344, 0x5566, 0x7788]),
+    registers.ORDER_CDAB: ([0x3344, 0x1122], [0x7788, 0x5566, 0x3344, 0x1122]),
+    registers.ORDER_BADC: ([0x2211, 0x4433], [0x2211, 0x4433, 0x6655, 0x8877]),
+    registers.ORDER_DCBA: ([0x4433, 0x2211], [0x8877, 0x6655, 0x4433, 0x2211]),
+}
+
+
+def words(data, order):
+    """将大端字节序列按字节序排列为寄存器"""
+    values = list(struct.unpack('>%dH' % (len(data) // 2), data))
+    if order in (registers.ORDER_CDAB, registers.ORDER_DCBA):
+        values.reverse()
+    if order in (registers.ORDER_BADC, registers.ORDER_DCBA):
+        values = [((v & 0xff) << 8) | (v >> 8) for v in values]
+    return values
+
+
+@pytest.mark.parametrize('order', sorted(LAYOUTS))
+def test_integer_byte_orders(order):
+    regs32, regs64 = LAYOUTS[order]
+    protocol = BinAccessProtocol()
+    protocol.define('u32', 0, registers.UINT32, order)
+    protocol.define('u64', 2, registers.UINT64, order)
+    assert protocol.decode(0, regs32 + regs64) == {'u32': 0x11223344, 'u64': 0x1122334455667788}
+
+
+@pytest.mark.parametrize('order', sorted(LAYOUTS))
+def test_typed_values(order):
+    protocol = BinAccessProtocol()
+    protocol.define('i32', 10, registers.INT32, order)
+    protocol.define('f32', 12, registers.FLOAT32, order)
+    protocol.define('f64', 14, registers.FLOAT64, order)
+    protocol.define('i64', 18, registers.INT64, order)
+    regs = (words(struct.pack('>i', -123456), order) + words(struct.pack('>f', 1.5), order)
+            + words(struct.pack('>d', -2.25), order) + words(struct.pack('>q', -(1 << 40)), order))
+    assert protocol.decode(10, regs) == {'i32': -123456, 'f32': 1.5, 'f64': -2.25, 'i64': -(1 << 40)}
+
+
+def test_mixed_orders_gaps_and_overlaps():
+    protocol = BinAccessProtocol()
+    protocol.define('a', 0, registers.UINT32, registers.ORDER_ABCD)
+    protocol.define('b', 4, registers.UINT32, registers.ORDER_CDAB)
+    # 与a重叠
+    protocol.define('high', 0, registers.UINT16)
+    protocol.define('i16', 6, registers.INT16)
+    # 超出解码范围的数据点被忽略
+    protocol.define('outside', 7, registers.UINT32)
+    regs = [0x1122, 0x3344, 0, 0, 0x3344, 0x1122, 0xFFFE]
+    assert protocol.decode(0, regs) == {'a': 0x11223344, 'b': 0x11223344, 'high': 0x1122, 'i16': -2}
+    # 相同范围重复解码使用缓存的解码步骤
+    assert protocol.decode(0, regs)['b'] == 0x11223344
+
+
+@pytest.mark.parametrize('order, regs', [(registers.ORDER_ABCD, [0x4142, 0x3100]),
+                                         (registers.ORDER_BADC, [0x4241, 0x0031])])
+def test_string_and_conversions(order, regs):
+    bits = BitAccessProtocol()
+    bits.define(0, 'run', 'stop')
+    bits.define(3, 'fault', 'ok')
+    protocol = BinAccessProtocol()
+    protocol.define('name', 0, registers.STRING, order, length=2)
+    protocol.define('temperature', 2, registers.INT16, scale=0.1, offset=-40)
+    protocol.define('status', 3, registers.BITFIELD, bits=bits)
+    values = protocol.decode(0, regs + [600, 0b1001])
+    assert values['name'] == 'AB1'
+    assert values['temperature'] == pytest.approx(20)
+    assert values['status'] == {0: 'run', 3: 'fault'}
+
+
+def test_invalid_definitions():
+    with pytest.raises(ValueError):
+        registers.DataPoint('x', 0, 'int24')
+    with pytest.raises(ValueError):
+        registers.DataPoint('x', 0, registers.INT32, 'ACBD')
+    with pytest.raises(ValueError):
+        registers.DataPoint('x', 0, registers.STRING)
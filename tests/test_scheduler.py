@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import asyncio
+import pytest
+from xmodbus.scheduler import PollScheduler
+
+
+def run_scheduler(period, durations, on_overrun=None, offset=None):
+    """以给定周期运行一个扫描组，第n次扫描耗时durations[n]秒，返回(扫描组, 各次扫描开始时刻相对启动时刻的偏移)"""
+    async def run():
+        loop = asyncio.get_running_loop()
+        starts = list()
+        done = asyncio.Event()
+
+        async def job(client):
+            starts.append(loop.time() - begin)
+            await asyncio.sleep(durations[len(starts) - 1])
+            if len(starts) == len(durations):
+                done.set()
+            return len(starts)
+
+        scheduler = PollScheduler(None, on_overrun)
+        group = scheduler.add_group('g', period, job, offset=offset)
+        begin = loop.time()
+        scheduler.start()
+        await asyncio.wait_for(done.wait(), 5)
+        scheduler.stop()
+        await asyncio.sleep(0)
+        return group, starts
+
+    return asyncio.run(run())
+
+
+def test_period_does_not_drift():
+    group, starts = run_scheduler(0.05, [0.02] * 10)
+    # 每次扫描按固定时间线开始，扫描耗时不会累积到之后的周期
+    for n, started in enumerate(starts):
+        assert started == pytest.approx(n * 0.05, abs=0.015)
+    assert group.overruns == 0
+    assert group.skipped_cycles == 0
+    assert group.cycles >= 9
+
+
+def test_overrun_skips_missed_cycles():
+    overruns = list()
+    group, starts = run_scheduler(0.1, [0.01, 0.25, 0.01, 0.01],
+                                  on_overrun=lambda g, skipped: overruns.append((g.name, skipped)))
+    # 第二次扫描耗时2.5个周期，错过的两个周期不补执行，之后仍对齐到原时间线
+    assert overruns == [('g', 2)]
+    assert group.overruns == 1
+    assert group.skipped_cycles == 2
+    assert starts == pytest.approx([0, 0.1, 0.4, 0.5], abs=0.03)
+
+
+def test_lateness_and_duration_accounting():
+    group, starts = run_scheduler(0.1, [0.01, 0.06, 0.01], offset=0.05)
+    assert starts[0] == pytest.approx(0.05, abs=0.02)
+    assert 0 <= group.last_lateness < 0.02
+    assert group.max_duration == pytest.approx(0.06, abs=0.02)
+    stats = group.as_dict()
+    assert stats['cycles'] == group.cycles >= 2
+    assert stats['overruns'] == 0
+
+
+def test_failed_scan_is_counted():
+    results = list()
+
+    async def job(client):
+        raise RuntimeError('unreachable')
+
+    async def run():
+        scheduler = PollScheduler(None)
+        scheduler.add_group('ok', 0.02, lambda client: asyncio.sleep(0, 'r'),
+                            on_result=lambda group, result: results.append(result))
+        bad = scheduler.add_group('bad', 0.02, job)
+        scheduler.start()
+        await asyncio.sleep(0.07)
+        scheduler.stop()
+        return bad
+
+    bad = asyncio.run(run())
+    assert bad.errors == bad.cycles >= 3
+    assert results[:3] == ['r', 'r', 'r']
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import asyncio
+import os
+import struct
+import threading
+import time
+import pytest
+import xmodbus.common as common
+import xmodbus.pdu as pdu
+from xmodbus.channel.ch_serial import SerialChannel
+from xmodbus.client.client_aio import AioModbusClient
+from xmodbus.client.client_sync import SyncModbusClient
+from xmodbus.framer.framer_rtu import RTUFramer
+from conftest import rtu
+
+
+class PtySlave:
+    """伪终端另一端的RTU从站，parts(reply)返回分段发送的应答，段之间间隔gap秒"""
+    def __init__(self, parts, gap=0.0):
+        self.master, self.slave = os.openpty()
+        self.port = os.ttyname(self.slave)
+        self.parts = parts
+        self.gap = gap
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                request = b''
+                while len(request) < 8:
+                    request += os.read(self.master, 8 - len(request))
+                address, quantity = struct.unpack('>HH', request[2:6])
+                values = struct.pack('>%dH' % quantity, *range(address, address + quantity))
+                reply = rtu(request[:2] + bytes([len(values)]) + values)
+                for i, part in enumerate(self.parts(reply)):
+                    if i:
+                        time.sleep(self.gap)
+                    os.write(self.master, part)
+        except OSError:
+            pass
+
+    def close(self):
+        os.close(self.master)
+        os.close(self.slave)
+
+
+@pytest.fixture
+def pty_slave():
+    slaves = list()
+
+    def start(parts, gap=0.0):
+        slave = PtySlave(parts, gap)
+        slaves.append(slave)
+        return slave
+
+    yield start
+    for slave in slaves:
+        slave.close()
+
+
+def make_client(slave):
+    return SyncModbusClient(SerialChannel(slave.port, 9600, frame_silence=0.1), RTUFramer, timeout=2)
+
+
+def test_channel_timing():
+    channel = SerialChannel('/dev/null', 9600)
+    assert channel.char_time == pytest.approx(10 / 9600)
+    assert channel.t3_5 == pytest.approx(3.5 * 10 / 9600)
+    assert channel.frame_silence == channel.t3_5
+    assert SerialChannel('/dev/null', 115200, parity='E').t3_5 == 0.00175
+
+
+def test_reply_in_pieces_within_silence(pty_slave):
+    slave = pty_slave(lambda reply: [reply[:3], reply[3:6], reply[6:]], gap=0.02)
+    c = make_client(slave)
+    for address in (0, 10):
+        assert list(c.read_holding_registers(address, 3, 1).pdu.values) == [address, address + 1, address + 2]
+    c.close()
+
+
+def test_silence_ends_truncated_reply(pty_slave):
+    slave = pty_slave(lambda reply: [reply[:4]])
+    c = make_client(slave)
+    begin = time.monotonic()
+    with pytest.raises(common.XModbusError, match='不完整'):
+        c.read_holding_registers(0, 3, 1)
+    assert time.monotonic() - begin < 1
+    c.close()
+
+
+def test_aio_silence_ends_truncated_reply(pty_slave):
+    replies = list()
+
+    def parts(reply):
+        # 只截断第一个应答，其剩余部分0.3秒后才到达
+        replies.append(reply)
+        return [reply[:4], reply[4:]] if len(replies) == 1 else [reply]
+
+    slave = pty_slave(parts, gap=0.3)
+
+    async def run():
+        c = AioModbusClient(SerialChannel(slave.port, 9600, frame_silence=0.1), RTUFramer, timeout=2)
+        begin = time.monotonic()
+        with pytest.raises(common.XModbusError, match='不完整'):
+            await c.execute(pdu.ReadHoldingRegistersRequest(0, 3), 1)
+        assert time.monotonic() - begin < 1
+        # 下一个请求发送前丢弃上一个应答的剩余部分
+        await asyncio.sleep(0.4)
+        response = await c.execute(pdu.ReadHoldingRegistersRequest(5, 1), 1)
+        assert list(response.pdu.values) == [5]
+        c.close()
+
+    asyncio.run(run())
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import asyncio
+import os
+import socket
+import time
+import pytest
+import xmodbus.common as common
+import xmodbus.pdu as pdu
+from benchmarks.slave import FRAMER_ASCII, FRAMER_RTU, FRAMER_SOCKET
+from xmodbus.channel.ch_tcp import TCPChannel
+from xmodbus.client.client_aio import AioModbusClient
+from xmodbus.client.client_sync import SyncModbusClient
+from xmodbus.datastore import MmapDatastore
+from xmodbus.framer.framer_ascii import AsciiFramer
+from xmodbus.framer.framer_rtu import RTUFramer
+from xmodbus.framer.framer_socket import SocketFramer
+from xmodbus.server import MultiProcessModbusServer
+
+
+FRAMERS = [(FRAMER_SOCKET, SocketFramer), (FRAMER_RTU, RTUFramer), (FRAMER_ASCII, AsciiFramer)]
+
+
+@pytest.mark.parametrize('framer, framer_cls', FRAMERS)
+def test_sync_round_trip(start_slave, framer, framer_cls):
+    slave = start_slave(framer, unit_ids=[1, 2])
+    slave.datastore.set_values(2, common.INPUT_REGISTERS, 0, [7, 8, 9])
+    slave.datastore.set_values(2, common.DISCRETE_INPUTS, 0, [False, True, True])
+    c = SyncModbusClient(TCPChannel('127.0.0.1', slave.port), framer_cls, timeout=2)
+
+    assert c.write_single_register(3, 0xBEEF, 1).is_success()
+    assert c.write_multiple_registers(10, list(range(100, 223)), 1).is_success()
+    assert c.write_single_coil(5, True, 1).is_success()
+    assert c.write_multiple_coils(16, [1, 0, 1, 1, 0, 0, 0, 0, 1], 1).is_success()
+
+    assert list(c.read_holding_registers(3, 1, 1).pdu.values) == [0xBEEF]
+    assert list(c.read_holding_registers(10, 123, 1).pdu.values) == list(range(100, 223))
+    assert c.read_coils(0, 8, 1).pdu.as_bools() == [False] * 5 + [True, False, False]
+    assert c.read_coils(16, 9, 1).pdu.as_bools() == [True, False, True, True, False, False, False, False, True]
+    assert list(c.read_input_register(0, 3, 2).pdu.values) == [7, 8, 9]
+    assert c.read_discrete_inputs(0, 3, 2).pdu.as_bools() == [False, True, True]
+    assert slave.datastore.get_values(1, common.HOLDING_REGISTERS, 3, 1) == [0xBEEF]
+
+    # 超出地址范围和数量限制时返回异常应答
+    response = c.read_holding_registers(0xFFFF, 2, 1)
+    assert not response.is_success()
+    assert response.pdu.error_code == common.ILLEGAL_DATA_ADDRESS
+    response = c.execute(pdu.ReadHoldingRegistersRequest(0, 126), 1)
+    assert response.pdu.error_code == common.ILLEGAL_DATA_VALUE
+    c.close()
+
+
+@pytest.mark.parametrize('framer, framer_cls', FRAMERS)
+def test_unknown_unit_gets_no_reply(start_slave, framer, framer_cls):
+    slave = start_slave(framer, unit_ids=[1])
+    c = SyncModbusClient(TCPChannel('127.0.0.1', slave.port), framer_cls, timeout=0.2)
+    with pytest.raises(common.XModbusTimeoutError):
+        c.read_holding_registers(0, 1, 5)
+    assert list(c.read_holding_registers(0, 1, 1).pdu.values) == [0]
+    c.close()
+
+
+@pytest.mark.parametrize('framer, framer_cls', FRAMERS)
+def test_aio_round_trip(start_slave, framer, framer_cls):
+    slave = start_slave(framer)
+    slave.datastore.set_values(1, common.HOLDING_REGISTERS, 0, list(range(64)))
+
+    async def run():
+        c = AioModbusClient(TCPChannel('127.0.0.1', slave.port), framer_cls, timeout=2)
+        responses = await asyncio.gather(*[c.read_holding_registers(i * 8, 8, 1) for i in range(8)])
+        assert [list(r.pdu.values) for r in responses] == [list(range(i * 8, i * 8 + 8)) for i in range(8)]
+        assert (await c.write_multiple_coils(0, [True] * 20, 1)).is_success()
+        assert (await c.read_coils(0, 21, 1)).pdu.as_bools() == [True] * 20 + [False]
+        c.close()
+
+    asyncio.run(run())
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'timeout'
+        time.sleep(0.02)
+
+
+def can_connect(port):
+    try:
+        socket.create_connection(('127.0.0.1', port), 0.2).close()
+    except OSError:
+        return False
+    return True
+
+
+@pytest.mark.skipif(not hasattr(socket, 'SO_REUSEPORT') or not hasattr(os, 'fork'), reason='需要SO_REUSEPORT和fork')
+def test_multiprocess_server_shares_datastore():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    server = MultiProcessModbusServer(MmapDatastore([1]), '127.0.0.1', port, workers=2, stats_interval=0.05)
+    server.start()
+    pids = list(server.pids)
+    clients = list()
+    try:
+        # 各工作进程都开始监听后内核才会把连接分给它们
+        wait_until(lambda: can_connect(port) and all(s['total_connections'] for s in server.worker_stats()))
+        # 连接由内核分配给各工作进程，写入与读回经过不同的连接
+        clients = [SyncModbusClient(TCPChannel('127.0.0.1', port), SocketFramer, timeout=2) for _ in range(8)]
+        for i, c in enumerate(clients):
+            assert c.write_single_register(i, 100 + i, 1).is_success()
+        for i, c in enumerate(clients):
+            other = (i + 1) % len(clients)
+            assert list(c.read_holding_registers(other, 1, 1).pdu.values) == [100 + other]
+        for c in clients:
+            c.channel.close()
+        clients = list()
+
+        wait_until(lambda: server.stats()['requests'] == 16 and server.stats()['connections'] == 0)
+        stats = server.stats()
+        assert stats['total_connections'] >= 10
+        assert stats['exceptions'] == 0
+        # MBAP头7字节 + PDU 5字节
+        assert stats['bytes_in'] == 16 * 12
+        assert len(server.worker_stats()) == 2
+        assert sum(s['requests'] for s in server.worker_stats()) == 16
+    finally:
+        for c in clients:
+            c.channel.close()
+        server.stop()
+
+    assert server.pids == []
+    for pid in pids:
+        with pytest.raises(ProcessLookupError):
+            os.kill(pid, 0)
+    assert not can_connect(port)
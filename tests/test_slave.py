@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import threading
+import pytest
+from benchmarks.slave import FRAMER_RTU, FRAMER_SOCKET, LoopbackSlave
+
+
+@pytest.mark.parametrize('framer', [FRAMER_SOCKET, FRAMER_RTU])
+def test_start_failure_is_raised(framer):
+    threads = threading.active_count()
+    # 不属于本机的地址无法监听
+    slave = LoopbackSlave(framer, host='192.0.2.1')
+    with pytest.raises(OSError):
+        slave.start()
+    assert threading.active_count() == threads
+    slave.stop()
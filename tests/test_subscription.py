@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import asyncio
+import pytest
+import xmodbus.common as common
+from benchmarks.slave import FRAMER_SOCKET
+from xmodbus.channel.ch_tcp import TCPChannel
+from xmodbus.client.client_aio import AioModbusClient
+from xmodbus.framer.framer_socket import SocketFramer
+from xmodbus.subscription import Subscription, SubscriptionManager
+
+
+def registers(values, **kwargs):
+    s = Subscription(1, common.HOLDING_REGISTERS, 100, len(values), None, **kwargs)
+    s.update(values)
+    return s
+
+
+def test_first_update_reports_all_values():
+    s = Subscription(1, common.HOLDING_REGISTERS, 100, 3, None)
+    assert s.update([1, 2, 3]) == [(100, None, 1), (101, None, 2), (102, None, 3)]
+    c = Subscription(1, common.COILS, 0, 2, None)
+    assert c.update([1, 0]) == [(0, None, True), (1, None, False)]
+
+
+def test_xor_finds_each_changed_lane():
+    s = registers([0] * 8)
+    assert s.update([0] * 8) == []
+    # 同一寄存器的高低字节都变化时只上报一次，相邻寄存器分别上报
+    assert s.update([0, 0x00ff, 0x0100, 0, 0, 0, 0, 0xffff]) == [(101, 0, 0x00ff), (102, 0, 0x0100),
+                                                                 (107, 0, 0xffff)]
+    assert s.update([0, 0x0100, 0x0100, 0, 0, 0, 0, 0xffff]) == [(101, 0x00ff, 0x0100)]
+
+    coils = Subscription(1, common.COILS, 8, 10, None)
+    coils.update([0] * 10)
+    assert coils.update([1, 0, 0, 0, 0, 0, 0, 0, 0, 1]) == [(8, False, True), (17, False, True)]
+    assert coils.update([1, 0, 0, 0, 0, 0, 0, 0, 0, 0]) == [(17, True, False)]
+    assert coils.changes == 10 + 3
+
+
+def test_absolute_deadband_is_relative_to_reported_value():
+    s = registers([100, 100], absolute=2)
+    assert s.update([102, 98]) == []
+    # 缓慢漂移累积超过死区后上报，之后以新上报的值为基准
+    assert s.update([103, 98]) == [(100, 100, 103)]
+    assert s.update([105, 98]) == []
+    assert s.update([106, 97]) == [(100, 103, 106), (101, 100, 97)]
+
+
+def test_percent_deadband():
+    s = registers([1000, 10], percent=5)
+    assert s.update([1050, 10]) == []
+    assert s.update([1051, 11]) == [(100, 1000, 1051), (101, 10, 11)]
+
+
+def test_signed_registers():
+    s = registers([0xffff], absolute=1, signed=True)
+    # 按int16比较，-1到1变化2
+    assert s.update([0]) == []
+    assert s.update([1]) == [(100, -1, 1)]
+    u = registers([0xffff], absolute=1)
+    assert u.update([0]) == [(100, 0xffff, 0)]
+
+
+def test_bits_do_not_support_deadband():
+    with pytest.raises(ValueError):
+        Subscription(1, common.COILS, 0, 8, None, absolute=1)
+
+
+@pytest.mark.parametrize('max_in_flight', [1, 4])
+def test_poll_dispatch_follows_client_mode(start_slave, max_in_flight):
+    slave = start_slave(FRAMER_SOCKET, unit_ids=[1, 2])
+    slave.datastore.set_values(1, 'holding_registers', 0, [1, 2, 3])
+    slave.datastore.set_values(2, 'coils', 0, [1, 0, 1])
+    reported = list()
+
+    async def run():
+        c = AioModbusClient(TCPChannel('127.0.0.1', slave.port), SocketFramer, timeout=0.3,
+                            max_in_flight=max_in_flight)
+        process = c.process_adu_request
+        in_flight = {'now': 0, 'max': 0}
+
+        async def tracked(adu, *args):
+            in_flight['now'] += 1
+            in_flight['max'] = max(in_flight['max'], in_flight['now'])
+            try:
+                return await process(adu, *args)
+            finally:
+                in_flight['now'] -= 1
+
+        c.process_adu_request = tracked
+        manager = SubscriptionManager(c)
+        manager.subscribe(1, common.HOLDING_REGISTERS, 0, 3, lambda s, changes: reported.append(changes))
+        manager.subscribe(2, common.COILS, 0, 3, lambda s, changes: reported.append(changes))
+        # 不存在的从站不应答，不影响其它订阅
+        lost = manager.subscribe(3, common.HOLDING_REGISTERS, 0, 1, lambda s, changes: reported.append(changes))
+        assert await manager.poll() == 6
+        slave.datastore.set_values(1, 'holding_registers', 1, [20])
+        assert await manager.poll() == 1
+        c.close()
+        return lost, in_flight['max']
+
+    lost, concurrency = asyncio.run(run())
+    assert lost.errors == 2
+    assert reported[-1] == [(1, 2, 20)]
+    # 逐个请求应答的客户端上请求依次发出，流水线客户端上同时发出
+    assert concurrency == (1 if max_in_flight == 1 else 3)
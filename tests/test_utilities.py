@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import random
+import pytest
+import xmodbus.pdu as pdu
+import xmodbus.utilities as utilities
+
+
+@pytest.mark.parametrize('count', [0, 1, 7, 8, 9, 63, 64, 65, 2000])
+def test_pack_bits_round_trip(count):
+    bits = [random.randint(0, 1) for _ in range(count)]
+    packed = utilities.pack_bits(bits)
+    assert len(packed) == (count + 7) // 8
+    assert list(utilities.unpack_bits(packed, count)) == bits
+    assert utilities.pack_bits(bytes(bits)) == packed
+    assert utilities.pack_bits([bool(bit) for bit in bits]) == packed
+
+
+def test_pack_bits_wire_order():
+    assert utilities.pack_bits([1, 0, 1, 0, 0, 0, 0, 0, 1]) == b'\x05\x01'
+    assert utilities.pack_bits(['on', 'OFF', True, False, 'Off', 1]) == b'\x25'
+    assert utilities.unpack_bits(b'\x05', 4) == b'\x01\x00\x01\x00'
+    assert utilities.unpack_bitstring(b'\x81') == [True] + [False] * 6 + [True]
+
+
+@pytest.mark.parametrize('values', [[0, 5], [2], b'\x00\x02', ['on', 'yes'], [None], [0.5]])
+def test_invalid_bit_values_are_rejected(values):
+    with pytest.raises(ValueError):
+        utilities.to_bits(values)
+
+
+@pytest.mark.parametrize('count', [0, 1, 7, 8, 9, 64, 65, 2000])
+@pytest.mark.parametrize('dtype', ['bool', 'uint8', 'int64'])
+def test_numpy_bits_match_pure_python(count, dtype):
+    numpy = pytest.importorskip('numpy')
+    bits = [random.randint(0, 1) for _ in range(count)]
+    values = numpy.array(bits, dtype=dtype)
+    assert utilities.to_bits(values) == utilities.to_bits(bits)
+    assert utilities.pack_bits(values) == utilities.pack_bits(bits)
+
+
+def test_numpy_invalid_bit_values_are_rejected():
+    numpy = pytest.importorskip('numpy')
+    with pytest.raises(ValueError):
+        utilities.to_bits(numpy.array([0, 2]))
+    with pytest.raises(ValueError):
+        utilities.pack_bits(numpy.array([1, -1], dtype='int8'))
+
+
+def test_write_multiple_coils_rejects_invalid_values():
+    with pytest.raises(ValueError):
+        pdu.WriteMultipleCoilsRequest(0, [0, 5]).encode()
+
+
+def test_crc():
+    frame = b'\x01\x03\x00\x00\x00\x01'
+    assert utilities.computeCRC(frame) == 0x840A
+    assert utilities.checkCRC(frame, 0x840A)
+    assert utilities.computeCRC(frame + b'\x84\x0a') == 0
+    # 奇数长度的最后一个字节单独计算
+    assert utilities.computeCRC(b'\x01\x03\x02\x00\x0a') == 0x3843
+
+
+def test_lrc():
+    frame = b'\x01\x03\x00\x00\x00\x01'
+    assert utilities.computeLRC(frame) == 0xFB
+    assert utilities.checkLRC(frame, 0xFB)
+    assert utilities.computeLRC(frame + b'\xfb') == 0
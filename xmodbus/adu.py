@@ -5,6 +5,9 @@ import struct
 
 
 class BasicADURequest:
+    # 启用统计时记录该请求时间线的RequestTrace(见xmodbus.metrics)
+    trace = None
+
     def __init__(self, request_pdu, unit_id):
         self.unit_id = unit_id
         self.pdu = request_pdu
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import asyncio
+import collections
+import logging
+import xmodbus.common as common
+
+
+_logger = logging.getLogger()
+
+# 优先级，数值越小越优先
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# 写请求的功能码，默认以高优先级执行
+_write_function_codes = {0x05, 0x06, 0x0F, 0x10}
+
+
+def default_priority(request_adu):
+    """写请求默认高优先级，其它请求默认普通优先级"""
+    return PRIORITY_HIGH if request_adu.pdu.fx in _write_function_codes else PRIORITY_NORMAL
+
+
+class ArbiterEntry:
+    """一个排队中的请求"""
+    __slots__ = ('request_adu', 'future', 'deadline')
+
+    def __init__(self, request_adu, future, deadline):
+        self.request_adu = request_adu
+        self.future = future
+        # 截止时刻(loop.time())，None表示不限
+        self.deadline = deadline
+
+
+class BusArbiter:
+    """总线仲裁器
+
+    多个协程的请求在一条同一时刻只能有一个请求在途的通道上排队逐个执行：
+    优先级高的请求先执行，同一优先级内各从站轮流执行，
+    开始执行前已超过截止时刻或已被调用方放弃的请求直接丢弃，不占用总线。
+    """
+    def __init__(self, execute):
+        # 在总线上执行一个请求，形如 async def execute(request_adu)
+        self.execute = execute
+        # priority -> OrderedDict(unit_id -> deque([ArbiterEntry, ...]))
+        self._queues = dict()
+        self._wakeup = None
+        self._task = None
+
+        self.executed = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return sum(len(queue) for units in self._queues.values() for queue in units.values())
+
+    def submit(self, request_adu, priority=None, deadline=None):
+        """提交请求，返回应答的future，deadline为截止时刻(loop.time())"""
+        loop = asyncio.get_running_loop()
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+        if priority is None:
+            priority = default_priority(request_adu)
+
+        entry = ArbiterEntry(request_adu, loop.create_future(), deadline)
+        units = self._queues.get(priority)
+        if units is None:
+            units = self._queues[priority] = collections.OrderedDict()
+        queue = units.get(request_adu.unit_id)
+        if queue is None:
+            queue = units[request_adu.unit_id] = collections.deque()
+        queue.append(entry)
+        self._wakeup.set()
+        return entry.future
+
+    def _next_entry(self):
+        priority = min(self._queues)
+        units = self._queues[priority]
+        unit_id, queue = next(iter(units.items()))
+        entry = queue.popleft()
+        if queue:
+            units.move_to_end(unit_id)
+        else:
+            del units[unit_id]
+            if not units:
+                del self._queues[priority]
+        return entry
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            while not self._queues:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            entry = self._next_entry()
+            if entry.future.done():
+                self.dropped += 1
+                continue
+
+            remaining = None
+            if entry.deadline is not None:
+                remaining = entry.deadline - loop.time()
+                if remaining <= 0:
+                    self.dropped += 1
+                    entry.future.set_exception(common.XModbusQueueTimeoutError('deadline expired before sending'))
+                    continue
+
+            try:
+                result = await asyncio.wait_for(self.execute(entry.request_adu), remaining)
+            except asyncio.CancelledError:
+                if not entry.future.done():
+                    entry.future.cancel()
+                raise
+            except asyncio.TimeoutError:
+                if not entry.future.done():
+                    entry.future.set_exception(common.XModbusTimeoutError('request timeout'))
+            except Exception as e:
+                if not entry.future.done():
+                    entry.future.set_exception(e)
+            else:
+                self.executed += 1
+                if not entry.future.done():
+                    entry.future.set_result(result)
+
+    def close(self):
+        """停止仲裁器，取消所有排队中的请求"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        for units in self._queues.values():
+            for queue in units.values():
+                for entry in queue:
+                    entry.future.cancel()
+        self._queues.clear()
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import array
+import asyncio
+import collections
+import sys
+import time
+import xmodbus.adu as adu
+import xmodbus.common as common
+import xmodbus.utilities as utilities
+
+
+# 可缓存的读请求功能码 -> 数据表
+_read_tables = {
+    0x01: common.COILS,
+    0x02: common.DISCRETE_INPUTS,
+    0x03: common.HOLDING_REGISTERS,
+    0x04: common.INPUT_REGISTERS,
+}
+
+# 写请求功能码 -> 被写的数据表
+_write_tables = {
+    0x05: common.COILS,
+    0x0F: common.COILS,
+    0x06: common.HOLDING_REGISTERS,
+    0x10: common.HOLDING_REGISTERS,
+}
+
+
+def _write_range(request_pdu):
+    """返回写请求的(起始地址, 数量)"""
+    if request_pdu.fx == 0x0F:
+        return request_pdu.address, len(request_pdu.coils)
+    if request_pdu.fx == 0x10:
+        return request_pdu.address, len(request_pdu.values)
+    return request_pdu.address, 1
+
+
+def request_range(request_pdu):
+    """返回读写请求涉及的(数据表, 起始地址, 数量)，其它请求返回None"""
+    table = _read_tables.get(request_pdu.fx)
+    if table is not None:
+        return table, request_pdu.address, request_pdu.quantity
+    table = _write_tables.get(request_pdu.fx)
+    if table is not None:
+        return (table,) + _write_range(request_pdu)
+    return None
+
+
+class CacheEntry:
+    """一个缓存的读应答"""
+    __slots__ = ('address', 'quantity', 'response', 'expires')
+
+    def __init__(self, address, quantity, response, expires):
+        self.address = address
+        self.quantity = quantity
+        self.response = response
+        self.expires = expires
+
+
+class ReadCache:
+    """客户端读缓存
+
+    以(通道, 从站地址, 数据表)分组缓存成功的读应答，每个数据表可以设置不同的有效期(ttls)，
+    请求的地址范围被某个未过期的缓存应答完全包含时直接由缓存应答截取，不再发送请求；
+    异步客户端上并发的相同读请求只发送一次；经同一客户端的写请求使被写范围的缓存失效，
+    写请求发出前已在途的读请求的应答不再进入缓存，写请求之后的读请求也不再与其合并。缓存条目超过max_entries时按最近最少使用淘汰。
+    由缓存返回的应答与缓存共享寄存器数组，调用方不应修改。
+    """
+    def __init__(self, ttl=None, ttls=None, max_entries=None):
+        # 默认有效期，单位秒
+        self.ttl = 0.1 if ttl is None else ttl
+        # 数据表 -> 有效期
+        self.ttls = dict(ttls or {})
+        self.max_entries = max_entries or 1024
+
+        # (channel, unit_id, table, address, quantity) -> CacheEntry，按最近使用排序
+        self._entries = collections.OrderedDict()
+        # (channel, unit_id, table) -> set((address, quantity), ...)
+        self._groups = collections.defaultdict(set)
+        # (channel, unit_id, table) -> 写入代数，每次写入加1
+        self._generations = collections.defaultdict(int)
+        # 在途的读请求, (channel, unit_id, table, address, quantity) -> future
+        self._inflight = dict()
+
+        self.hits = 0
+        self.misses = 0
+        self.collapsed = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def ttl_of(self, table):
+        return self.ttls.get(table, self.ttl)
+
+    @staticmethod
+    def _key(channel, request_adu):
+        table = _read_tables.get(request_adu.pdu.fx)
+        if table is None:
+            return None
+        return channel, request_adu.unit_id, table, request_adu.pdu.address, request_adu.pdu.quantity
+
+    def get(self, channel, request_adu):
+        """返回缓存中满足请求的应答，没有时返回None"""
+        key = self._key(channel, request_adu)
+        if key is None:
+            return None
+        group_key, address, quantity = key[:3], key[3], key[4]
+        now = time.monotonic()
+
+        entry = self._entries.get(key)
+        if entry is None:
+            for begin, count in self._groups.get(group_key, ()):
+                if begin <= address and address + quantity <= begin + count:
+                    candidate = self._entries[group_key + (begin, count)]
+                    if candidate.expires > now:
+                        entry = candidate
+                        break
+            if entry is None:
+                return None
+        elif entry.expires <= now:
+            self._remove(key)
+            return None
+
+        self._entries.move_to_end(group_key + (entry.address, entry.quantity))
+        self.hits += 1
+        return self._slice(entry, request_adu)
+
+    @staticmethod
+    def _slice(entry, request_adu):
+        request_pdu = request_adu.pdu
+        cached_pdu = entry.response.pdu
+        if entry.address == request_pdu.address and entry.quantity == request_pdu.quantity:
+            return adu.AduResponseSuccess(request_adu, cached_pdu)
+
+        begin = request_pdu.address - entry.address
+        end = begin + request_pdu.quantity
+        if request_pdu.fx in (0x01, 0x02):
+            payload = utilities.pack_bits(cached_pdu.bits[begin:end])
+        else:
+            values = array.array('H', cached_pdu.values[begin:end])
+            if sys.byteorder == 'little':
+                values.byteswap()
+            payload = values.tobytes()
+        data = b''.join([bytes([len(payload)]), payload])
+        return adu.AduResponseSuccess(request_adu, request_pdu.make_response_pdu_pair(request_pdu.fx, data))
+
+    def generation(self, channel, request_adu):
+        """返回请求所读数据表的当前写入代数，放入缓存时用于判断请求期间是否发生过写入"""
+        key = self._key(channel, request_adu)
+        return None if key is None else self._generations[key[:3]]
+
+    def put(self, channel, request_adu, response, generation=None):
+        """缓存一个读应答，generation与当前写入代数不一致时不缓存"""
+        key = self._key(channel, request_adu)
+        if key is None or not response.is_success():
+            return
+        if generation is not None and generation != self._generations[key[:3]]:
+            return
+
+        ttl = self.ttl_of(key[2])
+        if ttl <= 0:
+            return
+
+        self._entries[key] = CacheEntry(key[3], key[4], response, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        self._groups[key[:3]].add(key[3:])
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        del self._entries[key]
+        group = self._groups[key[:3]]
+        group.discard(key[3:])
+        if not group:
+            del self._groups[key[:3]]
+
+    def invalidate_write(self, channel, request_adu):
+        """写请求使被写范围的缓存失效，不是写请求时什么也不做"""
+        table = _write_tables.get(request_adu.pdu.fx)
+        if table is None:
+            return
+
+        group_key = (channel, request_adu.unit_id, table)
+        self._generations[group_key] += 1
+        address, quantity = _write_range(request_adu.pdu)
+        for begin, count in list(self._groups.get(group_key, ())):
+            if begin < address + quantity and address < begin + count:
+                self._remove(group_key + (begin, count))
+                self.invalidations += 1
+        # 写请求之前已在途的读请求可能读到写入前的值，之后的读请求不再与其合并
+        for key in list(self._inflight):
+            if key[:3] == group_key and key[3] < address + quantity and address < key[3] + key[4]:
+                del self._inflight[key]
+
+    def invalidate(self, channel=None, unit_id=None):
+        """清除缓存，可以只清除指定通道或从站"""
+        for key in list(self._entries):
+            if (channel is None or key[0] is channel) and (unit_id is None or key[1] == unit_id):
+                self._remove(key)
+        for key in list(self._generations):
+            if (channel is None or key[0] is channel) and (unit_id is None or key[1] == unit_id):
+                self._generations[key] += 1
+
+    def sync_call(self, channel, request_adu, process, *args):
+        """同步客户端经缓存执行请求，未命中时调用process(request_adu, *args)"""
+        response = self.get(channel, request_adu)
+        if response is not None:
+            return response
+
+        self.invalidate_write(channel, request_adu)
+        generation = self.generation(channel, request_adu)
+        if generation is not None:
+            self.misses += 1
+        response = process(request_adu, *args)
+        if generation is not None:
+            self.put(channel, request_adu, response, generation)
+        return response
+
+    async def aio_call(self, channel, request_adu, process, *args):
+        """异步客户端经缓存执行请求，未命中时调用process(request_adu, *args)，并发的相同读请求只执行一次"""
+        response = self.get(channel, request_adu)
+        if response is not None:
+            return response
+
+        key = self._key(channel, request_adu)
+        if key is None:
+            self.invalidate_write(channel, request_adu)
+            return await process(request_adu, *args)
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.collapsed += 1
+            response = await asyncio.shield(future)
+            # 每个调用方得到以自己的请求构造的应答
+            if response.is_success():
+                return adu.AduResponseSuccess(request_adu, response.pdu)
+            return adu.AduResponseError(request_adu, response.pdu)
+
+        self.misses += 1
+        generation = self._generations[key[:3]]
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        # 没有其它请求等待时避免"exception was never retrieved"警告
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        try:
+            response = await process(request_adu, *args)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            future.set_result(response)
+            self.put(channel, request_adu, response, generation)
+            return response
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def as_dict(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'collapsed': self.collapsed,
+            'invalidations': self.invalidations,
+            'evictions': self.evictions,
+        }
@@ -4,18 +4,30 @@
 
 class BasicChannel(object):
     """"""
+    # 帧内允许的最长静默时间，单位秒，超过时判定帧已结束；None表示通道上没有静默分帧(如TCP)
+    frame_silence = None
+
     def sync_open(self, client):
         """打开通道"""
         raise NotImplementedError
 
-    def sync_read(self, n):
-        """以同步的方式读入指定长度的数据"""
+    def sync_read(self, n, timeout=None):
+        """以同步的方式读入指定长度的数据，timeout秒内未收到数据时抛出XModbusTimeoutError"""
         raise NotImplementedError
 
-    def sync_write(self, data):
-        """以同步方式写出数据"""
+    def sync_read_into(self, buffer, timeout=None):
+        """以同步的方式读入数据到buffer中，返回读入的字节数"""
+        data = self.sync_read(len(buffer), timeout)
+        buffer[:len(data)] = data
+        return len(data)
+
+    def sync_write(self, data, timeout=None):
+        """以同步方式写出数据，timeout秒内未写完时抛出XModbusTimeoutError"""
         raise NotImplementedError
 
+    def sync_discard_input(self):
+        """丢弃已到达但尚未读取的数据，如超时请求迟到的应答"""
+
     async def aio_open(self, client):
         """异步打开通道"""
         raise NotImplementedError
@@ -28,6 +40,9 @@ class BasicChannel(object):
         """以异步方式读入指定长度的数据"""
         raise NotImplementedError
 
+    async def aio_discard_input(self):
+        """丢弃已到达但尚未读取的数据，如超时请求迟到的应答"""
+
     def close(self):
         """关闭通道"""
         raise NotImplementedError
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import xmodbus.channel as channel
+import xmodbus.common as common
+import asyncio
+import logging
+import os
+import select
+import termios
+import time
+
+
+_logger = logging.getLogger()
+
+
+class SerialChannel(channel.BasicChannel):
+    """串口通道
+
+    按照波特率计算字符时间，t3.5为帧间的最小静默时间，波特率高于19200时按规约固定为1750us。
+    发送前只等待距上一次总线活动不足t3.5的剩余时间；RTU应答收齐即返回，
+    收到首字节后静默超过frame_silence(默认t3.5)则判定帧已结束，不完整的应答不必等到超时。
+    UART的FIFO和USB串口使字节成批到达，用户态无法可靠地测量t1.5字符间隔，因此不单独检查t1.5，
+    间隔过长的帧由静默判定截断后由长度和CRC校验发现。
+    """
+    def __init__(self, port, baudrate=None, bytesize=None, parity=None, stopbits=None, frame_silence=None):
+        self.port = port
+        self.baudrate = baudrate or 9600
+        self.bytesize = bytesize or 8
+        self.parity = (parity or 'N').upper()
+        self.stopbits = stopbits or 1
+
+        # 一个字符的位数: 起始位 + 数据位 + 校验位 + 停止位
+        bits = 1 + self.bytesize + (0 if self.parity == 'N' else 1) + self.stopbits
+        self.char_time = bits / self.baudrate
+        if self.baudrate > 19200:
+            self.t3_5 = 0.00175
+        else:
+            self.t3_5 = 3.5 * self.char_time
+        # 帧内允许的最长静默时间，超过时判定帧已结束，USB串口等有较大接收延迟的设备需要适当加大
+        self.frame_silence = frame_silence or self.t3_5
+
+        self.client = None
+        self.fd = None
+        # 总线最后一次活动(发送完成或收到数据)的时刻
+        self._idle_since = 0
+
+    def _configure(self):
+        try:
+            speed = getattr(termios, 'B{}'.format(self.baudrate))
+        except AttributeError:
+            raise ValueError('不支持的波特率: {}'.format(self.baudrate))
+
+        iflag, oflag, cflag, lflag, ispeed, ospeed, cc = termios.tcgetattr(self.fd)
+        iflag = termios.IGNBRK
+        oflag = 0
+        lflag = 0
+        cflag = termios.CLOCAL | termios.CREAD
+        cflag |= {5: termios.CS5, 6: termios.CS6, 7: termios.CS7, 8: termios.CS8}[self.bytesize]
+        if self.stopbits == 2:
+            cflag |= termios.CSTOPB
+        if self.parity == 'E':
+            cflag |= termios.PARENB
+        elif self.parity == 'O':
+            cflag |= termios.PARENB | termios.PARODD
+        elif self.parity != 'N':
+            raise ValueError('不支持的校验方式: {}'.format(self.parity))
+        cc[termios.VMIN] = 0
+        cc[termios.VTIME] = 0
+        termios.tcsetattr(self.fd, termios.TCSANOW, [iflag, oflag, cflag, lflag, speed, speed, cc])
+
+    def _wait_bus_idle(self):
+        """返回发送前还需要等待的帧间静默时间"""
+        return self._idle_since + self.t3_5 - time.monotonic()
+
+    def _before_write(self, data):
+        # 丢弃上一个超时请求残留的应答数据
+        termios.tcflush(self.fd, termios.TCIFLUSH)
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug('TX {}'.format(data.hex()))
+
+    def _after_write(self, data):
+        self._idle_since = time.monotonic() + len(data) * self.char_time
+
+    def _received(self, data):
+        self._idle_since = time.monotonic()
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug('RX {}'.format(data.hex()))
+
+    def sync_open(self, client):
+        """打开通道"""
+        self.client = client
+        self.fd = os.open(self.port, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        self._configure()
+
+    def _sync_wait_readable(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        return bool(readable)
+
+    def sync_read(self, n, timeout=None):
+        """以同步的方式读入指定长度的数据，有数据可读即返回"""
+        if not self._sync_wait_readable(timeout):
+            raise common.XModbusTimeoutError('read timeout')
+        data = os.read(self.fd, n)
+        self._received(data)
+        return data
+
+    def sync_write(self, data, timeout=None):
+        """以同步方式写出数据"""
+        self._before_write(data)
+        delay = self._wait_bus_idle()
+        if delay > 0:
+            time.sleep(delay)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        view = memoryview(data)
+        while view:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise common.XModbusTimeoutError('write timeout')
+            _, writable, _ = select.select([], [self.fd], [], remaining)
+            if writable:
+                view = view[os.write(self.fd, view):]
+        self._after_write(data)
+
+    async def aio_open(self, client):
+        """异步方式打开"""
+        self.sync_open(client)
+
+    async def _aio_wait(self, add, remove):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        add(self.fd, future.set_result, None)
+        try:
+            await future
+        finally:
+            remove(self.fd)
+
+    async def _aio_wait_readable(self):
+        loop = asyncio.get_running_loop()
+        await self._aio_wait(loop.add_reader, loop.remove_reader)
+
+    async def aio_read(self, n):
+        """以异步方式读入指定长度的数据，有数据可读即返回"""
+        while True:
+            try:
+                data = os.read(self.fd, n)
+            except BlockingIOError:
+                data = b''
+            if data:
+                self._received(data)
+                return data
+            await self._aio_wait_readable()
+
+    async def aio_write(self, data):
+        """以异步方式写出数据"""
+        self._before_write(data)
+        delay = self._wait_bus_idle()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        loop = asyncio.get_running_loop()
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[os.write(self.fd, view):]
+            except BlockingIOError:
+                await self._aio_wait(loop.add_writer, loop.remove_writer)
+        self._after_write(data)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
@@ -1,9 +1,9 @@
 # -*- coding: utf-8 -*-
 # author: lijie
 import xmodbus.channel as channel
+import xmodbus.common as common
 import socks
 import socket
-import time
 import logging
 import asyncio
 
@@ -42,17 +42,49 @@ class TCPChannel(channel.BasicChannel):
         else:
             self.conn = socket.create_connection((self.host, self.port))
 
-    def sync_read(self, n):
+    def sync_read(self, n, timeout=None):
         """以同步的方式读入指定长度的数据"""
-        data = self.conn.recv(n)
-        _logger.debug('RX {}'.format(data.hex()))
+        self.conn.settimeout(timeout)
+        try:
+            data = self.conn.recv(n)
+        except socket.timeout:
+            raise common.XModbusTimeoutError('read timeout')
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug('RX {}'.format(data.hex()))
         return data
 
-    def sync_write(self, data):
+    def sync_read_into(self, buffer, timeout=None):
+        """以同步的方式读入数据到buffer中，返回读入的字节数"""
+        self.conn.settimeout(timeout)
+        try:
+            n = self.conn.recv_into(buffer)
+        except socket.timeout:
+            raise common.XModbusTimeoutError('read timeout')
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug('RX {}'.format(buffer[:n].hex()))
+        return n
+
+    def sync_write(self, data, timeout=None):
         """以同步方式写出数据"""
-        _logger.debug('TX {}'.format(data.hex()))
-        self.conn.send(data)
-        time.sleep(0.5)
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug('TX {}'.format(data.hex()))
+        self.conn.settimeout(timeout)
+        try:
+            self.conn.sendall(data)
+        except socket.timeout:
+            raise common.XModbusTimeoutError('write timeout')
+
+    def sync_discard_input(self):
+        """丢弃已到达但尚未读取的数据，如超时请求迟到的应答"""
+        if self.conn is None:
+            return
+        # 每次读写前都会重新设置超时，这里不再恢复阻塞模式
+        self.conn.settimeout(0)
+        try:
+            while self.conn.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
 
     async def aio_open(self, client):
         """异步方式打开"""
@@ -64,6 +96,24 @@ class TCPChannel(channel.BasicChannel):
         """以异步方式读入指定长度的数据"""
         return await self.reader.read(n)
 
+    async def aio_discard_input(self):
+        """丢弃已到达但尚未读取的数据，如超时请求迟到的应答"""
+        if self.reader is None:
+            return
+        # StreamReader没有非阻塞读取的接口：有已到达的数据时read不会挂起，
+        # 因此让读取任务先执行一步，未能立即完成说明没有已到达的数据，取消它不会丢失数据
+        while True:
+            task = asyncio.ensure_future(self.reader.read(4096))
+            try:
+                await asyncio.sleep(0)
+            finally:
+                if not task.done():
+                    task.cancel()
+                    # 等待取消完成，之后的读取才能开始
+                    await asyncio.wait([task])
+            if task.cancelled() or not task.result():
+                break
+
     async def aio_write(self, data):
         """以异步方式读入指定长度的数据"""
         self.writer.write(data)
@@ -5,8 +5,18 @@ import xmodbus.framer.framer_rtu as rtu
 
 class ModbusClient(object):
     """modbus客户端基类"""
-    def __init__(self, channel, framer_cls=None, auto_open=None):
+    def __init__(self, channel, framer_cls=None, auto_open=None, timeout=None, metrics=None, retry=None,
+                 breaker=None, cache=None):
         self.channel = channel
+        # 默认请求超时时间，单位秒，None表示不超时
+        self.timeout = timeout
+        # 请求统计(xmodbus.metrics.Metrics)，None表示不统计
+        self.metrics = metrics
+        # 重试策略(xmodbus.policy.RetryPolicy)和熔断器(xmodbus.policy.CircuitBreaker)，None表示不启用
+        self.retry = retry
+        self.breaker = breaker
+        # 读缓存(xmodbus.cache.ReadCache)，None表示不缓存
+        self.cache = cache
         if framer_cls is None:
             framer_cls = rtu.RTUFramer
         self.framer = framer_cls(self, channel)
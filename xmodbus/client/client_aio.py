@@ -1,39 +1,283 @@
 # -*- coding: utf-8 -*-
 # author: lijie
+import xmodbus.arbiter as arbiter
 import xmodbus.client as client
+import xmodbus.coalesce as coalesce
+import xmodbus.common as common
+import xmodbus.metrics as metrics
 import xmodbus.pdu as pdu
 import asyncio
+import logging
+
+
+_logger = logging.getLogger()
 
 
 class AioModbusClient(client.ModbusClient):
     """异步方式的modbus客户端"""
-    async def process_adu_request(self, request_adu, timeout=None):
-        """发送并ADU请求"""
+    def __init__(self, channel, framer_cls=None, auto_open=None, timeout=None, max_in_flight=None, metrics=None,
+                 retry=None, breaker=None, cache=None, write_window=None):
+        # 流水线模式下允许同时在途的最大请求数量，为1时逐个请求应答
+        self.max_in_flight = max_in_flight or 1
+        # 在途请求, transaction identifier -> (request_adu, future)
+        self._pending = dict()
+        self._window = None
+        self._reader_task = None
+        # 应答接收任务因连接关闭或帧错误结束时的错误，之后的流水线请求直接以其失败
+        self._reader_error = None
+        # 打开操作的任务，请求在其完成后才发送
+        self._open_task = None
+        # 非流水线模式下请求经仲裁器排队，同一时刻只有一个请求在途
+        self.arbiter = arbiter.BusArbiter(self._process_adu_request)
+        # 写缓冲，write_window秒内的写单个寄存器/线圈合并发送，None表示不合并
+        self.write_buffer = None if write_window is None else coalesce.WriteBuffer(self, write_window)
+        super().__init__(channel, framer_cls, auto_open, timeout, metrics, retry, breaker, cache)
+
+    @property
+    def pipelining(self):
+        """是否工作在流水线模式"""
+        return self.max_in_flight > 1 and self.framer.support_pipelining
+
+    async def process_adu_request(self, request_adu, timeout=None, priority=None, deadline=None):
+        """发送并ADU请求，timeout秒内未完成时抛出XModbusTimeoutError
+
+        非流水线模式下请求经仲裁器排队，priority为优先级(见xmodbus.arbiter)，
+        deadline为截止时刻(loop.time())，到截止时刻仍未发送的请求不再发送
+        """
+        if self.write_buffer is not None and self.write_buffer.conflicts(request_adu):
+            # 先发出与该请求有关的缓冲写入，保证先后顺序
+            await self.write_buffer.flush()
+        if self.cache is not None:
+            return await self.cache.aio_call(self.channel, request_adu, self._measure_adu_request,
+                                             timeout, priority, deadline)
+        return await self._measure_adu_request(request_adu, timeout, priority, deadline)
+
+    async def _measure_adu_request(self, request_adu, timeout, priority, deadline):
+        """启用统计时记录请求的时间线"""
+        if self.metrics is None:
+            return await self._execute_adu_request(request_adu, timeout, priority, deadline)
+
+        trace = request_adu.trace = self.metrics.begin(request_adu)
+        try:
+            response = await self._execute_adu_request(request_adu, timeout, priority, deadline)
+        except Exception as e:
+            self.metrics.finish(trace, error=e)
+            raise
+        self.metrics.finish(trace, response)
+        return response
+
+    async def _execute_adu_request(self, request_adu, timeout, priority, deadline):
+        """按重试策略和熔断器执行请求"""
+        retry, breaker = self.retry, self.breaker
+        if retry is None and breaker is None:
+            return await self._send_adu_request(request_adu, timeout, priority, deadline)
+
+        key = (self.channel, request_adu.unit_id)
+        attempt = 0
+        while True:
+            if breaker is not None and breaker.before_request(key):
+                await self._probe(key, timeout, priority, deadline)
+
+            try:
+                response = await self._send_adu_request(request_adu, timeout, priority, deadline)
+            except Exception as e:
+                if breaker is not None:
+                    breaker.record_failure(key, e)
+                delay = None if retry is None else retry.delay(attempt, e)
+                if delay is None:
+                    raise
+
+                attempt += 1
+                if request_adu.trace is not None:
+                    request_adu.trace.retries += 1
+                _logger.debug('retry unit {} fx {} in {}s: {}'.format(request_adu.unit_id, request_adu.pdu.fx, delay, e))
+                await asyncio.sleep(delay)
+                continue
+
+            if breaker is not None:
+                breaker.record_success(key)
+            return response
+
+    async def _probe(self, key, timeout, priority, deadline):
+        """熔断冷却结束后发送探测请求，从站无应答时抛出XModbusUnavailableError"""
+        unit_id = key[1]
+        probe_adu = self.framer.build_request_adu(self.breaker.probe(unit_id), unit_id)
+        try:
+            await self._send_adu_request(probe_adu, timeout, priority, deadline)
+        except Exception as e:
+            self.breaker.record_failure(key, e)
+            raise common.XModbusUnavailableError('unit {} did not answer the probe: {}'.format(unit_id, e))
+        except BaseException as e:
+            self.breaker.record_failure(key, e)
+            raise
+        self.breaker.record_success(key)
+
+    async def _send_adu_request(self, request_adu, timeout, priority, deadline):
+        if self._open_task is not None:
+            # 等待打开完成，打开失败时抛出其异常
+            await asyncio.shield(self._open_task)
+        if timeout is None:
+            timeout = self.timeout
+
+        if not self.pipelining:
+            if timeout is not None:
+                expire = asyncio.get_running_loop().time() + timeout
+                deadline = expire if deadline is None else min(deadline, expire)
+            return await self.arbiter.submit(request_adu, priority, deadline)
+
+        # 请求发出后记录发送时刻，据此区分超时发生在等待窗口还是等待应答
+        sent = list()
+        try:
+            return await asyncio.wait_for(self._process_pipelined_adu_request(request_adu, sent), timeout)
+        except asyncio.TimeoutError:
+            if not sent:
+                raise common.XModbusQueueTimeoutError('no free pipelining slot')
+            raise common.XModbusTimeoutError('request timeout')
+
+    async def execute(self, request_pdu, unit_id, timeout=None, priority=None, deadline=None):
+        """执行任意请求PDU"""
+        adu = self.framer.build_request_adu(request_pdu, unit_id)
+        return await self.process_adu_request(adu, timeout, priority, deadline)
+
+    async def _process_adu_request(self, request_adu):
+        """逐个请求应答方式发送ADU请求"""
+        if self.breaker is not None and self.breaker.is_open((self.channel, request_adu.unit_id)):
+            # 排队期间从站已被熔断
+            raise common.XModbusUnavailableError('unit {} is unavailable'.format(request_adu.unit_id))
+
+        trace = request_adu.trace
+        if trace is not None:
+            trace.dispatched = metrics.clock()
         bytes_data = request_adu.encode()
+        if trace is not None:
+            trace.encoded = metrics.clock()
+            trace.bytes_out += len(bytes_data)
+        if self.framer.discard_stale_input:
+            # 丢弃之前超时请求迟到的应答，避免被当作本次请求的应答
+            await self.channel.aio_discard_input()
         await self.channel.aio_write(bytes_data)
+        if trace is not None:
+            trace.written = metrics.clock()
 
-        # 复位帧产生器，准备接收数据
-        self.framer.reset()
+        # 以静默分帧的通道上，收到首字节后静默超过frame_silence即认为应答帧已结束，不必等到超时
+        silence = self.channel.frame_silence if self.framer.frame_by_silence else None
         while True:
-            need = self.framer.response_need_bytes_count(request_adu)
-            if need <= 0:
-                break
+            # 复位帧产生器，准备接收数据
+            self.framer.reset()
+            while True:
+                need = self.framer.response_need_bytes_count(request_adu)
+                if need <= 0:
+                    break
+
+                if silence is not None and len(self.framer.buffer) > 0:
+                    try:
+                        data = await asyncio.wait_for(self.channel.aio_read(need), silence)
+                    except asyncio.TimeoutError:
+                        raise common.XModbusError('应答帧不完整')
+                else:
+                    data = await self.channel.aio_read(need)
+                if len(data) == 0:
+                    raise common.XModbusError('通道已关闭')
+
+                if trace is not None:
+                    if trace.first_byte is None:
+                        trace.first_byte = metrics.clock()
+                    trace.bytes_in += len(data)
+                self.framer.push(data)
 
-            data = await self.channel.aio_read(need)
-            if len(data) == 0:
-                break
+            if not self.framer.is_response_ready(request_adu):
+                raise common.XModbusError('应答帧不完整')
 
-            self.framer.push(data)
+            if not self.framer.is_stale_response(request_adu):
+                return self.framer.get_response_adu(request_adu)
+            _logger.debug('drop stale response of unit {}'.format(request_adu.unit_id))
 
-        if self.framer.is_response_ready(request_adu):
-            pass
+    async def _process_pipelined_adu_request(self, request_adu, sent):
+        """流水线方式发送ADU请求，应答由接收任务按事务标识符分发"""
+        async with self._window:
+            tid = request_adu.transaction_identifier
+            error = self._reader_error
+            if error is not None:
+                raise common.XModbusError('response reader stopped: {}'.format(error)) from error
+            future = asyncio.get_running_loop().create_future()
+            self._pending[tid] = (request_adu, future)
+            try:
+                trace = request_adu.trace
+                if trace is not None:
+                    trace.dispatched = metrics.clock()
+                bytes_data = request_adu.encode()
+                if trace is not None:
+                    trace.encoded = metrics.clock()
+                    trace.bytes_out += len(bytes_data)
+                sent.append(metrics.clock())
+                await self.channel.aio_write(bytes_data)
+                if trace is not None:
+                    trace.written = metrics.clock()
+                return await future
+            finally:
+                self._pending.pop(tid, None)
 
-        return self.framer.get_response_adu(request_adu)
+    async def _read_responses(self):
+        """流水线模式下的应答接收任务"""
+        try:
+            while True:
+                for frame in await self.framer.aio_read_response_frames():
+                    self._dispatch_response(frame)
+        except asyncio.CancelledError:
+            self._abort_pending(None)
+            raise
+        except Exception as e:
+            _logger.error('response reader stopped: {}'.format(e))
+            self._reader_error = e
+            self._abort_pending(e)
+
+    def _dispatch_response(self, frame):
+        """将应答帧分发给事务标识符对应的请求"""
+        pending = self._pending.get(frame.transaction_identifier)
+        if pending is None:
+            _logger.warning('drop response with unknown transaction identifier {}'.format(frame.transaction_identifier))
+            return
+
+        request_adu, future = pending
+        if future.done():
+            return
+
+        trace = request_adu.trace
+        if trace is not None:
+            # 应答帧整帧分发，以分发时刻作为收到应答的时刻
+            trace.first_byte = metrics.clock()
+            trace.bytes_in += len(frame.adu)
+
+        try:
+            self.framer.load_response(frame.adu)
+            future.set_result(self.framer.get_response_adu(request_adu))
+        except Exception as e:
+            future.set_exception(e)
+
+    def _abort_pending(self, exc):
+        """终止所有在途请求"""
+        for _, future in self._pending.values():
+            if future.done():
+                continue
+            if exc is None:
+                future.cancel()
+            else:
+                future.set_exception(exc)
+
+    async def _open(self):
+        await self.channel.aio_open(self)
+        self._reader_error = None
+        if self.pipelining:
+            self._window = asyncio.Semaphore(self.max_in_flight)
+            self._reader_task = asyncio.create_task(self._read_responses())
 
     def open(self):
-        """执行客户端的打开操作，若初始化时制定了auto_open=True则不需要显示调用"""
-        open_task = self.channel.aio_open(self)
-        return asyncio.create_task(open_task)
+        """执行客户端的打开操作，若初始化时制定了auto_open=True则不需要显示调用
+
+        返回打开操作的任务，打开完成前提交的请求会等待其完成后再发送
+        """
+        self._open_task = asyncio.create_task(self._open())
+        return self._open_task
 
     def read_coils(self, address, quantity, unit_id):
         """读线圈"""
@@ -62,12 +306,16 @@ class AioModbusClient(client.ModbusClient):
     def write_single_coil(self, address, on_or_off, unit_id):
         """写单个线圈"""
         request = pdu.WriteSingleCoilRequest(address, on_or_off)
+        if self.write_buffer is not None:
+            return self.write_buffer.write(request, unit_id)
         adu = self.framer.build_request_adu(request, unit_id)
         return asyncio.create_task(self.process_adu_request(adu))
 
     def write_single_register(self, address, value, unit_id):
         """写单个寄存器"""
         request = pdu.WriteSingleRegisterRequest(address, value)
+        if self.write_buffer is not None:
+            return self.write_buffer.write(request, unit_id)
         adu = self.framer.build_request_adu(request, unit_id)
         return asyncio.create_task(self.process_adu_request(adu))
 
@@ -91,3 +339,10 @@ class AioModbusClient(client.ModbusClient):
 
     def close(self):
         """关闭"""
+        if self._reader_task:
+            self._reader_task.cancel()
+            self._reader_task = None
+        if self.write_buffer is not None:
+            self.write_buffer.close()
+        self.arbiter.close()
+        self.channel.close()
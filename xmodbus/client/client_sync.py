@@ -1,33 +1,365 @@
 # -*- coding: utf-8 -*-
 # author: lijie
 import xmodbus.client as client
+import xmodbus.common as common
+import xmodbus.metrics as metrics
 import xmodbus.pdu as pdu
+import heapq
+import logging
+import time
+
+
+_logger = logging.getLogger()
 
 
 class SyncModbusClient(client.ModbusClient):
     """同步方式的modbus客户端"""
     def process_adu_request(self, request_adu, timeout=None):
-        """发送并ADU请求"""
+        """发送并ADU请求，timeout秒内未完成时抛出XModbusTimeoutError"""
+        if self.cache is not None:
+            return self.cache.sync_call(self.channel, request_adu, self._measure_adu_request, timeout)
+        return self._measure_adu_request(request_adu, timeout)
+
+    def _measure_adu_request(self, request_adu, timeout):
+        """启用统计时记录请求的时间线"""
+        if self.metrics is None:
+            return self._execute_adu_request(request_adu, timeout)
+
+        trace = request_adu.trace = self.metrics.begin(request_adu)
+        try:
+            response = self._execute_adu_request(request_adu, timeout)
+        except Exception as e:
+            self.metrics.finish(trace, error=e)
+            raise
+        self.metrics.finish(trace, response)
+        return response
+
+    def _execute_adu_request(self, request_adu, timeout):
+        """按重试策略和熔断器执行请求"""
+        retry, breaker = self.retry, self.breaker
+        if retry is None and breaker is None:
+            return self._process_adu_request(request_adu, timeout)
+
+        key = (self.channel, request_adu.unit_id)
+        attempt = 0
+        while True:
+            if breaker is not None and breaker.before_request(key):
+                self._probe(key, timeout)
+
+            try:
+                response = self._process_adu_request(request_adu, timeout)
+            except Exception as e:
+                if breaker is not None:
+                    breaker.record_failure(key, e)
+                delay = None if retry is None else retry.delay(attempt, e)
+                if delay is None:
+                    raise
+
+                attempt += 1
+                if request_adu.trace is not None:
+                    request_adu.trace.retries += 1
+                _logger.debug('retry unit {} fx {} in {}s: {}'.format(request_adu.unit_id, request_adu.pdu.fx, delay, e))
+                time.sleep(delay)
+                continue
+
+            if breaker is not None:
+                breaker.record_success(key)
+            return response
+
+    def _probe(self, key, timeout):
+        """熔断冷却结束后发送探测请求，从站无应答时抛出XModbusUnavailableError"""
+        unit_id = key[1]
+        probe_adu = self.framer.build_request_adu(self.breaker.probe(unit_id), unit_id)
+        try:
+            self._process_adu_request(probe_adu, timeout)
+        except Exception as e:
+            self.breaker.record_failure(key, e)
+            raise common.XModbusUnavailableError('unit {} did not answer the probe: {}'.format(unit_id, e))
+        except BaseException as e:
+            self.breaker.record_failure(key, e)
+            raise
+        self.breaker.record_success(key)
+
+    def _process_adu_request(self, request_adu, timeout):
+        if timeout is None:
+            timeout = self.timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        trace = request_adu.trace
+        if trace is not None:
+            trace.dispatched = metrics.clock()
+
         bytes_data = request_adu.encode()
-        self.channel.sync_write(bytes_data)
+        if trace is not None:
+            trace.encoded = metrics.clock()
+            trace.bytes_out += len(bytes_data)
+        if self.framer.discard_stale_input:
+            # 丢弃之前超时请求迟到的应答，避免被当作本次请求的应答
+            self.channel.sync_discard_input()
+        self.channel.sync_write(bytes_data, self._remaining(deadline))
+        if trace is not None:
+            trace.written = metrics.clock()
 
-        # 复位帧产生器，准备接收数据
-        self.framer.reset()
+        # 以静默分帧的通道上，收到首字节后静默超过frame_silence即认为应答帧已结束，不必等到超时
+        silence = self.channel.frame_silence if self.framer.frame_by_silence else None
         while True:
-            need = self.framer.response_need_bytes_count(request_adu)
-            if need <= 0:
-                break
+            # 复位帧产生器，准备接收数据
+            self.framer.reset()
+            while True:
+                need = self.framer.response_need_bytes_count(request_adu)
+                if need <= 0:
+                    break
+
+                buffer = self.framer.receive_buffer(need)
+                timeout = self._remaining(deadline)
+                in_frame = silence is not None and len(self.framer.buffer) > 0 and (timeout is None or silence < timeout)
+                try:
+                    n = self.channel.sync_read_into(buffer, silence if in_frame else timeout)
+                except common.XModbusTimeoutError:
+                    if not in_frame:
+                        raise
+                    raise common.XModbusError('应答帧不完整')
+                if n == 0:
+                    raise common.XModbusError('通道已关闭')
+
+                if trace is not None:
+                    if trace.first_byte is None:
+                        trace.first_byte = metrics.clock()
+                    trace.bytes_in += n
+                self.framer.received(n)
+
+            if not self.framer.is_response_ready(request_adu):
+                raise common.XModbusError('应答帧不完整')
+
+            if not self.framer.is_stale_response(request_adu):
+                return self.framer.get_response_adu(request_adu)
+            _logger.debug('drop stale response of unit {}'.format(request_adu.unit_id))
+
+    @staticmethod
+    def _remaining(deadline):
+        """返回距离截止时间的剩余秒数"""
+        if deadline is None:
+            return None
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise common.XModbusTimeoutError('request timeout')
+        return remaining
+
+    def execute(self, request_pdu, unit_id, timeout=None):
+        """执行任意请求PDU"""
+        adu = self.framer.build_request_adu(request_pdu, unit_id)
+        return self.process_adu_request(adu, timeout)
+
+    def execute_many(self, requests, timeout=None, max_in_flight=None, return_exceptions=False):
+        """批量执行请求[(request_pdu, unit_id), ...]，按顺序返回应答
+
+        帧格式支持按事务标识符匹配应答(SocketFramer)时，请求编码后连续写出，最多max_in_flight个在途，
+        应答按事务标识符匹配；否则逐个请求应答。timeout为单个请求的超时时间，重试策略和熔断器同样对每个请求生效。
+        return_exceptions为True时失败请求的位置上是异常对象，否则抛出第一个错误。
+        """
+        if not self.framer.support_pipelining:
+            results = list()
+            for request_pdu, unit_id in requests:
+                try:
+                    results.append(self.execute(request_pdu, unit_id, timeout))
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    results.append(e)
+            return results
+
+        adus = [self.framer.build_request_adu(request_pdu, unit_id) for request_pdu, unit_id in requests]
+        if self.cache is None:
+            results = self._execute_pipelined(adus, timeout, max_in_flight)
+        else:
+            results = self._execute_cached(adus, timeout, max_in_flight)
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
+
+    def _execute_cached(self, adus, timeout, max_in_flight):
+        """经读缓存批量执行，缓存命中的请求不再发送
+
+        按请求的先后顺序查询缓存，写请求使之后的读请求不再由被写范围的缓存应答
+        """
+        cache = self.cache
+        results = [None] * len(adus)
+        missed = list()
+        generations = list()
+        for index, request_adu in enumerate(adus):
+            response = cache.get(self.channel, request_adu)
+            if response is not None:
+                results[index] = response
+                continue
+            cache.invalidate_write(self.channel, request_adu)
+            missed.append(index)
+            generations.append(cache.generation(self.channel, request_adu))
+        responses = self._execute_pipelined([adus[index] for index in missed], timeout, max_in_flight)
+        for index, generation, response in zip(missed, generations, responses):
+            results[index] = response
+            if generation is None:
+                continue
+            cache.misses += 1
+            if not isinstance(response, Exception):
+                cache.put(self.channel, adus[index], response, generation)
+        return results
+
+    def _execute_pipelined(self, adus, timeout, max_in_flight):
+        """流水线方式执行一批ADU请求，返回与adus一一对应的应答或异常
+
+        每个请求的超时从其发出时开始计算。与逐个执行时一样，熔断器对每个请求单独判断，
+        需要探测时等在途请求全部结束后先发送探测请求；失败的请求按重试策略以新的事务标识符重新排队。
+        """
+        if timeout is None:
+            timeout = self.timeout
+        window = max_in_flight or len(adus)
+        retry, breaker = self.retry, self.breaker
+        adus = list(adus)
+        results = [None] * len(adus)
+        attempts = [0] * len(adus)
+        # 等待发送的请求[(可发送的时刻, index), ...]，重试的请求在退避结束后才能发送
+        queue = [(0, index) for index in range(len(adus))]
+        # transaction identifier -> (index, 超时时刻)
+        pending = dict()
+        # 等在途请求结束后需要先探测的(key, index)
+        probe = None
+        decoder = self.framer.decoder
+        decoder.reset()
+
+        def finish(index, response=None, error=None):
+            request_adu = adus[index]
+            results[index] = response if error is None else error
+            if request_adu.trace is not None:
+                self.metrics.finish(request_adu.trace, response, error)
+
+        def fail(index, error):
+            request_adu = adus[index]
+            if breaker is not None:
+                breaker.record_failure((self.channel, request_adu.unit_id), error)
+            delay = None if retry is None else retry.delay(attempts[index], error)
+            if delay is None:
+                finish(index, error=error)
+                return
+
+            attempts[index] += 1
+            retry_adu = adus[index] = self.framer.build_request_adu(request_adu.pdu, request_adu.unit_id)
+            retry_adu.trace = request_adu.trace
+            if retry_adu.trace is not None:
+                retry_adu.trace.retries += 1
+            _logger.debug('retry unit {} fx {} in {}s: {}'.format(request_adu.unit_id, request_adu.pdu.fx, delay, error))
+            heapq.heappush(queue, (time.monotonic() + delay, index))
+
+        try:
+            while queue or pending or probe:
+                if probe is not None and not pending:
+                    (key, index), probe = probe, None
+                    try:
+                        self._probe(key, timeout)
+                    except common.XModbusUnavailableError as e:
+                        finish(index, error=e)
+                        continue
+                    finally:
+                        decoder.reset()
+                    # 探测成功，照常发送该请求
+                    heapq.heappush(queue, (0, index))
+
+                # 补满发送窗口，一次写出
+                now = time.monotonic()
+                chunks = list()
+                while probe is None and queue and queue[0][0] <= now and len(pending) < window:
+                    _, index = heapq.heappop(queue)
+                    request_adu = adus[index]
+                    if breaker is not None:
+                        key = (self.channel, request_adu.unit_id)
+                        try:
+                            if breaker.before_request(key):
+                                probe = (key, index)
+                                break
+                        except common.XModbusUnavailableError as e:
+                            finish(index, error=e)
+                            continue
+                    trace = request_adu.trace
+                    if self.metrics is not None and trace is None:
+                        trace = request_adu.trace = self.metrics.begin(request_adu)
+                    if trace is not None:
+                        trace.dispatched = metrics.clock()
+                    bytes_data = request_adu.encode()
+                    if trace is not None:
+                        trace.encoded = metrics.clock()
+                        trace.bytes_out += len(bytes_data)
+                    chunks.append(bytes_data)
+                    pending[request_adu.transaction_identifier] = (index, None if timeout is None else now + timeout)
+
+                if chunks:
+                    self.channel.sync_write(b''.join(chunks), timeout)
+                    now = metrics.clock()
+                    for index, _ in pending.values():
+                        trace = adus[index].trace
+                        if trace is not None and trace.written is None:
+                            trace.written = now
 
-            data = self.channel.sync_read(need)
-            if len(data) == 0:
-                break
+                # 等待应答，最多等到最早的在途请求超时或下一个重试请求可以发送
+                wakeups = [expires for _, expires in pending.values() if expires is not None]
+                if probe is None and queue and len(pending) < window:
+                    wakeups.append(queue[0][0])
+                wait = None if not wakeups else min(wakeups) - time.monotonic()
+                if not pending:
+                    if wait is not None and wait > 0:
+                        time.sleep(wait)
+                    continue
 
-            self.framer.push(data)
+                data = None
+                if wait is None or wait > 0:
+                    try:
+                        data = self.channel.sync_read(self.framer.read_size, wait)
+                    except common.XModbusTimeoutError:
+                        pass
+                if data is not None:
+                    if len(data) == 0:
+                        raise common.XModbusError('通道已关闭')
+                    decoder.feed(data)
+                    for frame in decoder.frames():
+                        entry = pending.pop(frame.transaction_identifier, None)
+                        if entry is None:
+                            _logger.debug('drop response with unknown transaction identifier {}'.format(
+                                frame.transaction_identifier))
+                            continue
 
-        if self.framer.is_response_ready(request_adu):
-            pass
+                        index = entry[0]
+                        request_adu = adus[index]
+                        if request_adu.trace is not None:
+                            request_adu.trace.first_byte = metrics.clock()
+                            request_adu.trace.bytes_in += len(frame.adu)
+                        try:
+                            self.framer.load_response(frame.adu)
+                            response = self.framer.get_response_adu(request_adu)
+                        except Exception as e:
+                            fail(index, e)
+                        else:
+                            if breaker is not None:
+                                breaker.record_success((self.channel, request_adu.unit_id))
+                            finish(index, response)
 
-        return self.framer.get_response_adu(request_adu)
+                now = time.monotonic()
+                for tid, (index, expires) in list(pending.items()):
+                    if expires is not None and expires <= now:
+                        del pending[tid]
+                        fail(index, common.XModbusTimeoutError('request timeout'))
+        except Exception as e:
+            # 通道错误，在途请求以该错误结束，未发送的请求以排队超时结束
+            for index, _ in pending.values():
+                if breaker is not None:
+                    breaker.record_failure((self.channel, adus[index].unit_id), e)
+                finish(index, error=e)
+            if probe is not None:
+                # 探测没有发出，解除探测中的状态
+                breaker.record_failure(probe[0], common.XModbusQueueTimeoutError(str(e)))
+                queue.append((0, probe[1]))
+            for _, index in queue:
+                finish(index, error=common.XModbusQueueTimeoutError('request not sent: {}'.format(e)))
+        return results
 
     def open(self):
         """执行客户端的打开操作，若初始化时制定了auto_open=True则不需要显示调用"""
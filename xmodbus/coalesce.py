@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import asyncio
+import logging
+import struct
+import xmodbus.adu as adu
+import xmodbus.cache as cache
+import xmodbus.common as common
+import xmodbus.pdu as pdu
+
+
+_logger = logging.getLogger()
+
+# 写请求的功能码
+_write_function_codes = {0x05, 0x06, 0x0F, 0x10}
+
+
+class PendingWrite:
+    """缓冲中的一个写请求"""
+    __slots__ = ('request_adu', 'future')
+
+    def __init__(self, request_adu, future):
+        self.request_adu = request_adu
+        self.future = future
+
+
+class WriteBuffer:
+    """异步客户端的写缓冲
+
+    window秒内经write提交的写单个寄存器/线圈请求按(从站地址, 数据表)收集，同一地址只保留最后一次写入的值，
+    地址连续的写入合并为一个写多个寄存器(FC16)/写多个线圈(FC15)请求，每个请求不超过
+    MAX_WRITE_REGISTERS个寄存器或MAX_WRITE_BITS个线圈，孤立的地址仍以原请求发送。
+    合并请求的应答拆分为每个调用方自己的写单个寄存器/线圈应答，从站返回异常码时每个调用方得到相同异常码的错误应答，
+    超时等错误则由合并请求中的每个调用方抛出。
+    经同一客户端的其它写请求和地址重叠的读请求发出前，先发出缓冲中的写入并等待其完成，
+    因此不会覆盖更新的值或读到写入前的数据；也可以调用flush立即发出。
+    """
+    def __init__(self, client, window=None):
+        self.client = client
+        # 收集写入的时间窗口，单位秒
+        self.window = 0.005 if window is None else window
+        # (unit_id, table) -> {address: (value, [PendingWrite, ...])}
+        self._pending = dict()
+        self._handle = None
+        # 正在发送的合并写入, task -> [(unit_id, table, {address, ...}), ...]
+        self._sending = dict()
+        # 写缓冲自己发出的请求，不需要检查先后顺序
+        self._own = set()
+
+        # 提交的写入数、实际发出的请求数、被后续写入覆盖的写入数
+        self.writes = 0
+        self.requests = 0
+        self.collapsed = 0
+
+    def write(self, request_pdu, unit_id):
+        """提交一个写单个寄存器或写单个线圈请求，返回应答的future"""
+        if request_pdu.fx == 0x06:
+            table, value = common.HOLDING_REGISTERS, request_pdu.value
+        elif request_pdu.fx == 0x05:
+            table, value = common.COILS, request_pdu.value == 0xff00
+        else:
+            raise ValueError('只能缓冲写单个寄存器或写单个线圈请求')
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        request_adu = self.client.framer.build_request_adu(request_pdu, unit_id)
+        addresses = self._pending.setdefault((unit_id, table), dict())
+        previous = addresses.get(request_pdu.address)
+        if previous is None:
+            addresses[request_pdu.address] = (value, [PendingWrite(request_adu, future)])
+        else:
+            previous[1].append(PendingWrite(request_adu, future))
+            addresses[request_pdu.address] = (value, previous[1])
+            self.collapsed += 1
+        self.writes += 1
+
+        if self._handle is None:
+            self._handle = loop.call_later(self.window, self._start_flush)
+        return future
+
+    def conflicts(self, request_adu):
+        """请求与缓冲中或正在发送的写入有先后顺序要求时返回True: 同一从站同一数据表的写请求，或地址重叠的读请求"""
+        if request_adu in self._own:
+            return False
+        request_range = cache.request_range(request_adu.pdu)
+        if request_range is None:
+            return False
+
+        table, address, quantity = request_range
+        key = (request_adu.unit_id, table)
+        is_write = request_adu.pdu.fx in _write_function_codes
+        groups = [(key, self._pending.get(key))]
+        for sending in self._sending.values():
+            groups.extend(((unit_id, group_table), addresses) for unit_id, group_table, addresses in sending)
+        for group_key, addresses in groups:
+            if group_key != key or not addresses:
+                continue
+            if is_write or any(address <= a < address + quantity for a in addresses):
+                return True
+        return False
+
+    @staticmethod
+    def _runs(addresses, limit):
+        """将地址按连续且不超过limit个分段"""
+        runs = list()
+        for address in sorted(addresses):
+            if runs and address == runs[-1][-1] + 1 and len(runs[-1]) < limit:
+                runs[-1].append(address)
+            else:
+                runs.append([address])
+        return runs
+
+    async def flush(self):
+        """立即发出缓冲中的所有写入，等待其与之前发出的合并写入全部完成"""
+        self._start_flush()
+        if self._sending:
+            await asyncio.wait(list(self._sending))
+
+    def _start_flush(self):
+        """发出缓冲中的所有写入"""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        pending, self._pending = self._pending, dict()
+
+        batches = list()
+        for (unit_id, table), addresses in pending.items():
+            limit = common.MAX_WRITE_BITS if table == common.COILS else common.MAX_WRITE_REGISTERS
+            for run in self._runs(addresses, limit):
+                values = [addresses[address][0] for address in run]
+                writes = [w for address in run for w in addresses[address][1]]
+                if len(run) == 1:
+                    request_pdu = writes[-1].request_adu.pdu
+                elif table == common.COILS:
+                    request_pdu = pdu.WriteMultipleCoilsRequest(run[0], values)
+                else:
+                    request_pdu = pdu.WriteMultiRegistersRequest(run[0], values)
+                batches.append((self.client.framer.build_request_adu(request_pdu, unit_id), writes))
+
+        if not batches:
+            return
+        self.requests += len(batches)
+        task = asyncio.ensure_future(self._send(batches))
+        self._sending[task] = [(unit_id, table, set(addresses)) for (unit_id, table), addresses in pending.items()]
+        task.add_done_callback(self._sending.pop)
+
+    async def _send(self, batches):
+        request_adus = [request_adu for request_adu, _ in batches]
+        self._own.update(request_adus)
+        try:
+            responses = await asyncio.gather(*[self.client.process_adu_request(request_adu)
+                                               for request_adu in request_adus], return_exceptions=True)
+        except BaseException:
+            # 被close取消时调用方的future也要取消，否则调用方一直等待
+            for _, writes in batches:
+                for write in writes:
+                    write.future.cancel()
+            raise
+        finally:
+            self._own.difference_update(request_adus)
+        for (_, writes), response in zip(batches, responses):
+            self._resolve(writes, response)
+
+    @staticmethod
+    def _resolve(writes, response):
+        """由合并请求的应答设置每个调用方的结果"""
+        for write in writes:
+            if write.future.done():
+                continue
+            if isinstance(response, BaseException):
+                write.future.set_exception(response)
+                continue
+
+            request_pdu = write.request_adu.pdu
+            if response.is_success():
+                response_pdu = request_pdu.make_response_pdu_pair(request_pdu.fx, request_pdu.encode()[1:])
+                write.future.set_result(adu.AduResponseSuccess(write.request_adu, response_pdu))
+            else:
+                data = struct.pack('B', response.pdu.error_code)
+                response_pdu = request_pdu.make_response_pdu_pair(request_pdu.fx | 0x80, data)
+                write.future.set_result(adu.AduResponseError(write.request_adu, response_pdu))
+
+    def close(self):
+        """丢弃缓冲中尚未发出的写入并取消正在发送的合并写入，其调用方的future被取消"""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        for addresses in self._pending.values():
+            for _, writes in addresses.values():
+                for write in writes:
+                    write.future.cancel()
+        self._pending.clear()
+        for task in list(self._sending):
+            task.cancel()
+
+    def as_dict(self):
+        return {
+            'writes': self.writes,
+            'requests': self.requests,
+            'collapsed': self.collapsed,
+            'pending': sum(len(addresses) for addresses in self._pending.values()),
+        }
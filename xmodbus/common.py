@@ -4,3 +4,51 @@
 class XModbusError(Exception):
     pass
 
+
+class XModbusTimeoutError(XModbusError):
+    """请求超时"""
+
+
+class XModbusQueueTimeoutError(XModbusTimeoutError):
+    """请求在排队期间超时，未发送到总线"""
+
+
+class XModbusChecksumError(XModbusError):
+    """帧校验错误"""
+
+
+class XModbusResponseError(XModbusError):
+    """应答帧完整但与请求不匹配，如从站地址、功能码或事务标识符不一致"""
+
+
+class XModbusUnavailableError(XModbusError):
+    """从站连续无应答，熔断期间请求被直接拒绝"""
+
+
+# 异常码
+ILLEGAL_FUNCTION = 0x01
+ILLEGAL_DATA_ADDRESS = 0x02
+ILLEGAL_DATA_VALUE = 0x03
+SLAVE_DEVICE_FAILURE = 0x04
+
+
+class XModbusExceptionError(XModbusError):
+    """需要以异常应答回复的请求错误"""
+    def __init__(self, code, message=None):
+        super().__init__(message or 'exception code {}'.format(code))
+        self.code = code
+
+
+# 数据表
+COILS = 'coils'
+DISCRETE_INPUTS = 'discrete_inputs'
+HOLDING_REGISTERS = 'holding_registers'
+INPUT_REGISTERS = 'input_registers'
+
+# 单次读请求允许的最大数量
+MAX_READ_BITS = 2000
+MAX_READ_REGISTERS = 125
+
+# 单次写请求允许的最大数量
+MAX_WRITE_BITS = 1968
+MAX_WRITE_REGISTERS = 123
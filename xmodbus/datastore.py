@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import logging
+import mmap
+import os
+import xmodbus.common as common
+
+
+_logger = logging.getLogger()
+
+# 每个数据表的地址空间大小
+TABLE_SIZE = 0x10000
+
+_bit_tables = {common.COILS, common.DISCRETE_INPUTS}
+_all_tables = (common.COILS, common.DISCRETE_INPUTS, common.HOLDING_REGISTERS, common.INPUT_REGISTERS)
+
+
+class BasicDatastore:
+    """数据存储基类
+
+    位数据以每位一个字节(取值0或1)的字节序列交换，寄存器数据以大端排列的字节序列交换，
+    与PDU中的格式一致，服务端无需逐个转换。
+    """
+    def has_unit(self, unit_id):
+        """是否存在该从站"""
+        raise NotImplementedError
+
+    def read(self, unit_id, table, address, quantity):
+        """读数据，返回字节序列"""
+        raise NotImplementedError
+
+    def write(self, unit_id, table, address, data):
+        """写数据"""
+        raise NotImplementedError
+
+    def get_values(self, unit_id, table, address, quantity):
+        """读数据，返回[value, ...]"""
+        data = self.read(unit_id, table, address, quantity)
+        if table in _bit_tables:
+            return [bool(b) for b in data]
+        return [(data[i] << 8) | data[i + 1] for i in range(0, quantity * 2, 2)]
+
+    def set_values(self, unit_id, table, address, values):
+        """写数据，values为[value, ...]"""
+        if table in _bit_tables:
+            data = bytes(1 if v else 0 for v in values)
+        else:
+            data = b''.join(value.to_bytes(2, 'big') for value in values)
+        self.write(unit_id, table, address, data)
+
+    @staticmethod
+    def check_range(table, address, quantity):
+        if table not in _all_tables:
+            raise ValueError('不支持的数据表: {}'.format(table))
+        if address < 0 or quantity < 0 or address + quantity > TABLE_SIZE:
+            raise common.XModbusExceptionError(common.ILLEGAL_DATA_ADDRESS)
+
+    @staticmethod
+    def write_quantity(table, data):
+        """返回写入数据的地址数量，寄存器数据不是整数个寄存器时抛出ILLEGAL_DATA_VALUE"""
+        if table in _bit_tables:
+            return len(data)
+        if len(data) % 2:
+            raise common.XModbusExceptionError(common.ILLEGAL_DATA_VALUE, '寄存器数据长度不是偶数: {}'.format(len(data)))
+        return len(data) // 2
+
+
+class MemoryDatastore(BasicDatastore):
+    """内存数据存储
+
+    每个数据表按block_size个地址分块，数据块在首次写入时分配，未写入过的块读出为0，
+    因此从站很多时也只占用实际用到的内存。读取范围不跨块时直接返回数据块的视图，
+    视图在下一次写入该范围前有效。
+    """
+    block_size = 4096
+
+    def __init__(self, unit_ids=None, block_size=None):
+        # 为None时响应所有从站
+        self.unit_ids = None if unit_ids is None else set(unit_ids)
+        if block_size:
+            self.block_size = block_size
+        # (unit_id, table, block index) -> memoryview
+        self._blocks = dict()
+        self._zero = memoryview(bytes(self.block_size * 2))
+
+    def has_unit(self, unit_id):
+        return self.unit_ids is None or unit_id in self.unit_ids
+
+    def _block(self, unit_id, table, index):
+        key = (unit_id, table, index)
+        block = self._blocks.get(key)
+        if block is None:
+            width = 1 if table in _bit_tables else 2
+            block = self._blocks[key] = memoryview(bytearray(self.block_size * width))
+        return block
+
+    def read(self, unit_id, table, address, quantity):
+        self.check_range(table, address, quantity)
+        width = 1 if table in _bit_tables else 2
+        index, start = divmod(address, self.block_size)
+        if start + quantity <= self.block_size:
+            block = self._blocks.get((unit_id, table, index), self._zero)
+            return block[start * width:(start + quantity) * width]
+
+        parts = list()
+        while quantity > 0:
+            index, start = divmod(address, self.block_size)
+            n = min(quantity, self.block_size - start)
+            block = self._blocks.get((unit_id, table, index), self._zero)
+            parts.append(block[start * width:(start + n) * width])
+            address += n
+            quantity -= n
+        return b''.join(parts)
+
+    def write(self, unit_id, table, address, data):
+        width = 1 if table in _bit_tables else 2
+        quantity = self.write_quantity(table, data)
+        self.check_range(table, address, quantity)
+
+        data = memoryview(data)
+        position = 0
+        while quantity > 0:
+            index, start = divmod(address, self.block_size)
+            n = min(quantity, self.block_size - start)
+            block = self._block(unit_id, table, index)
+            block[start * width:(start + n) * width] = data[position:position + n * width]
+            position += n * width
+            address += n
+            quantity -= n
+
+
+# 内存映射布局中每个从站的数据表偏移
+_table_offsets = {
+    common.COILS: 0,
+    common.DISCRETE_INPUTS: TABLE_SIZE,
+    common.HOLDING_REGISTERS: TABLE_SIZE * 2,
+    common.INPUT_REGISTERS: TABLE_SIZE * 4,
+}
+UNIT_SIZE = TABLE_SIZE * 6
+
+
+class MmapDatastore(BasicDatastore):
+    """内存映射数据存储
+
+    所有从站的数据表按固定布局存放在一段内存映射中，读取直接返回映射的视图。
+    指定path时映射到文件，数据在重启后保留，并可被其它进程映射共享，文件按稀疏文件创建，
+    只有写入过的页占用磁盘；不指定path时使用匿名共享内存，fork出的子进程共享同一份数据。
+    unit_ids的顺序决定布局，重新打开文件时需保持一致。
+    """
+    def __init__(self, unit_ids, path=None):
+        self.unit_ids = list(unit_ids)
+        self._slots = dict((unit_id, slot) for slot, unit_id in enumerate(self.unit_ids))
+        self.path = path
+
+        size = len(self.unit_ids) * UNIT_SIZE
+        if path:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if os.fstat(fd).st_size < size:
+                    os.ftruncate(fd, size)
+                self._mmap = mmap.mmap(fd, size)
+            finally:
+                os.close(fd)
+        else:
+            self._mmap = mmap.mmap(-1, size)
+        self._view = memoryview(self._mmap)
+
+    def has_unit(self, unit_id):
+        return unit_id in self._slots
+
+    def _offset(self, unit_id, table, address):
+        try:
+            slot = self._slots[unit_id]
+        except KeyError:
+            raise common.XModbusExceptionError(common.ILLEGAL_DATA_ADDRESS, '从站不存在: {}'.format(unit_id))
+        width = 1 if table in _bit_tables else 2
+        return slot * UNIT_SIZE + _table_offsets[table] + address * width, width
+
+    def read(self, unit_id, table, address, quantity):
+        self.check_range(table, address, quantity)
+        offset, width = self._offset(unit_id, table, address)
+        return self._view[offset:offset + quantity * width]
+
+    def write(self, unit_id, table, address, data):
+        self.check_range(table, address, self.write_quantity(table, data))
+        offset, _ = self._offset(unit_id, table, address)
+        self._view[offset:offset + len(data)] = data
+
+    def flush(self):
+        """将数据同步到文件"""
+        self._mmap.flush()
+
+    def close(self):
+        """关闭映射，read返回的视图仍在使用时映射在这些视图全部释放后才被解除"""
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            _logger.warning('mmap datastore closed with views in use, unmap when they are released')
+        self._mmap = None
@@ -3,13 +3,39 @@
 
 
 class BasicFramer:
+    # 是否支持按事务标识符匹配应答，支持时客户端可以流水线方式并发多个请求
+    support_pipelining = False
+    # 帧之间是否以静默分隔(RTU)，在以静默判定帧结束的通道上，帧内的静默超过通道的frame_silence即认为帧已结束
+    frame_by_silence = False
+    # 应答中没有事务标识符，无法区分之前超时请求迟到的应答，发送请求前需丢弃通道中已到达的数据
+    discard_stale_input = True
+    # 接收缓冲区初始大小，足以容纳一个最大的ADU
+    buffer_size = 512
+
     def __init__(self, client, channel):
         self.client = client
         self.channel = channel
 
-        self.buffer = b''
+        # 预分配并重复使用的接收缓冲区，self.buffer为其中已接收部分的视图
+        self._storage = bytearray(self.buffer_size)
+        self._view = memoryview(self._storage)
+        self._length = 0
         self._ready = False
 
+    @property
+    def buffer(self):
+        return self._view[:self._length]
+
+    def _ensure_capacity(self, n):
+        if self._length + n <= len(self._storage):
+            return
+
+        # 已交出的视图仍指向旧缓冲区，因此扩容时分配新的缓冲区而不是原地调整
+        storage = bytearray(max(len(self._storage) * 2, self._length + n))
+        storage[:self._length] = self._view[:self._length]
+        self._storage = storage
+        self._view = memoryview(storage)
+
     def get_response_unit_id(self):
         raise NotImplementedError
 
@@ -26,14 +52,32 @@ class BasicFramer:
         raise NotImplementedError
 
     def push(self, data):
-        self.buffer += data
+        n = len(data)
+        self._ensure_capacity(n)
+        self._view[self._length:self._length + n] = data
+        self._length += n
+
+    def receive_buffer(self, n):
+        """返回可直接写入n字节数据的缓冲区视图，写入后需调用received"""
+        self._ensure_capacity(n)
+        return self._view[self._length:self._length + n]
+
+    def received(self, n):
+        """确认已通过receive_buffer写入n字节数据"""
+        self._length += n
+
+    def load_response(self, data):
+        """装入一个完整的应答帧"""
+        self.reset()
+        self.push(data)
+        self._ready = True
 
     def build_request_adu(self, request_pdu, unit_id):
         """return <ADU object>"""
         raise NotImplementedError
 
     def reset(self):
-        self.buffer = b''
+        self._length = 0
         self._ready = False
 
     def response_need_bytes_count(self, request_adu):
@@ -44,6 +88,10 @@ class BasicFramer:
         """判定数据帧是否接收完成"""
         raise NotImplementedError
 
+    def is_stale_response(self, request_adu):
+        """已收齐的应答帧是否属于之前的请求(如超时请求迟到的应答)，是则应丢弃并继续接收"""
+        return False
+
     def get_response_adu(self, request_adu):
         """返回ADU"""
         raise NotImplementedError
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import binascii
+import struct
+import xmodbus.framer as framer
+import xmodbus.adu as adu
+import xmodbus.common as common
+import xmodbus.utilities as utilities
+
+
+# 帧起始符和结束符
+FRAME_START = b':'
+FRAME_END = b'\r\n'
+
+
+class AduRequest(adu.BasicADURequest):
+    def encode(self):
+        frame = b''.join([struct.pack('B', self.unit_id), self.pdu.encode()])
+        lrc = struct.pack('B', utilities.computeLRC(frame))
+        return b''.join([FRAME_START, binascii.hexlify(frame + lrc).upper(), FRAME_END])
+
+    def make_response_pdu(self, the_framer):
+        fx = the_framer.get_response_function_code()
+        data = the_framer.get_response_pdu_data()
+        return self.pdu.make_response_pdu_pair(fx, data)
+
+
+class AduResponseSuccess(adu.AduResponseSuccess):
+    pass
+
+
+class AduResponseError(adu.AduResponseError):
+    pass
+
+
+class AsciiFramer(framer.BasicFramer):
+    """modbus ASCII帧
+
+    帧格式为 ':' + 十六进制字符(从站地址 | PDU | LRC) + CRLF。
+    接收到的字符按块解码后存入接收缓冲区，self.buffer中是解码后的二进制数据(从站地址 | PDU | LRC)，
+    ':'之前的字符被丢弃，块边界上落单的半个字节留到下一块解码。
+    """
+    def __init__(self, client, channel):
+        super().__init__(client, channel)
+        # 收到的原始字符的暂存区，供receive_buffer直接写入
+        self._raw = bytearray(self.buffer_size * 2 + 3)
+        self._raw_view = memoryview(self._raw)
+        self._started = False
+        # 上一块末尾落单的半个字节
+        self._odd = b''
+        # 已收到的结束符字符数
+        self._tail = 0
+
+    def get_response_unit_id(self):
+        assert len(self.buffer) > 0, 'len(self.buffer) need > 0'
+        return self.buffer[0]
+
+    def get_response_function_code(self):
+        assert len(self.buffer) > 1, 'len(self.buffer) need > 1'
+        return self.buffer[1]
+
+    def get_response_pdu_data(self):
+        assert self._ready, 'need self._ready == True'
+        return self.buffer[2:-1]
+
+    def is_response_with_error(self):
+        if self.get_response_function_code() & 0x80:
+            return True
+        return False
+
+    def build_request_adu(self, request_pdu, unit_id):
+        return AduRequest(request_pdu, unit_id)
+
+    def reset(self):
+        super().reset()
+        self._started = False
+        self._odd = b''
+        self._tail = 0
+
+    def _push_hex(self, data):
+        if self._odd:
+            data = self._odd + data
+        if len(data) & 1:
+            self._odd = data[-1:]
+            data = data[:-1]
+        else:
+            self._odd = b''
+
+        try:
+            super().push(binascii.a2b_hex(data))
+        except (binascii.Error, ValueError):
+            raise common.XModbusError('非法的ASCII帧字符')
+
+    def push(self, data):
+        data = bytes(data)
+        while data and not self._ready:
+            if not self._started:
+                index = data.find(FRAME_START)
+                if index < 0:
+                    return
+                self._started = True
+                data = data[index + 1:]
+                continue
+
+            if self._tail == 0:
+                index = data.find(FRAME_END[:1])
+                if index < 0:
+                    self._push_hex(data)
+                    return
+                self._push_hex(data[:index])
+                if self._odd:
+                    raise common.XModbusError('ASCII帧字符数不是偶数')
+                data = data[index + 1:]
+                self._tail = 1
+                continue
+
+            if data[0] != FRAME_END[1]:
+                raise common.XModbusError('ASCII帧结束符错误')
+            self._tail = 2
+            self._ready = True
+
+    def receive_buffer(self, n):
+        """返回可直接写入n个字符的缓冲区视图，写入后需调用received"""
+        if n > len(self._raw):
+            self._raw = bytearray(n)
+            self._raw_view = memoryview(self._raw)
+        return self._raw_view[:n]
+
+    def received(self, n):
+        """确认已通过receive_buffer写入n个字符，解码后存入接收缓冲区"""
+        self.push(self._raw_view[:n])
+
+    def load_response(self, data):
+        """装入一个完整的应答帧，data为解码后的二进制数据(从站地址 | PDU | LRC)"""
+        super().load_response(data)
+        self._started = True
+        self._tail = 2
+
+    def is_response_ready(self, request_adu):
+        return self._ready
+
+    def response_need_bytes_count(self, request_adu):
+        """返回当前需要接收的字符数"""
+        if self._ready:
+            return 0
+
+        if self._tail:
+            return 2 - self._tail
+
+        # address | fx-code | DATA | LRC
+        received = len(self.buffer)
+        if received < 2:
+            total = 2
+        else:
+            correct_pdu_data_count, incorrect_pdu_data_count = request_adu.get_response_pdu_data_length()
+            if self.is_response_with_error():
+                total = 2 + incorrect_pdu_data_count + 1
+            else:
+                total = 2 + correct_pdu_data_count + 1
+
+        if received >= total:
+            # 二进制数据已收齐，只差结束符
+            return 2
+
+        head = 0 if self._started else 1
+        return head + (total - received) * 2 - len(self._odd)
+
+    def check_response(self, request_adu):
+        """校验应答帧的LRC、从站地址、功能码，不一致时抛出异常"""
+        frame = self.buffer
+        if len(frame) < 3:
+            raise common.XModbusError('ASCII帧长度错误: {}'.format(len(frame)))
+        if not utilities.checkLRC(frame[:-1], frame[-1]):
+            raise common.XModbusChecksumError('LRC校验错误')
+
+        unit_id = self.get_response_unit_id()
+        if unit_id != request_adu.unit_id:
+            raise common.XModbusResponseError('从站地址不匹配: {} != {}'.format(unit_id, request_adu.unit_id))
+
+        fx = self.get_response_function_code() & 0x7F
+        if fx != request_adu.pdu.fx:
+            raise common.XModbusResponseError('功能码不匹配: {} != {}'.format(fx, request_adu.pdu.fx))
+
+    def get_response_adu(self, request_adu):
+        self.check_response(request_adu)
+        response_pdu = request_adu.make_response_pdu(self)
+
+        if self.is_response_with_error():
+            return AduResponseError(request_adu, response_pdu)
+
+        return AduResponseSuccess(request_adu, response_pdu)
@@ -3,6 +3,7 @@
 import struct
 import xmodbus.framer as framer
 import xmodbus.adu as adu
+import xmodbus.common as common
 import xmodbus.utilities as utilities
 
 
@@ -30,6 +31,8 @@ class AduResponseError(adu.AduResponseError):
 
 class RTUFramer(framer.BasicFramer):
     """"""
+    frame_by_silence = True
+
     def get_response_unit_id(self):
         assert len(self.buffer) > 0, 'len(self.buffer) need > 0'
         return self.buffer[0]
@@ -79,7 +82,23 @@ class RTUFramer(framer.BasicFramer):
             self._ready = True
         return need
 
+    def check_response(self, request_adu):
+        """校验应答帧的CRC、从站地址、功能码，不一致时抛出异常"""
+        frame = self.buffer
+        crc = struct.unpack('>H', frame[-2:])[0]
+        if not utilities.checkCRC(frame[:-2], crc):
+            raise common.XModbusChecksumError('CRC校验错误')
+
+        unit_id = self.get_response_unit_id()
+        if unit_id != request_adu.unit_id:
+            raise common.XModbusResponseError('从站地址不匹配: {} != {}'.format(unit_id, request_adu.unit_id))
+
+        fx = self.get_response_function_code() & 0x7F
+        if fx != request_adu.pdu.fx:
+            raise common.XModbusResponseError('功能码不匹配: {} != {}'.format(fx, request_adu.pdu.fx))
+
     def get_response_adu(self, request_adu):
+        self.check_response(request_adu)
         response_pdu = request_adu.make_response_pdu(self)
 
         if self.is_response_with_error():
@@ -1,8 +1,69 @@
 # -*- coding: utf-8 -*-
 # author: lijie
+import collections
 import struct
 import xmodbus.framer as framer
 import xmodbus.adu as adu
+import xmodbus.common as common
+
+
+# MBAP头长度: Transaction Identifier(2) + Protocol Identifier(2) + Length(2) + Unit Identifier(1)
+MBAP_HEADER_LENGTH = 7
+# Length字段取值范围: Unit Identifier(1) + PDU(1~253)
+MBAP_MIN_LENGTH = 2
+MBAP_MAX_LENGTH = 254
+
+# 一个完整的MBAP帧，adu为整帧数据
+MBAPFrame = collections.namedtuple('MBAPFrame', ('transaction_identifier', 'unit_id', 'adu'))
+
+
+class MBAPDecoder:
+    """MBAP流解码器，按照MBAP头中的长度字段从字节流中切分出完整的帧
+
+    返回的帧数据是内部缓冲区的视图，内部缓冲区只会被替换而不会被原地修改，因此视图长期有效。
+    """
+    def __init__(self):
+        self._buffer = bytearray()
+        self._offset = 0
+
+    def __len__(self):
+        """尚未解码的字节数"""
+        return len(self._buffer) - self._offset
+
+    def reset(self):
+        self._buffer = bytearray()
+        self._offset = 0
+
+    def feed(self, data):
+        """送入接收到的数据"""
+        if self._offset:
+            self._buffer = self._buffer[self._offset:]
+            self._offset = 0
+        self._buffer += data
+
+    def frames(self):
+        """返回缓冲区中所有完整的帧[MBAPFrame, ...]，协议标识符或长度字段错误时抛出XModbusError"""
+        frames = list()
+        buffer = self._buffer
+        size = len(buffer)
+        offset = self._offset
+        view = memoryview(buffer)
+        while size - offset >= MBAP_HEADER_LENGTH:
+            tid, pid, length, unit_id = struct.unpack_from('>HHHB', buffer, offset)
+            if pid != 0:
+                raise common.XModbusError('MBAP协议标识符错误: {}'.format(pid))
+            if not MBAP_MIN_LENGTH <= length <= MBAP_MAX_LENGTH:
+                raise common.XModbusError('MBAP长度字段错误: {}'.format(length))
+
+            end = offset + 6 + length
+            if end > size:
+                break
+
+            frames.append(MBAPFrame(tid, unit_id, view[offset:end]))
+            offset = end
+
+        self._offset = offset
+        return frames
 
 
 class AduRequest(adu.BasicADURequest):
@@ -37,9 +98,20 @@ class AduResponseError(adu.AduResponseError):
 
 class SocketFramer(framer.BasicFramer):
     """"""
+    support_pipelining = True
+    # 迟到的应答按事务标识符丢弃，发送请求前不必清空通道
+    discard_stale_input = False
+    # 流水线模式下单次从通道读取的最大字节数
+    read_size = 4096
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.transaction_identifier = 0
+        self.decoder = MBAPDecoder()
+
+    def get_response_transaction_identifier(self):
+        assert len(self.buffer) >= 2, 'len(self.buffer) need >= 2'
+        return struct.unpack('>H', self.buffer[:2])[0]
 
     def get_response_unit_id(self):
         assert len(self.buffer) >= 7, 'len(self.buffer) need >= 7'
@@ -71,11 +143,6 @@ class SocketFramer(framer.BasicFramer):
         return self._ready
 
     def response_need_bytes_count(self, request_adu):
-        # address | fx-code
-        if len(self.buffer) < 8:
-            return 8 - len(self.buffer)
-
-        correct_pdu_data_count, incorrect_pdu_data_count = request_adu.get_response_pdu_data_length()
         # total:
         # +---------+--------------------------
         # +         +  Transaction Identifier    2 byte
@@ -85,24 +152,57 @@ class SocketFramer(framer.BasicFramer):
         # +---------+--------------------------
         # +         +      FX     1byte
         # +  PDU    +
-        # +         +     DATA    correct_pdu_data_count or incorrect_pdu_data_count
+        # +         +     DATA    Length - 2
         # +---------+-------------------------
-        # +  CRC    +             2byte
-        # +---------+--------------------------
-        if self.is_response_with_error():
-            pdu_data_length = incorrect_pdu_data_count
-        else:
-            pdu_data_length = correct_pdu_data_count
+        if len(self.buffer) < MBAP_HEADER_LENGTH:
+            return MBAP_HEADER_LENGTH - len(self.buffer)
+
+        pid, length = struct.unpack('>HH', self.buffer[2:6])
+        if pid != 0:
+            raise common.XModbusError('MBAP协议标识符错误: {}'.format(pid))
+        if not MBAP_MIN_LENGTH <= length <= MBAP_MAX_LENGTH:
+            raise common.XModbusError('MBAP长度字段错误: {}'.format(length))
 
-        need = 8 + pdu_data_length - len(self.buffer)
+        need = 6 + length - len(self.buffer)
         if need == 0:
             self._ready = True
         return need
 
+    def is_stale_response(self, request_adu):
+        """逐个请求应答时同一时刻只有一个请求在途，事务标识符与请求不同的应答都是之前超时请求迟到的应答
+
+        仲裁器会按优先级调整请求的执行顺序，先执行的请求的事务标识符可能更大，不能按大小判断
+        """
+        return self.get_response_transaction_identifier() != request_adu.transaction_identifier
+
+    def check_response(self, request_adu):
+        """校验应答帧的事务标识符、从站地址、功能码与请求一致，不一致时抛出XModbusResponseError"""
+        tid = self.get_response_transaction_identifier()
+        if tid != request_adu.transaction_identifier:
+            raise common.XModbusResponseError('事务标识符不匹配: {} != {}'.format(tid, request_adu.transaction_identifier))
+
+        unit_id = self.get_response_unit_id()
+        if unit_id != request_adu.unit_id:
+            raise common.XModbusResponseError('从站地址不匹配: {} != {}'.format(unit_id, request_adu.unit_id))
+
+        fx = self.get_response_function_code() & 0x7F
+        if fx != request_adu.pdu.fx:
+            raise common.XModbusResponseError('功能码不匹配: {} != {}'.format(fx, request_adu.pdu.fx))
+
     def get_response_adu(self, request_adu):
+        self.check_response(request_adu)
         response_pdu = request_adu.make_response_pdu(self)
 
         if self.is_response_with_error():
             return AduResponseError(request_adu, response_pdu)
 
         return AduResponseSuccess(request_adu, response_pdu)
+
+    async def aio_read_response_frames(self):
+        """从通道读入数据，返回其中所有完整的应答帧[MBAPFrame, ...]"""
+        data = await self.channel.aio_read(self.read_size)
+        if len(data) == 0:
+            raise common.XModbusError('通道已关闭')
+
+        self.decoder.feed(data)
+        return self.decoder.frames()
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import asyncio
+import collections
+import logging
+import struct
+import xmodbus.common as common
+import xmodbus.pdu as pdu
+from xmodbus.framer.framer_rtu import RTUFramer
+from xmodbus.framer.framer_socket import MBAPDecoder
+
+
+_logger = logging.getLogger()
+
+# 目标设备无应答
+GATEWAY_TARGET_FAILED = 0x0B
+
+# 可以合并的读请求功能码
+_read_function_codes = {0x01, 0x02, 0x03, 0x04}
+
+
+class GatewayStats:
+    """网关统计"""
+    fields = ('connections', 'requests', 'merged', 'bus_requests', 'timeouts', 'errors')
+
+    def __init__(self):
+        self.connections = 0
+        self.requests = 0
+        self.merged = 0
+        self.bus_requests = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in self.fields)
+
+
+class BusRequest:
+    """一个等待在总线上执行的请求，相同的读请求合并后共享同一个BusRequest"""
+    def __init__(self, unit_id, request_pdu, pdu_data):
+        self.unit_id = unit_id
+        self.request_pdu = request_pdu
+        self.key = (unit_id, bytes(pdu_data))
+        # [(protocol, transaction identifier), ...]
+        self.waiters = list()
+
+
+class GatewayProtocol(asyncio.Protocol):
+    """一个modbus/TCP主站连接"""
+    def __init__(self, gateway):
+        self.gateway = gateway
+        self.transport = None
+        self.decoder = MBAPDecoder()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.gateway.stats.connections += 1
+
+    def connection_lost(self, exc):
+        self.gateway.stats.connections -= 1
+        self.gateway.drop_connection(self)
+        self.transport = None
+
+    def data_received(self, data):
+        self.decoder.feed(data)
+        try:
+            frames = self.decoder.frames()
+        except common.XModbusError as e:
+            _logger.warning('close connection: {}'.format(e))
+            self.transport.close()
+            return
+
+        for frame in frames:
+            self.gateway.submit(self, frame)
+
+    def send_response(self, tid, unit_id, response_pdu):
+        if self.transport is None or self.transport.is_closing():
+            return
+        mbap = struct.pack('>HHHB', tid, 0, len(response_pdu) + 1, unit_id)
+        self.transport.write(b''.join([mbap, response_pdu]))
+
+
+class AioModbusGateway:
+    """modbus/TCP转RTU网关
+
+    接受多个modbus/TCP主站的连接，将请求转换为RTU帧后逐个在同一条半双工总线上执行，
+    应答按原事务标识符返回给对应的主站。各连接的请求轮流上总线，一个繁忙的主站不会挤占其它主站；
+    排队中的相同读请求只在总线上执行一次，应答同时返回给所有请求方；连接自己还有排队中的写同一从站的请求时，
+    其读请求不与其它请求合并，保证同一连接先写后读时读到写入后的值。
+    """
+    def __init__(self, channel, host=None, port=None, timeout=None):
+        # 总线通道，如串口通道或透传RTU的TCP通道
+        self.channel = channel
+        self.host = host or '0.0.0.0'
+        self.port = 502 if port is None else port
+        # 总线上单个请求的超时时间，单位秒
+        self.timeout = timeout or 1
+        self.framer = RTUFramer(self, channel)
+        self.stats = GatewayStats()
+
+        # protocol -> deque([BusRequest, ...])
+        self._queues = dict()
+        # 轮流上总线的连接顺序
+        self._active = collections.deque()
+        # 排队中的读请求, key -> BusRequest
+        self._reads = dict()
+        self._wakeup = None
+        self._server = None
+        self._bus_task = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        await self.channel.aio_open(self)
+        self._server = await loop.create_server(lambda: GatewayProtocol(self), self.host, self.port)
+        self._bus_task = asyncio.create_task(self._run_bus())
+        return self
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        await self._server.serve_forever()
+
+    def close(self):
+        if self._server:
+            self._server.close()
+            self._server = None
+        if self._bus_task:
+            self._bus_task.cancel()
+            self._bus_task = None
+        self.channel.close()
+
+    def submit(self, protocol, frame):
+        """接收一个主站请求帧"""
+        self.stats.requests += 1
+        pdu_data = frame.adu[7:]
+        try:
+            request_pdu = pdu.decode_request_pdu(pdu_data)
+        except common.XModbusExceptionError as e:
+            protocol.send_response(frame.transaction_identifier, frame.unit_id,
+                                   pdu.encode_exception_pdu(pdu_data[0], e.code))
+            return
+
+        bus_request = None
+        key = (frame.unit_id, bytes(pdu_data))
+        if request_pdu.fx in _read_function_codes and not self._has_queued_write(protocol, frame.unit_id):
+            bus_request = self._reads.get(key)
+            if bus_request is not None:
+                self.stats.merged += 1
+
+        if bus_request is None:
+            bus_request = BusRequest(frame.unit_id, request_pdu, pdu_data)
+            if request_pdu.fx in _read_function_codes:
+                self._reads[key] = bus_request
+            queue = self._queues.get(protocol)
+            if queue is None:
+                queue = self._queues[protocol] = collections.deque()
+                self._active.append(protocol)
+            queue.append(bus_request)
+            self._wakeup.set()
+
+        bus_request.waiters.append((protocol, frame.transaction_identifier))
+
+    def _has_queued_write(self, protocol, unit_id):
+        """连接是否有排队中的写该从站(或广播)的请求"""
+        for bus_request in self._queues.get(protocol, ()):
+            if bus_request.request_pdu.fx not in _read_function_codes and bus_request.unit_id in (unit_id, 0):
+                return True
+        return False
+
+    def drop_connection(self, protocol):
+        """连接断开，丢弃其排队中的请求"""
+        queue = self._queues.pop(protocol, None)
+        if queue is None:
+            return
+
+        self._active.remove(protocol)
+        for bus_request in queue:
+            bus_request.waiters = [w for w in bus_request.waiters if w[0] is not protocol]
+            if bus_request.waiters:
+                # 其它连接合并到了该请求上，转移到其中一个连接的队列
+                self._enqueue(bus_request.waiters[0][0], bus_request)
+            else:
+                self._reads.pop(bus_request.key, None)
+
+    def _enqueue(self, protocol, bus_request):
+        queue = self._queues.get(protocol)
+        if queue is None:
+            queue = self._queues[protocol] = collections.deque()
+            self._active.append(protocol)
+        queue.append(bus_request)
+
+    def _next_request(self):
+        protocol = self._active.popleft()
+        queue = self._queues[protocol]
+        bus_request = queue.popleft()
+        if queue:
+            self._active.append(protocol)
+        else:
+            del self._queues[protocol]
+        return bus_request
+
+    async def _run_bus(self):
+        while True:
+            while not self._active:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            bus_request = self._next_request()
+            # 已上总线的读请求不再合并，之后到达的请求应读到之后的值
+            if self._reads.get(bus_request.key) is bus_request:
+                del self._reads[bus_request.key]
+            response_pdu = await self._transact(bus_request)
+
+            if response_pdu is None:
+                continue
+
+            for protocol, tid in bus_request.waiters:
+                protocol.send_response(tid, bus_request.unit_id, response_pdu)
+
+    async def _transact(self, bus_request):
+        """在总线上执行请求，返回应答PDU，广播请求返回None"""
+        self.stats.bus_requests += 1
+        request_adu = self.framer.build_request_adu(bus_request.request_pdu, bus_request.unit_id)
+        try:
+            if self.framer.discard_stale_input:
+                # 丢弃之前超时请求迟到的应答，避免被当作本次请求的应答
+                await self.channel.aio_discard_input()
+            if bus_request.unit_id == 0:
+                await self.channel.aio_write(request_adu.encode())
+                return None
+            return await asyncio.wait_for(self._process_adu_request(request_adu), self.timeout)
+        except asyncio.TimeoutError:
+            self.stats.timeouts += 1
+            return pdu.encode_exception_pdu(bus_request.request_pdu.fx, GATEWAY_TARGET_FAILED)
+        except Exception as e:
+            _logger.error('bus request failed: {}'.format(e))
+            self.stats.errors += 1
+            return pdu.encode_exception_pdu(bus_request.request_pdu.fx, GATEWAY_TARGET_FAILED)
+
+    async def _process_adu_request(self, request_adu):
+        await self.channel.aio_write(request_adu.encode())
+
+        silence = self.channel.frame_silence if self.framer.frame_by_silence else None
+        self.framer.reset()
+        while True:
+            need = self.framer.response_need_bytes_count(request_adu)
+            if need <= 0:
+                break
+
+            if silence is not None and len(self.framer.buffer) > 0:
+                try:
+                    data = await asyncio.wait_for(self.channel.aio_read(need), silence)
+                except asyncio.TimeoutError:
+                    raise common.XModbusError('应答帧不完整')
+            else:
+                data = await self.channel.aio_read(need)
+            if len(data) == 0:
+                raise common.XModbusError('通道已关闭')
+
+            self.framer.push(data)
+
+        self.framer.check_response(request_adu)
+        # unit-id | PDU | CRC
+        return bytes(self.framer.buffer[1:-2])
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import logging
+import math
+import time
+import xmodbus.common as common
+
+
+_logger = logging.getLogger()
+
+# 直方图每个2的幂区间内的子桶数(2 ** SUB_BITS)，相对误差不超过 1 / 2 ** SUB_BITS
+SUB_BITS = 5
+_SUB_COUNT = 1 << SUB_BITS
+
+# 计时使用的时钟
+clock = time.perf_counter
+
+
+class Histogram:
+    """对数线性分桶的延迟直方图(HDR方式)
+
+    以微秒为单位记录，小于32us的值精确记录，更大的值按2的幂分段，每段再均分为32个子桶，
+    记录只是一次整数运算和列表计数，分位数误差约3%。
+    """
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.counts = list()
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    @staticmethod
+    def _index(value):
+        if value < _SUB_COUNT:
+            return value
+        shift = value.bit_length() - SUB_BITS - 1
+        return (shift + 1) * _SUB_COUNT + (value >> shift) - _SUB_COUNT
+
+    @staticmethod
+    def _highest(index):
+        """返回桶内的最大值"""
+        if index < _SUB_COUNT:
+            return index
+        shift = index // _SUB_COUNT - 1
+        mantissa = index % _SUB_COUNT + _SUB_COUNT
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, seconds):
+        """记录一个以秒为单位的时间"""
+        value = int(seconds * 1e6)
+        if value < 0:
+            value = 0
+        index = self._index(value)
+        counts = self.counts
+        if index >= len(counts):
+            counts.extend([0] * (index + 1 - len(counts)))
+        counts[index] += 1
+
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """返回p(0~1)分位的值，单位微秒"""
+        if not self.count:
+            return None
+        target = max(1, math.ceil(p * self.count))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return min(self._highest(index), self.max)
+        return self.max
+
+    def merge(self, other):
+        """合并另一个直方图"""
+        if len(other.counts) > len(self.counts):
+            self.counts.extend([0] * (len(other.counts) - len(self.counts)))
+        for index, n in enumerate(other.counts):
+            self.counts[index] += n
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'min': self.min,
+            'mean': round(self.total / self.count, 1) if self.count else None,
+            'p50': self.percentile(0.5),
+            'p99': self.percentile(0.99),
+            'p999': self.percentile(0.999),
+            'max': self.max,
+        }
+
+
+class RequestTrace:
+    """一个请求的时间线，时刻均为clock()的返回值，未经过的阶段为None"""
+    __slots__ = ('unit_id', 'fx', 'started', 'dispatched', 'encoded', 'written', 'first_byte', 'finished',
+                 'bytes_out', 'bytes_in', 'retries')
+
+    def __init__(self, unit_id, fx):
+        self.unit_id = unit_id
+        self.fx = fx
+        self.started = clock()
+        # 排队结束开始执行的时刻
+        self.dispatched = None
+        self.encoded = None
+        self.written = None
+        self.first_byte = None
+        self.finished = None
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.retries = 0
+
+    @property
+    def latency(self):
+        """总耗时，单位秒"""
+        return self.finished - self.started
+
+
+class RequestMetrics:
+    """同一从站同一功能码的请求统计"""
+    histogram_fields = ('queue', 'encode', 'write', 'first_byte', 'latency')
+    counter_fields = ('requests', 'responses', 'exceptions', 'timeouts', 'errors', 'retries',
+                      'bytes_out', 'bytes_in')
+
+    def __init__(self):
+        # 排队耗时、编码耗时、发送耗时、发送完成到收到第一个字节、总耗时
+        self.queue = Histogram()
+        self.encode = Histogram()
+        self.write = Histogram()
+        self.first_byte = Histogram()
+        self.latency = Histogram()
+
+        self.requests = 0
+        # 成功应答数
+        self.responses = 0
+        # 异常应答数(从站返回异常码)
+        self.exceptions = 0
+        self.timeouts = 0
+        # 校验错误、连接断开等其它错误
+        self.errors = 0
+        self.retries = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+
+    def record(self, trace, response, error):
+        self.requests += 1
+        self.retries += trace.retries
+        self.bytes_out += trace.bytes_out
+        self.bytes_in += trace.bytes_in
+
+        if error is None:
+            if response.is_success():
+                self.responses += 1
+            else:
+                self.exceptions += 1
+        elif isinstance(error, common.XModbusTimeoutError):
+            self.timeouts += 1
+        else:
+            self.errors += 1
+
+        if trace.dispatched is not None:
+            self.queue.record(trace.dispatched - trace.started)
+            if trace.encoded is not None:
+                self.encode.record(trace.encoded - trace.dispatched)
+                if trace.written is not None:
+                    self.write.record(trace.written - trace.encoded)
+                    if trace.first_byte is not None:
+                        self.first_byte.record(trace.first_byte - trace.written)
+        self.latency.record(trace.finished - trace.started)
+
+    def merge(self, other):
+        for name in self.histogram_fields:
+            getattr(self, name).merge(getattr(other, name))
+        for name in self.counter_fields:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def as_dict(self):
+        result = dict((name, getattr(self, name)) for name in self.counter_fields)
+        for name in self.histogram_fields:
+            result[name + '_us'] = getattr(self, name).as_dict()
+        return result
+
+
+class Metrics:
+    """客户端请求统计
+
+    通过ModbusClient(metrics=Metrics())启用，按(unit_id, 功能码)分别统计各阶段耗时直方图、
+    收发字节数、重试、异常应答和错误次数；每个请求完成后依次调用hooks中的回调
+    callback(trace, response, error)，请求失败时response为None。未启用时客户端不做任何计时。
+    """
+    def __init__(self, hooks=None):
+        self.hooks = list(hooks or [])
+        # (unit_id, fx) -> RequestMetrics
+        self.requests = dict()
+
+    def add_hook(self, callback):
+        self.hooks.append(callback)
+
+    def remove_hook(self, callback):
+        self.hooks.remove(callback)
+
+    def begin(self, request_adu):
+        """开始记录一个请求，返回RequestTrace"""
+        return RequestTrace(request_adu.unit_id, request_adu.pdu.fx)
+
+    def finish(self, trace, response=None, error=None):
+        """请求完成，记录统计并调用回调"""
+        trace.finished = clock()
+        key = (trace.unit_id, trace.fx)
+        metrics = self.requests.get(key)
+        if metrics is None:
+            metrics = self.requests[key] = RequestMetrics()
+        metrics.record(trace, response, error)
+
+        for callback in self.hooks:
+            try:
+                callback(trace, response, error)
+            except Exception as e:
+                _logger.error('metrics hook {} failed: {}'.format(callback, e))
+
+    def get(self, unit_id, fx):
+        """返回指定从站、功能码的统计，没有记录时返回None"""
+        return self.requests.get((unit_id, fx))
+
+    def total(self):
+        """返回所有请求汇总的统计"""
+        total = RequestMetrics()
+        for metrics in self.requests.values():
+            total.merge(metrics)
+        return total
+
+    def reset(self):
+        self.requests.clear()
+
+    def as_dict(self):
+        """{'unit_id/fx': {...}, ...}"""
+        return dict(('{}/{}'.format(unit_id, fx), metrics.as_dict())
+                    for (unit_id, fx), metrics in sorted(self.requests.items()))
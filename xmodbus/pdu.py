@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
 # author: lijie
+import array
 import math
 import struct
+import sys
+import xmodbus.common as common
+import xmodbus.utilities as utilities
 
 
 class PDURequest:
@@ -28,6 +32,15 @@ class PDURequest:
     def response_pdu_pair(self):
         raise NotImplementedError
 
+    @classmethod
+    def from_bytes(cls, data):
+        """由请求PDU字节序列构造请求对象，用于服务端"""
+        raise NotImplementedError
+
+    def execute(self, datastore, unit_id):
+        """在数据存储上执行请求，返回应答PDU字节序列，用于服务端"""
+        raise NotImplementedError
+
     def make_response_pdu_pair(self, response_pdu_fx, response_pud_data):
         if response_pdu_fx & 0x80:
             return PDUResponseError(self, response_pdu_fx, response_pud_data)
@@ -39,7 +52,8 @@ class PDUResponse:
     def __init__(self, request_pdu, pdu_fx, pdu_data):
         self.request = request_pdu
         self.fx = pdu_fx
-        self.data = pdu_data
+        # 帧产生器交出的是接收缓冲区的视图，缓冲区会被下一帧复用，应答须持有自己的数据
+        self.data = bytes(pdu_data)
 
     def as_dict(self):
         raise NotImplementedError
@@ -55,6 +69,31 @@ class PDUResponseError(PDUResponse):
         return {'fx': (self.fx & 0x7F), 'code': self.error_code}
 
 
+def _unpack_request(fmt, data):
+    """解码请求PDU中功能码之后的字段"""
+    try:
+        return struct.unpack_from(fmt, data, 1)
+    except struct.error:
+        raise common.XModbusExceptionError(common.ILLEGAL_DATA_VALUE, '请求长度错误')
+
+
+def _execute_read_bits(request, datastore, unit_id, table):
+    if not 1 <= request.quantity <= common.MAX_READ_BITS:
+        raise common.XModbusExceptionError(common.ILLEGAL_DATA_VALUE)
+
+    bits = datastore.read(unit_id, table, request.address, request.quantity)
+    packed = utilities.pack_bits(bits)
+    return b''.join([struct.pack('>BB', request.fx, len(packed)), packed])
+
+
+def _execute_read_registers(request, datastore, unit_id, table):
+    if not 1 <= request.quantity <= common.MAX_READ_REGISTERS:
+        raise common.XModbusExceptionError(common.ILLEGAL_DATA_VALUE)
+
+    data = datastore.read(unit_id, table, request.address, request.quantity)
+    return b''.join([struct.pack('>BB', request.fx, len(data)), data])
+
+
 class ReadCoilsRequest(PDURequest):
     """读线圈"""
     fx = 0x01
@@ -86,33 +125,52 @@ class ReadCoilsRequest(PDURequest):
     def response_pdu_pair(self):
         return ReadCoilsResponse
 
+    @classmethod
+    def from_bytes(cls, data):
+        address, quantity = _unpack_request('>HH', data)
+        return cls(address, quantity)
 
-class ReadCoilsResponse(PDUResponse):
-    """读线圈应答"""
+    def execute(self, datastore, unit_id):
+        return _execute_read_bits(self, datastore, unit_id, common.COILS)
+
+
+class ReadBitsResponse(PDUResponse):
+    """读位应答"""
     def __init__(self, request_pdu, pdu_fx, pdu_data):
         super().__init__(request_pdu, pdu_fx, pdu_data)
+        # 每个位占一个字节，取值0或1
+        self.bits = utilities.unpack_bits(self.data[1:], self.request.quantity)
+        self._dict = None
 
-    def as_dict(self):
-        coils = dict()
+    @property
+    def address(self):
+        """起始地址"""
+        return self.request.address
 
-        begin = self.request.address
-        quantity = self.request.quantity
+    def as_bits(self):
+        """返回位数组，每个位占一个字节，取值0或1"""
+        return self.bits
 
-        bits_list = list()
-        for b in self.data[1:]:
-            bits = bin(b)[2:][::-1]
-            bits = bits + '0' * (8 - len(bits))
-            bits_list.append(bits)
+    def as_bools(self):
+        """返回[True/False, ...]"""
+        return list(map(bool, self.bits))
 
-        for b in ''.join(bits_list):
-            if quantity == 0:
-                break
+    def as_numpy(self):
+        """返回numpy.bool_视图，需要安装numpy"""
+        import numpy
+        return numpy.frombuffer(self.bits, dtype=numpy.bool_)
+
+    def as_dict(self):
+        if self._dict is None:
+            begin = self.request.address
+            names = ('off', 'on')
+            coils = dict(zip(range(begin, begin + len(self.bits)), map(names.__getitem__, self.bits)))
+            self._dict = {'fx': self.fx, 'data': coils}
+        return self._dict
 
-            coils[begin] = 'on' if b == '1' else 'off'
-            begin += 1
-            quantity -= 1
 
-        return {'fx': self.fx, 'data': coils}
+class ReadCoilsResponse(ReadBitsResponse):
+    """读线圈应答"""
 
 
 class ReadDiscreteInputsRequest(PDURequest):
@@ -146,33 +204,17 @@ class ReadDiscreteInputsRequest(PDURequest):
     def response_pdu_pair(self):
         return ReadDiscreteInputsResponse
 
+    @classmethod
+    def from_bytes(cls, data):
+        address, quantity = _unpack_request('>HH', data)
+        return cls(address, quantity)
 
-class ReadDiscreteInputsResponse(PDUResponse):
-    """读离散输入应答"""
-    def __init__(self, request_pdu, pdu_fx, pdu_data):
-        super().__init__(request_pdu, pdu_fx, pdu_data)
-
-    def as_dict(self):
-        coils = dict()
-
-        begin = self.request.address
-        quantity = self.request.quantity
+    def execute(self, datastore, unit_id):
+        return _execute_read_bits(self, datastore, unit_id, common.DISCRETE_INPUTS)
 
-        bits_list = list()
-        for b in self.data[1:]:
-            bits = bin(b)[2:][::-1]
-            bits = bits + '0' * (8 - len(bits))
-            bits_list.append(bits)
 
-        for b in ''.join(bits_list):
-            if quantity == 0:
-                break
-
-            coils[begin] = 'on' if b == '1' else 'off'
-            begin += 1
-            quantity -= 1
-
-        return {'fx': self.fx, 'data': coils}
+class ReadDiscreteInputsResponse(ReadBitsResponse):
+    """读离散输入应答"""
 
 
 class ReadHoldingRegistersRequest(PDURequest):
@@ -204,29 +246,58 @@ class ReadHoldingRegistersRequest(PDURequest):
     def response_pdu_pair(self):
         return ReadHoldingRegistersResponse
 
+    @classmethod
+    def from_bytes(cls, data):
+        address, quantity = _unpack_request('>HH', data)
+        return cls(address, quantity)
 
-class ReadHoldingRegistersResponse(PDUResponse):
-    """读保持寄存器应答"""
+    def execute(self, datastore, unit_id):
+        return _execute_read_registers(self, datastore, unit_id, common.HOLDING_REGISTERS)
+
+
+class ReadRegistersResponse(PDUResponse):
+    """读寄存器应答"""
     def __init__(self, request_pdu, pdu_fx, pdu_data):
-        super().__init__(request_pdu, pdu_fx, pdu_data)
+        # 寄存器值直接从接收缓冲区解码到数组中，不再保留一份原始字节数据
+        self.request = request_pdu
+        self.fx = pdu_fx
+        self.values = array.array('H')
+        self.values.frombytes(pdu_data[1:1 + self.request.quantity * 2])
+        if sys.byteorder == 'little':
+            self.values.byteswap()
+        self._dict = None
 
-    def as_dict(self):
-        registers = dict()
+    @property
+    def address(self):
+        """起始地址"""
+        return self.request.address
 
-        begin = self.request.address
-        quantity = self.request.quantity
+    @property
+    def data(self):
+        values = array.array('H', self.values)
+        if sys.byteorder == 'little':
+            values.byteswap()
+        return struct.pack('B', len(values) * 2) + values.tobytes()
 
-        fmt = '>{}H'.format(self.request.quantity)
-        values = struct.unpack(fmt, self.data[1:])
+    def as_array(self):
+        """返回寄存器值数组array('H')"""
+        return self.values
 
-        for val in values:
-            if quantity == 0:
-                break
-            registers[begin] = val
-            begin += 1
-            quantity -= 1
+    def as_numpy(self):
+        """返回寄存器值的numpy.uint16视图，需要安装numpy"""
+        import numpy
+        return numpy.frombuffer(self.values, dtype=numpy.uint16)
 
-        return {'fx': self.fx, 'data': registers}
+    def as_dict(self):
+        if self._dict is None:
+            begin = self.request.address
+            registers = dict(zip(range(begin, begin + len(self.values)), self.values))
+            self._dict = {'fx': self.fx, 'data': registers}
+        return self._dict
+
+
+class ReadHoldingRegistersResponse(ReadRegistersResponse):
+    """读保持寄存器应答"""
 
 
 class ReadInputRegisterRequest(PDURequest):
@@ -258,29 +329,17 @@ class ReadInputRegisterRequest(PDURequest):
     def response_pdu_pair(self):
         return ReadInputRegisterResponse
 
+    @classmethod
+    def from_bytes(cls, data):
+        address, quantity = _unpack_request('>HH', data)
+        return cls(address, quantity)
 
-class ReadInputRegisterResponse(PDUResponse):
-    """读输入寄存器应答"""
-    def __init__(self, request_pdu, pdu_fx, pdu_data):
-        super().__init__(request_pdu, pdu_fx, pdu_data)
-
-    def as_dict(self):
-        registers = dict()
+    def execute(self, datastore, unit_id):
+        return _execute_read_registers(self, datastore, unit_id, common.INPUT_REGISTERS)
 
-        begin = self.request.address
-        quantity = self.request.quantity
 
-        fmt = '>{}H'.format(self.request.quantity)
-        values = struct.unpack(fmt, self.data[1:])
-
-        for val in values:
-            if quantity == 0:
-                break
-            registers[begin] = val
-            begin += 1
-            quantity -= 1
-
-        return {'fx': self.fx, 'data': registers}
+class ReadInputRegisterResponse(ReadRegistersResponse):
+    """读输入寄存器应答"""
 
 
 class WriteSingleCoilRequest(PDURequest):
@@ -332,6 +391,17 @@ class WriteSingleCoilRequest(PDURequest):
     def response_pdu_pair(self):
         return WriteSingleCoilResponse
 
+    @classmethod
+    def from_bytes(cls, data):
+        address, value = _unpack_request('>HH', data)
+        if value not in {0xff00, 0x0000}:
+            raise common.XModbusExceptionError(common.ILLEGAL_DATA_VALUE)
+        return cls(address, value == 0xff00)
+
+    def execute(self, datastore, unit_id):
+        datastore.write(unit_id, common.COILS, self.address, b'\x01' if self.value == 0xff00 else b'\x00')
+        return self.encode()
+
 
 class WriteSingleCoilResponse(PDUResponse):
     """写单个线圈应答"""
@@ -376,6 +446,15 @@ class WriteSingleRegisterRequest(PDURequest):
     def response_pdu_pair(self):
         return WriteSingleRegisterResponse
 
+    @classmethod
+    def from_bytes(cls, data):
+        address, value = _unpack_request('>HH', data)
+        return cls(address, value)
+
+    def execute(self, datastore, unit_id):
+        datastore.write(unit_id, common.HOLDING_REGISTERS, self.address, struct.pack('>H', self.value))
+        return self.encode()
+
 
 class WriteSingleRegisterResponse(PDUResponse):
     """写单个寄存器应答"""
@@ -411,44 +490,32 @@ class WriteMultipleCoilsRequest(PDURequest):
 
     @staticmethod
     def _encode_coils(coils_list):
-        for idx, value in enumerate(coils_list):
-            if value in {1, 0}:
-                continue
-
-            if isinstance(value, bool):
-                if value is True:
-                    coils_list[idx] = 1
-                else:
-                    coils_list[idx] = 0
-            elif isinstance(value, str):
-                if value.lower() == 'on':
-                    coils_list[idx] = 1
-                elif value.lower() == 'off':
-                    coils_list[idx] = 0
-                else:
-                    raise ValueError('线圈值必须是True, False，1，0，`on`，`off`')
-            else:
-                raise ValueError('线圈值必须是True, False，1，0，`on`，`off`')
-
-        str_coils = ''.join([str(v) for v in coils_list])
-        padding = '0' * (8 - (len(str_coils) % 8))
-        coils = ''.join([str_coils, padding])[::-1]
-        bx = list()
-        for ib in range(int(len(coils)/8)):
-            x = struct.pack('B', int(coils[ib * 8: ib * 8 + 8], 2))
-            bx.append(x)
-        return b''.join(bx)[::-1]
+        try:
+            return utilities.pack_bits(coils_list)
+        except ValueError:
+            raise ValueError('线圈值必须是True, False，1，0，`on`，`off`')
 
     def encode(self):
-        output = self._encode_coils(self.coils[::])
-        byte_count = math.ceil(len(self.coils)/8.0)
-        head = struct.pack('>BHHB', self.fx, self.address, len(self.coils), byte_count)
+        output = self._encode_coils(self.coils)
+        head = struct.pack('>BHHB', self.fx, self.address, len(self.coils), len(output))
         return head + output
 
     @property
     def response_pdu_pair(self):
         return WriteMultipleCoilsResponse
 
+    @classmethod
+    def from_bytes(cls, data):
+        address, quantity, byte_count = _unpack_request('>HHB', data)
+        if not 1 <= quantity <= common.MAX_WRITE_BITS or byte_count != math.ceil(quantity / 8) \
+                or len(data) != 6 + byte_count:
+            raise common.XModbusExceptionError(common.ILLEGAL_DATA_VALUE)
+        return cls(address, utilities.unpack_bits(data[6:], quantity))
+
+    def execute(self, datastore, unit_id):
+        datastore.write(unit_id, common.COILS, self.address, utilities.to_bits(self.coils))
+        return struct.pack('>BHH', self.fx, self.address, len(self.coils))
+
 
 class WriteMultipleCoilsResponse(PDUResponse):
     """写多个线圈应答"""
@@ -492,6 +559,23 @@ class WriteMultiRegistersRequest(PDURequest):
     def response_pdu_pair(self):
         return WriteMultiRegistersResponse
 
+    @classmethod
+    def from_bytes(cls, data):
+        address, quantity, byte_count = _unpack_request('>HHB', data)
+        if not 1 <= quantity <= common.MAX_WRITE_REGISTERS or byte_count != quantity * 2 \
+                or len(data) != 6 + byte_count:
+            raise common.XModbusExceptionError(common.ILLEGAL_DATA_VALUE)
+        values = array.array('H')
+        values.frombytes(data[6:])
+        if sys.byteorder == 'little':
+            values.byteswap()
+        return cls(address, values)
+
+    def execute(self, datastore, unit_id):
+        data = struct.pack('>{}H'.format(len(self.values)), *self.values)
+        datastore.write(unit_id, common.HOLDING_REGISTERS, self.address, data)
+        return struct.pack('>BHH', self.fx, self.address, len(self.values))
+
 
 class WriteMultiRegistersResponse(PDUResponse):
     """写多个寄存器应答"""
@@ -550,6 +634,32 @@ class ReadDeviceIdentificationResponse(PDUResponse):
         return {'fx': self.fx, 'data': self.data}
 
 
+# 服务端支持的请求，功能码 -> 请求类
+request_pdu_classes = dict((cls.fx, cls) for cls in (
+    ReadCoilsRequest,
+    ReadDiscreteInputsRequest,
+    ReadHoldingRegistersRequest,
+    ReadInputRegisterRequest,
+    WriteSingleCoilRequest,
+    WriteSingleRegisterRequest,
+    WriteMultipleCoilsRequest,
+    WriteMultiRegistersRequest,
+))
+
+
+def decode_request_pdu(data):
+    """将请求PDU字节序列解码为请求对象，不支持的功能码抛出XModbusExceptionError"""
+    cls = request_pdu_classes.get(data[0])
+    if cls is None:
+        raise common.XModbusExceptionError(common.ILLEGAL_FUNCTION)
+    return cls.from_bytes(data)
+
+
+def encode_exception_pdu(fx, code):
+    """返回异常应答PDU字节序列"""
+    return struct.pack('BB', fx | 0x80, code)
+
+
 if __name__ == '__main__':
     x = WriteMultipleCoilsRequest._encode_coils([1, 0, 1, 0, 0, 0, 0, 0, 1, 0])
     print(x)
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import asyncio
+import bisect
+import collections
+import xmodbus.common as common
+import xmodbus.pdu as pdu
+
+
+# 一个读需求: 从站地址，数据表，起始地址，数量
+ReadNeed = collections.namedtuple('ReadNeed', ('unit_id', 'table', 'address', 'count'))
+
+# 合并后的一个读请求
+ReadBlock = collections.namedtuple('ReadBlock', ('unit_id', 'table', 'address', 'quantity'))
+
+
+_request_classes = {
+    common.COILS: pdu.ReadCoilsRequest,
+    common.DISCRETE_INPUTS: pdu.ReadDiscreteInputsRequest,
+    common.HOLDING_REGISTERS: pdu.ReadHoldingRegistersRequest,
+    common.INPUT_REGISTERS: pdu.ReadInputRegisterRequest,
+}
+
+_bit_tables = {common.COILS, common.DISCRETE_INPUTS}
+
+
+def _table_limit(table):
+    return common.MAX_READ_BITS if table in _bit_tables else common.MAX_READ_REGISTERS
+
+
+def _gap_bytes(table, gap):
+    """多读gap个地址需要额外传输的字节数"""
+    return gap / 8.0 if table in _bit_tables else gap * 2
+
+
+class ReadPlanner:
+    """读请求规划器，将零散的读需求合并为尽量少的读请求
+
+    request_cost 为一次额外请求的代价，以应答中额外传输的字节数计，
+    两段需求之间的空洞所需多读的字节数不超过该值时，两段合并为一个请求。
+    """
+    def __init__(self, request_cost=None):
+        self.request_cost = 40 if request_cost is None else request_cost
+
+    def plan(self, needs):
+        """返回ReadPlan"""
+        needs = [ReadNeed(*need) for need in needs]
+        for need in needs:
+            if need.table not in _request_classes:
+                raise ValueError('不支持的数据表: {}'.format(need.table))
+            if need.count <= 0:
+                raise ValueError('读取数量必须大于0')
+
+        groups = collections.defaultdict(list)
+        for need in needs:
+            groups[(need.unit_id, need.table)].append((need.address, need.address + need.count))
+
+        blocks = list()
+        for (unit_id, table), ranges in sorted(groups.items()):
+            for begin, end in self._coalesce(table, sorted(ranges)):
+                blocks.append(ReadBlock(unit_id, table, begin, end - begin))
+
+        return ReadPlan(needs, blocks)
+
+    def _coalesce(self, table, ranges):
+        limit = _table_limit(table)
+        spans = list()
+        s = e = None
+        for a, b in ranges:
+            if s is None:
+                s = e = a
+            elif a > e and _gap_bytes(table, a - e) > self.request_cost:
+                spans.append((s, e))
+                s = e = a
+
+            while b - s > limit:
+                if e > s and a >= e:
+                    spans.append((s, e))
+                    s = e = a
+                else:
+                    spans.append((s, s + limit))
+                    s = e = s + limit
+
+            e = max(e, b)
+
+        if s is not None and e > s:
+            spans.append((s, e))
+        return spans
+
+
+class ReadPlan:
+    """读请求规划结果"""
+    def __init__(self, needs, blocks):
+        self.needs = needs
+        self.blocks = blocks
+
+        self._starts = collections.defaultdict(list)
+        self._indexes = collections.defaultdict(list)
+        for idx, block in enumerate(blocks):
+            self._starts[(block.unit_id, block.table)].append(block.address)
+            self._indexes[(block.unit_id, block.table)].append(idx)
+
+    def build_requests(self):
+        """返回[(request_pdu, unit_id), ...]，与blocks一一对应"""
+        return [(_request_classes[b.table](b.address, b.quantity), b.unit_id) for b in self.blocks]
+
+    def execute(self, the_client):
+        """以同步方式执行所有读请求，返回{need: values}"""
+        return self.slice(the_client.execute_many(self.build_requests()))
+
+    async def aio_execute(self, the_client):
+        """以异步方式执行所有读请求，返回{need: values}"""
+        return self.slice(await self.aio_execute_requests(the_client))
+
+    async def aio_execute_requests(self, the_client, return_exceptions=False):
+        """以异步方式执行所有读请求，返回与blocks一一对应的ADU应答
+
+        客户端以流水线方式工作时并发发出所有请求，否则逐个请求应答；
+        return_exceptions为真时请求失败的位置为其异常，否则抛出第一个异常。
+        """
+        adus = [the_client.framer.build_request_adu(request_pdu, unit_id)
+                for request_pdu, unit_id in self.build_requests()]
+        if getattr(the_client, 'pipelining', False):
+            return await asyncio.gather(*[the_client.process_adu_request(adu) for adu in adus],
+                                        return_exceptions=return_exceptions)
+
+        responses = list()
+        for adu in adus:
+            try:
+                responses.append(await the_client.process_adu_request(adu))
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                responses.append(e)
+        return responses
+
+    def slice(self, responses):
+        """将与blocks一一对应的ADU应答(或请求失败的异常)拆分给各个读需求，请求失败的需求值为None"""
+        values = [self._decode(block, response) for block, response in zip(self.blocks, responses)]
+
+        result = dict()
+        for need in self.needs:
+            result[need] = self._slice_need(need, values)
+        return result
+
+    @staticmethod
+    def _decode(block, response):
+        if isinstance(response, Exception) or not response.is_success():
+            return None
+
+        if block.table in _bit_tables:
+            return response.pdu.as_bools()
+        return response.pdu.values
+
+    def _slice_need(self, need, values):
+        key = (need.unit_id, need.table)
+        starts = self._starts[key]
+        indexes = self._indexes[key]
+
+        result = list()
+        address, end = need.address, need.address + need.count
+        pos = bisect.bisect_right(starts, address) - 1
+        while address < end:
+            block = self.blocks[indexes[pos]]
+            block_values = values[indexes[pos]]
+            if block_values is None:
+                return None
+
+            stop = min(end, block.address + block.quantity)
+            result.extend(block_values[address - block.address:stop - block.address])
+            address = stop
+            pos += 1
+        return result
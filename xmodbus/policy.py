@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import logging
+import time
+import xmodbus.common as common
+import xmodbus.pdu as pdu
+
+
+_logger = logging.getLogger()
+
+# 熔断器状态
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+# 说明从站返回了完整应答帧的错误
+_reply_errors = (common.XModbusExceptionError, common.XModbusResponseError)
+
+
+class RetryPolicy:
+    """重试策略
+
+    请求因retry_on中的错误失败时最多重试retries次，第n次重试前等待
+    min(backoff * multiplier ** (n - 1), max_backoff)秒。
+    """
+    def __init__(self, retries=None, backoff=None, multiplier=None, max_backoff=None, retry_on=None):
+        self.retries = 1 if retries is None else retries
+        self.backoff = 0.05 if backoff is None else backoff
+        self.multiplier = multiplier or 2
+        self.max_backoff = 1 if max_backoff is None else max_backoff
+        self.retry_on = retry_on or (common.XModbusTimeoutError, common.XModbusChecksumError)
+
+    def delay(self, attempt, error):
+        """第attempt(从0开始)次尝试失败后返回重试前的等待时间，不再重试时返回None"""
+        if attempt >= self.retries or not isinstance(error, self.retry_on):
+            return None
+        if isinstance(error, common.XModbusQueueTimeoutError):
+            # 请求没有发送出去，重试只会继续排队
+            return None
+        return min(self.backoff * self.multiplier ** attempt, self.max_backoff)
+
+
+class UnitState:
+    """一个从站的熔断状态"""
+    __slots__ = ('state', 'failures', 'opened_at', 'probing')
+
+    def __init__(self):
+        self.state = STATE_CLOSED
+        # 连续失败次数
+        self.failures = 0
+        self.opened_at = 0
+        self.probing = False
+
+
+def default_probe(unit_id):
+    """默认的探测请求: 读1个保持寄存器，从站返回异常应答也说明其在线"""
+    return pdu.ReadHoldingRegistersRequest(0, 1)
+
+
+class CircuitBreaker:
+    """按(通道, 从站地址)熔断
+
+    从站连续threshold次因failure_types中的错误失败后进入熔断状态，cooldown秒内对其的请求
+    直接抛出XModbusUnavailableError，不占用总线；冷却结束后由下一个请求先发送一个探测请求
+    (probe(unit_id)返回的PDU)，探测成功则恢复，失败则重新开始冷却。从站返回异常应答或与请求不匹配的完整应答帧时
+    说明其在线，连续失败次数清零。同一个熔断器可以被多个客户端共用。
+    """
+    def __init__(self, threshold=None, cooldown=None, probe=None, failure_types=None):
+        self.threshold = threshold or 3
+        self.cooldown = 10 if cooldown is None else cooldown
+        self.probe = probe or default_probe
+        self.failure_types = failure_types or (common.XModbusTimeoutError, ConnectionError)
+        # (channel, unit_id) -> UnitState
+        self._units = dict()
+
+    def state(self, key):
+        """返回(通道, 从站地址)的熔断状态"""
+        unit = self._units.get(key)
+        return unit.state if unit else STATE_CLOSED
+
+    def is_open(self, key):
+        """是否处于熔断冷却期"""
+        unit = self._units.get(key)
+        return unit is not None and unit.state == STATE_OPEN and time.monotonic() - unit.opened_at < self.cooldown
+
+    def before_request(self, key):
+        """请求前调用，熔断中抛出XModbusUnavailableError，需要先探测时返回True"""
+        unit = self._units.get(key)
+        if unit is None or unit.state == STATE_CLOSED:
+            return False
+
+        if unit.state == STATE_OPEN:
+            if time.monotonic() - unit.opened_at < self.cooldown:
+                raise common.XModbusUnavailableError('unit {} is unavailable'.format(key[1]))
+            unit.state = STATE_HALF_OPEN
+
+        if unit.probing:
+            raise common.XModbusUnavailableError('unit {} is being probed'.format(key[1]))
+        unit.probing = True
+        return True
+
+    def record_success(self, key):
+        unit = self._units.get(key)
+        if unit is None:
+            return
+        if unit.state != STATE_CLOSED:
+            _logger.info('unit {} recovered'.format(key[1]))
+        del self._units[key]
+
+    def record_failure(self, key, error):
+        """记录一次失败，返回该失败是否计入熔断"""
+        unit = self._units.get(key)
+        if unit is not None:
+            unit.probing = False
+        if isinstance(error, _reply_errors):
+            # 从站有应答，连续失败次数重新计算
+            if unit is not None and unit.state == STATE_CLOSED:
+                del self._units[key]
+            return False
+        if not isinstance(error, self.failure_types) or isinstance(error, common.XModbusQueueTimeoutError):
+            # 排队超时的请求没有发送到从站，不计入熔断
+            return False
+
+        if unit is None:
+            unit = self._units[key] = UnitState()
+        unit.failures += 1
+        if unit.state == STATE_HALF_OPEN or unit.failures >= self.threshold:
+            if unit.state != STATE_OPEN:
+                _logger.warning('unit {} is unavailable after {} failures'.format(key[1], unit.failures))
+            unit.state = STATE_OPEN
+            unit.opened_at = time.monotonic()
+        return True
+
+    def as_dict(self):
+        return [{'unit_id': unit_id, 'state': unit.state, 'failures': unit.failures}
+                for (_, unit_id), unit in self._units.items()]
@@ -1,5 +1,53 @@
 # -*- coding: utf-8 -*-
 # author: lijie
+import array
+import collections
+import struct
+import sys
+
+
+# 数据类型
+INT16 = 'int16'
+UINT16 = 'uint16'
+INT32 = 'int32'
+UINT32 = 'uint32'
+FLOAT32 = 'float32'
+INT64 = 'int64'
+UINT64 = 'uint64'
+FLOAT64 = 'float64'
+STRING = 'string'
+BITFIELD = 'bitfield'
+
+# 数据类型 -> (struct格式, 占用寄存器数量)，字符串长度由定义时指定
+_data_types = {
+    INT16: ('h', 1),
+    UINT16: ('H', 1),
+    INT32: ('i', 2),
+    UINT32: ('I', 2),
+    FLOAT32: ('f', 2),
+    INT64: ('q', 4),
+    UINT64: ('Q', 4),
+    FLOAT64: ('d', 4),
+    STRING: ('s', None),
+    BITFIELD: ('H', 1),
+}
+
+# 字节序，A为最高字节
+ORDER_ABCD = 'ABCD'
+ORDER_CDAB = 'CDAB'
+ORDER_BADC = 'BADC'
+ORDER_DCBA = 'DCBA'
+
+# 字节序 -> (是否使用寄存器内字节交换后的数据, struct字节序)
+# 寄存器内字节交换后再按小端解码等价于字交换，因此四种字节序都只需要两份数据
+_orders = {
+    ORDER_ABCD: (False, '>'),
+    ORDER_CDAB: (True, '<'),
+    ORDER_BADC: (True, '>'),
+    ORDER_DCBA: (False, '<'),
+}
+
+
 class ModbusRegister(object):
     """modbus 寄存器定义"""
     def __init__(self, address):
@@ -16,12 +64,146 @@ class BitAccessProtocol:
         self._bit_map = dict()
 
     def define(self, bit, on_name, off_name):
-        BitMap = namedtuple('BitMap', ('on_name', 'off_name'))
+        BitMap = collections.namedtuple('BitMap', ('on_name', 'off_name'))
         self._bit_map[bit] = BitMap(on_name, off_name)
 
+    def decode(self, value):
+        """返回{bit: on_name or off_name}"""
+        return dict((bit, names.on_name if value >> bit & 1 else names.off_name)
+                    for bit, names in self._bit_map.items())
+
+
+class DataPoint:
+    """数据点定义"""
+    def __init__(self, name, address, data_type, order=None, scale=None, offset=None, length=None, bits=None):
+        if data_type not in _data_types:
+            raise ValueError('不支持的数据类型: {}'.format(data_type))
+        if order is None:
+            order = ORDER_ABCD
+        if order not in _orders:
+            raise ValueError('不支持的字节序: {}'.format(order))
+
+        code, count = _data_types[data_type]
+        if data_type == STRING:
+            if not length:
+                raise ValueError('字符串类型需要指定占用的寄存器数量length')
+            count = length
+            code = '{}s'.format(length * 2)
+
+        self.name = name
+        self.address = address
+        self.data_type = data_type
+        self.order = order
+        self.scale = scale
+        self.offset = offset
+        # 占用的寄存器数量
+        self.count = count
+        # 位定义，BitAccessProtocol
+        self.bits = bits
+        self.code = code
+
+    def convert(self, value):
+        """将解码出的原始值转换为最终值"""
+        if self.data_type == STRING:
+            return value.rstrip(b'\x00').decode('latin-1')
+        if self.bits is not None:
+            return self.bits.decode(value)
+        if self.scale is not None:
+            value = value * self.scale
+        if self.offset is not None:
+            value = value + self.offset
+        return value
+
 
 class BinAccessProtocol:
-    """数据访问协议"""
+    """数据访问协议
+
+    定义一组数据点，将一段连续的寄存器一次性解码为各数据点的值。
+    相同字节序的数据点合并为一个struct格式，一次unpack完成解码。
+    """
+    def __init__(self):
+        self._points = list()
+        # (address, quantity) -> 解码步骤
+        self._decoders = dict()
+
+    @property
+    def points(self):
+        return self._points
+
+    def define(self, name, address, data_type, order=None, scale=None, offset=None, length=None, bits=None):
+        """定义数据点"""
+        point = DataPoint(name, address, data_type, order, scale, offset, length, bits)
+        self._points.append(point)
+        self._decoders.clear()
+        return point
+
+    def _compile(self, address, quantity):
+        end = address + quantity
+        points = [p for p in self._points if address <= p.address and p.address + p.count <= end]
+
+        groups = collections.defaultdict(list)
+        for point in points:
+            if point.data_type == STRING:
+                # 字符串只区分寄存器内的字节顺序
+                swapped = point.order in (ORDER_BADC, ORDER_DCBA)
+                groups[(swapped, '>')].append(point)
+            else:
+                groups[_orders[point.order]].append(point)
+
+        steps = list()
+        for (swapped, endian), group in groups.items():
+            group.sort(key=lambda p: p.address)
+            # 相互重叠的数据点不能出现在同一个格式中，拆分为多个格式
+            while group:
+                fmt = [endian]
+                members = list()
+                base = position = group[0].address
+                rest = list()
+                for point in group:
+                    if point.address < position:
+                        rest.append(point)
+                        continue
+                    if point.address > position:
+                        fmt.append('{}x'.format((point.address - position) * 2))
+                    fmt.append(point.code)
+                    members.append(point)
+                    position = point.address + point.count
+                steps.append((swapped, struct.Struct(''.join(fmt)), (base - address) * 2, members))
+                group = rest
+
+        converters = [p for p in points if p.data_type == STRING or p.bits is not None
+                      or p.scale is not None or p.offset is not None]
+        return steps, converters
+
+    def decode(self, address, registers):
+        """解码从address开始的一段寄存器，返回{name: value}，不完全落在该段内的数据点被忽略"""
+        values = registers if isinstance(registers, array.array) else array.array('H', registers)
+        key = (address, len(values))
+        decoder = self._decoders.get(key)
+        if decoder is None:
+            decoder = self._decoders[key] = self._compile(address, len(values))
+        steps, converters = decoder
+
+        # 两份数据：寄存器按大端排列，以及寄存器内字节交换后的排列
+        if sys.byteorder == 'little':
+            swapped_data = values.tobytes()
+            big = array.array('H', values)
+            big.byteswap()
+            data = big.tobytes()
+        else:
+            data = values.tobytes()
+            little = array.array('H', values)
+            little.byteswap()
+            swapped_data = little.tobytes()
+
+        result = dict()
+        for swapped, fmt, offset, members in steps:
+            unpacked = fmt.unpack_from(swapped_data if swapped else data, offset)
+            result.update(zip([p.name for p in members], unpacked))
+
+        for point in converters:
+            result[point.name] = point.convert(result[point.name])
+        return result
 
 
 class DiscretesInputRegister(ModbusRegister):
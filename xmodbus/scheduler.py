@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import asyncio
+import logging
+
+
+_logger = logging.getLogger()
+
+
+class ScanGroup:
+    """扫描组，以固定周期执行一个轮询任务"""
+    def __init__(self, name, period, job, on_result=None, offset=None):
+        if period <= 0:
+            raise ValueError('扫描周期必须大于0')
+
+        self.name = name
+        # 扫描周期，单位秒
+        self.period = period
+        # 轮询任务，形如 async def job(client)
+        self.job = job
+        # 轮询结果回调，形如 def on_result(group, result)
+        self.on_result = on_result
+        # 首次执行相对调度器启动时刻的偏移，单位秒
+        self.offset = offset or 0
+
+        self.cycles = 0
+        self.errors = 0
+        self.overruns = 0
+        self.skipped_cycles = 0
+        self.last_duration = 0
+        self.max_duration = 0
+        self.last_lateness = 0
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'period': self.period,
+            'cycles': self.cycles,
+            'errors': self.errors,
+            'overruns': self.overruns,
+            'skipped_cycles': self.skipped_cycles,
+            'last_duration': self.last_duration,
+            'max_duration': self.max_duration,
+            'last_lateness': self.last_lateness,
+        }
+
+
+class PollScheduler:
+    """轮询调度器
+
+    每个扫描组按单调时钟上的固定时间线执行，周期不会累积漂移；
+    某次扫描超出周期时，错过的周期直接跳过而不会堆积补执行，并通过on_overrun报告。
+    """
+    def __init__(self, client, on_overrun=None):
+        self.client = client
+        # 超时回调，形如 def on_overrun(group, skipped)
+        self.on_overrun = on_overrun
+        self.groups = dict()
+        self._tasks = dict()
+
+    def add_group(self, name, period, job, on_result=None, offset=None):
+        """注册扫描组，调度器运行中注册的扫描组立即开始调度"""
+        if name in self.groups:
+            raise ValueError('扫描组已存在: {}'.format(name))
+
+        group = ScanGroup(name, period, job, on_result, offset)
+        self.groups[name] = group
+        if self._tasks:
+            self._start_group(group)
+        return group
+
+    def remove_group(self, name):
+        """注销扫描组"""
+        self.groups.pop(name)
+        task = self._tasks.pop(name, None)
+        if task:
+            task.cancel()
+
+    def stats(self):
+        return [group.as_dict() for group in self.groups.values()]
+
+    def start(self):
+        """启动所有扫描组"""
+        for group in self.groups.values():
+            if group.name not in self._tasks:
+                self._start_group(group)
+
+    def stop(self):
+        """停止所有扫描组"""
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+
+    async def run(self):
+        """启动并等待所有扫描组结束"""
+        self.start()
+        try:
+            await asyncio.gather(*self._tasks.values())
+        finally:
+            self.stop()
+
+    def _start_group(self, group):
+        self._tasks[group.name] = asyncio.create_task(self._run_group(group))
+
+    async def _run_group(self, group):
+        loop = asyncio.get_running_loop()
+        next_due = loop.time() + group.offset
+        while True:
+            delay = next_due - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            started = loop.time()
+            group.last_lateness = started - next_due
+            try:
+                result = await group.job(self.client)
+                if group.on_result:
+                    group.on_result(group, result)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                group.errors += 1
+                _logger.error('scan group {} failed: {}'.format(group.name, e))
+
+            finished = loop.time()
+            group.cycles += 1
+            group.last_duration = finished - started
+            group.max_duration = max(group.max_duration, group.last_duration)
+
+            next_due += group.period
+            if finished > next_due:
+                skipped = int((finished - next_due) // group.period) + 1
+                next_due += skipped * group.period
+                group.overruns += 1
+                group.skipped_cycles += skipped
+                _logger.warning('scan group {} overrun, {} cycle(s) skipped'.format(group.name, skipped))
+                if self.on_overrun:
+                    self.on_overrun(group, skipped)
@@ -1,10 +1,237 @@
 # -*- coding: utf-8 -*-
 # author: lijie
+import asyncio
+import logging
+import mmap
+import os
+import signal
+import struct
+import xmodbus.common as common
+import xmodbus.pdu as pdu
+from xmodbus.framer.framer_socket import MBAPDecoder
 
 
-class SyncModbusClient(object):
-    """同步方式的modbus客户端"""
+_logger = logging.getLogger()
 
 
-class AsyncioModbusClient(object):
-    """异步方式的modbus客户端"""
+class ServerStats:
+    """服务端统计"""
+    fields = ('connections', 'total_connections', 'requests', 'exceptions', 'bytes_in', 'bytes_out')
+
+    def __init__(self):
+        self.connections = 0
+        self.total_connections = 0
+        self.requests = 0
+        self.exceptions = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in self.fields)
+
+
+class ModbusServerProtocol(asyncio.Protocol):
+    """一个modbus/TCP连接
+
+    每次收到数据后解码出所有完整的请求帧，应答合并为一次写出；
+    发送缓冲区过高时暂停读取，直到对端取走数据。
+    """
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.decoder = MBAPDecoder()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.server.stats.connections += 1
+        self.server.stats.total_connections += 1
+
+    def connection_lost(self, exc):
+        self.server.stats.connections -= 1
+        self.transport = None
+
+    def data_received(self, data):
+        self.server.stats.bytes_in += len(data)
+        self.decoder.feed(data)
+        try:
+            frames = self.decoder.frames()
+        except common.XModbusError as e:
+            _logger.warning('close connection: {}'.format(e))
+            self.transport.close()
+            return
+
+        responses = list()
+        for frame in frames:
+            response = self.server.process_request_frame(frame)
+            if response is not None:
+                responses.append(response)
+
+        if responses:
+            data = b''.join(responses)
+            self.server.stats.bytes_out += len(data)
+            self.transport.write(data)
+
+    def pause_writing(self):
+        self.transport.pause_reading()
+
+    def resume_writing(self):
+        self.transport.resume_reading()
+
+
+class AioModbusServer:
+    """异步方式的modbus/TCP服务端"""
+    protocol_cls = ModbusServerProtocol
+
+    def __init__(self, datastore, host=None, port=None, reuse_port=None):
+        self.datastore = datastore
+        self.host = host or '0.0.0.0'
+        self.port = 502 if port is None else port
+        self.reuse_port = reuse_port
+        self.stats = ServerStats()
+        self._server = None
+
+    def process_request_frame(self, frame):
+        """处理一个请求帧(MBAPFrame)，返回应答帧，不需要应答时返回None"""
+        unit_id = frame.unit_id
+        if not self.datastore.has_unit(unit_id):
+            return None
+
+        self.stats.requests += 1
+        request_pdu = frame.adu[7:]
+        try:
+            response_pdu = pdu.decode_request_pdu(request_pdu).execute(self.datastore, unit_id)
+        except common.XModbusExceptionError as e:
+            self.stats.exceptions += 1
+            response_pdu = pdu.encode_exception_pdu(request_pdu[0], e.code)
+        except Exception as e:
+            _logger.error('request failed: {}'.format(e))
+            self.stats.exceptions += 1
+            response_pdu = pdu.encode_exception_pdu(request_pdu[0], common.SLAVE_DEVICE_FAILURE)
+
+        mbap = struct.pack('>HHHB', frame.transaction_identifier, 0, len(response_pdu) + 1, unit_id)
+        return b''.join([mbap, response_pdu])
+
+    async def start(self, sock=None):
+        """开始监听，sock不为None时在已绑定的socket上监听"""
+        loop = asyncio.get_running_loop()
+        if sock is not None:
+            self._server = await loop.create_server(lambda: self.protocol_cls(self), sock=sock)
+        else:
+            self._server = await loop.create_server(lambda: self.protocol_cls(self), self.host, self.port,
+                                                    reuse_port=self.reuse_port)
+        _logger.info('modbus server listen on {}'.format(self.sockets))
+        return self
+
+    @property
+    def sockets(self):
+        return [s.getsockname() for s in self._server.sockets] if self._server else []
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        await self._server.serve_forever()
+
+    def close(self):
+        if self._server:
+            self._server.close()
+            self._server = None
+
+
+class MultiProcessModbusServer:
+    """多进程modbus/TCP服务端
+
+    启动多个工作进程，每个进程运行一个AioModbusServer，通过SO_REUSEPORT监听同一端口，
+    由内核在进程间分配连接。各进程需要共享数据时应使用MmapDatastore，在启动前创建，
+    fork后所有进程访问同一份数据。各工作进程定期将统计数据写入共享内存，由主进程汇总。
+    """
+    def __init__(self, datastore, host=None, port=None, workers=None, stats_interval=None):
+        self.datastore = datastore
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        # 工作进程发布统计数据的周期，单位秒
+        self.stats_interval = stats_interval or 1
+        self.pids = list()
+
+        self._stats_struct = struct.Struct('{}q'.format(len(ServerStats.fields)))
+        self._stats = mmap.mmap(-1, self._stats_struct.size * self.workers)
+
+    def start(self):
+        """fork所有工作进程"""
+        for index in range(self.workers):
+            pid = os.fork()
+            if pid == 0:
+                code = 0
+                try:
+                    asyncio.run(self._run_worker(index))
+                except Exception as e:
+                    _logger.error('worker {} failed: {}'.format(index, e))
+                    code = 1
+                finally:
+                    os._exit(code)
+            self.pids.append(pid)
+        return self
+
+    async def _run_worker(self, index):
+        loop = asyncio.get_running_loop()
+        stopped = asyncio.Event()
+        loop.add_signal_handler(signal.SIGTERM, stopped.set)
+        loop.add_signal_handler(signal.SIGINT, stopped.set)
+
+        server = AioModbusServer(self.datastore, self.host, self.port, reuse_port=True)
+        await server.start()
+        try:
+            while not stopped.is_set():
+                self._publish_stats(index, server.stats)
+                try:
+                    await asyncio.wait_for(stopped.wait(), self.stats_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._publish_stats(index, server.stats)
+            server.close()
+
+    def _publish_stats(self, index, stats):
+        values = [getattr(stats, name) for name in ServerStats.fields]
+        self._stats_struct.pack_into(self._stats, index * self._stats_struct.size, *values)
+
+    def worker_stats(self):
+        """返回各工作进程的统计数据[{...}, ...]"""
+        result = list()
+        for index in range(self.workers):
+            values = self._stats_struct.unpack_from(self._stats, index * self._stats_struct.size)
+            result.append(dict(zip(ServerStats.fields, values)))
+        return result
+
+    def stats(self):
+        """返回所有工作进程汇总的统计数据"""
+        total = dict((name, 0) for name in ServerStats.fields)
+        for stats in self.worker_stats():
+            for name, value in stats.items():
+                total[name] += value
+        return total
+
+    def stop(self):
+        """停止所有工作进程"""
+        for pid in self.pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        self.wait()
+
+    def wait(self):
+        """等待所有工作进程退出"""
+        for pid in self.pids:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.pids = list()
+
+    def serve_forever(self):
+        self.start()
+        try:
+            self.wait()
+        except KeyboardInterrupt:
+            self.stop()
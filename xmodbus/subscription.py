@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+# author: lijie
+import array
+import asyncio
+import logging
+import xmodbus.common as common
+from xmodbus.planner import ReadPlanner, ReadNeed
+
+
+_logger = logging.getLogger()
+
+_bit_tables = {common.COILS, common.DISCRETE_INPUTS}
+
+
+class Subscription:
+    """一段地址的变化订阅
+
+    保存上一次上报的值(寄存器为array，位为bytes)，新值与其整体比较，相同时直接返回；
+    不同时将两者按字节序列转为整数异或，只在非零的位置上逐个判断死区，
+    因此大部分数据不变时每个周期只有一次C层面的比较。
+    寄存器变化量超过absolute且超过上次上报值的percent%时才上报，死区判断相对于上次上报的值，
+    缓慢漂移累积超过死区后也会上报。
+    """
+    def __init__(self, unit_id, table, address, count, callback, absolute=None, percent=None, signed=None):
+        if table in _bit_tables and (absolute or percent):
+            raise ValueError('位数据不支持死区')
+
+        self.need = ReadNeed(unit_id, table, address, count)
+        # 变化回调，形如 def callback(subscription, [(address, old, new), ...])，首次读到的值old为None
+        self.callback = callback
+        # 绝对死区和百分比死区
+        self.absolute = absolute or 0
+        self.percent = percent or 0
+        # 寄存器是否按有符号数(int16)比较
+        self.signed = bool(signed)
+
+        # 上一次上报的值
+        self._reported = None
+        self._lane_bits = 8 if table in _bit_tables else 16
+
+        self.polls = 0
+        self.errors = 0
+        self.changes = 0
+
+    @property
+    def unit_id(self):
+        return self.need.unit_id
+
+    @property
+    def table(self):
+        return self.need.table
+
+    @property
+    def address(self):
+        return self.need.address
+
+    @property
+    def count(self):
+        return self.need.count
+
+    def _pack(self, values):
+        if self.table in _bit_tables:
+            return bytes(values)
+        if self.signed:
+            return array.array('h', array.array('H', values).tobytes())
+        return array.array('H', values)
+
+    def _exceeds(self, old, new):
+        delta = abs(new - old)
+        if delta <= self.absolute:
+            return False
+        if self.percent and delta * 100 <= self.percent * abs(old):
+            return False
+        return True
+
+    def update(self, values):
+        """输入新读到的值，返回[(address, old, new), ...]"""
+        self.polls += 1
+        current = self._pack(values)
+        reported = self._reported
+        if reported is None:
+            self._reported = current if self.table not in _bit_tables else bytearray(current)
+            if self.table in _bit_tables:
+                changes = [(self.address + i, None, bool(value)) for i, value in enumerate(current)]
+            else:
+                changes = [(self.address + i, None, value) for i, value in enumerate(current)]
+            self.changes += len(changes)
+            return changes
+
+        if current == reported:
+            return []
+
+        lane_bits = self._lane_bits
+        lane_mask = (1 << lane_bits) - 1
+        diff = int.from_bytes(bytes(current), 'little') ^ int.from_bytes(bytes(reported), 'little')
+        changes = list()
+        while diff:
+            index = ((diff & -diff).bit_length() - 1) // lane_bits
+            diff &= ~(lane_mask << (index * lane_bits))
+            old, new = reported[index], current[index]
+            if lane_bits == 16 and not self._exceeds(old, new):
+                continue
+            reported[index] = new
+            if lane_bits == 8:
+                old, new = bool(old), bool(new)
+            changes.append((self.address + index, old, new))
+
+        self.changes += len(changes)
+        return changes
+
+    def as_dict(self):
+        return {
+            'unit_id': self.unit_id,
+            'table': self.table,
+            'address': self.address,
+            'count': self.count,
+            'polls': self.polls,
+            'errors': self.errors,
+            'changes': self.changes,
+        }
+
+
+class SubscriptionManager:
+    """订阅管理
+
+    所有订阅的地址段经ReadPlanner合并为尽量少的读请求，每次poll执行一遍并只对变化的值调用订阅回调。
+    poll可以直接作为PollScheduler的扫描任务: scheduler.add_group('subscriptions', 1, manager.poll)。
+    """
+    def __init__(self, client, planner=None):
+        self.client = client
+        self.planner = planner or ReadPlanner()
+        self.subscriptions = list()
+        self._plan = None
+
+    def subscribe(self, unit_id, table, address, count, callback, absolute=None, percent=None, signed=None):
+        """订阅一段地址，返回Subscription"""
+        subscription = Subscription(unit_id, table, address, count, callback, absolute, percent, signed)
+        self.subscriptions.append(subscription)
+        self._plan = None
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscriptions.remove(subscription)
+        self._plan = None
+
+    @property
+    def plan(self):
+        """所有订阅合并后的ReadPlan"""
+        if self._plan is None:
+            self._plan = self.planner.plan([s.need for s in self.subscriptions])
+        return self._plan
+
+    async def poll(self, client=None):
+        """以异步方式读取所有订阅并上报变化，返回本次上报的变化数
+
+        与ReadPlan.aio_execute相同，客户端以流水线方式工作时并发发出请求，否则逐个请求应答
+        """
+        if not self.subscriptions:
+            return 0
+        the_client = client or self.client
+        plan = self.plan
+        responses = await plan.aio_execute_requests(the_client, return_exceptions=True)
+        return self._dispatch(plan, responses)
+
+    def sync_poll(self, client=None):
+        """以同步方式读取所有订阅并上报变化，返回本次上报的变化数"""
+        if not self.subscriptions:
+            return 0
+        the_client = client or self.client
+        plan = self.plan
+        responses = the_client.execute_many(plan.build_requests(), return_exceptions=True)
+        return self._dispatch(plan, responses)
+
+    def _dispatch(self, plan, responses):
+        for response in responses:
+            if isinstance(response, asyncio.CancelledError):
+                raise response
+
+        values = plan.slice(responses)
+        total = 0
+        for subscription in list(self.subscriptions):
+            current = values.get(subscription.need)
+            if current is None:
+                subscription.errors += 1
+                continue
+
+            changes = subscription.update(current)
+            if not changes:
+                continue
+            total += len(changes)
+            try:
+                subscription.callback(subscription, changes)
+            except Exception as e:
+                _logger.error('subscription callback failed: {}'.format(e))
+        return total
+
+    def stats(self):
+        return [s.as_dict() for s in self.subscriptions]
@@ -6,6 +6,7 @@ A collection of utilities for packing data, unpacking
 data computing checksums, and decode checksums.
 """
 from six import string_types
+import struct
 import sys
 import six
 
@@ -132,6 +133,83 @@ def dict_property(store, index):
 # --------------------------------------------------------------------------- #
 # Bit packing functions
 # --------------------------------------------------------------------------- #
+def __generate_bit_table():
+    """ Generates a lookup table mapping a byte to its 8 bits,
+    least significant bit first, one 0/1 byte per bit
+
+    .. note:: This will only be generated once
+    """
+    return [bytes((byte >> i) & 1 for i in range(8)) for byte in range(256)]
+
+__bit_table = __generate_bit_table()
+__bit_values = {0: 0, 1: 1, 'on': 1, 'off': 0}
+__bit_error = 'bit value must be True, False, 1, 0, `on` or `off`'
+# multiplying a word of eight 0/1 bytes by this moves byte i to bit
+# 56 + i, so the top byte of the product is the packed byte
+__bit_gather = 0x0102040810204080
+
+
+def __bit_value(value):
+    if isinstance(value, string_types):
+        value = value.lower()
+    try:
+        return __bit_values[value]
+    except (KeyError, TypeError):
+        raise ValueError(__bit_error)
+
+
+def __check_bits(bits):
+    if bits.translate(None, b'\x00\x01'):
+        raise ValueError(__bit_error)
+    return bits
+
+
+def to_bits(values):
+    """ Converts bit values into a compact bit array, one 0/1
+    byte per bit. Accepts bools, 0/1 ints, 'on'/'off' strings,
+    bytes-like 0/1 bit arrays and NumPy arrays
+
+    :param values: The bit values
+    :returns: The bits as bytes
+    :raises ValueError: If a value is not a bit value
+    """
+    if isinstance(values, (bytes, bytearray, memoryview)):
+        return __check_bits(bytes(values))
+    if hasattr(values, 'dtype'):
+        if values.dtype != bool and not ((values == 0) | (values == 1)).all():
+            raise ValueError(__bit_error)
+        return values.astype(bool).tobytes()
+    try:
+        # bools and small ints convert at C speed
+        return __check_bits(bytes(values))
+    except TypeError:
+        pass
+    return bytes(map(__bit_value, values))
+
+
+def pack_bits(values):
+    """ Packs bit values into the modbus wire format, least
+    significant bit of the first byte first, in linear time
+
+    :param values: The bit values, see to_bits
+    :returns: The packed bits
+
+    example::
+
+        packed = pack_bits([1, 0, 1, 0, 0, 0, 0, 0, 1])  # b'\x05\x01'
+    """
+    bits = to_bits(values)
+    if hasattr(values, 'dtype'):
+        import numpy
+        return numpy.packbits(values.astype(bool), bitorder='little').tobytes()
+    if not bits:
+        return b''
+    # eight bits per 64 bit word, each word packs into one byte
+    bits += bytes(-len(bits) % 8)
+    words = struct.unpack('<%dQ' % (len(bits) // 8), bits)
+    return bytes((word * __bit_gather) >> 56 & 0xFF for word in words)
+
+
 def pack_bitstring(bits):
     """ Creates a string out of an array of bits
 
@@ -142,21 +220,26 @@ def pack_bitstring(bits):
         bits   = [False, True, False, True]
         result = pack_bitstring(bits)
     """
-    ret = b''
-    i = packed = 0
-    for bit in bits:
-        if bit:
-            packed += 128
-        i += 1
-        if i == 8:
-            ret += int2byte(packed)
-            i = packed = 0
-        else:
-            packed >>= 1
-    if 0 < i < 8:
-        packed >>= (7 - i)
-        ret += int2byte(packed)
-    return ret
+    return pack_bits(bits)
+
+
+def unpack_bits(data, count=None):
+    """ Unpacks modbus packed bits into a compact bit array,
+    one 0/1 byte per bit, least significant bit of the first
+    byte first
+
+    :param data: The packed bits
+    :param count: The number of bits to keep, all if None
+    :returns: The bits as bytes
+
+    example::
+
+        bits = unpack_bits(b'\x05', 4)  # b'\x01\x00\x01\x00'
+    """
+    bits = b''.join(map(__bit_table.__getitem__, data))
+    if count is not None:
+        bits = bits[:count]
+    return bits
 
 
 def unpack_bitstring(string):
@@ -169,17 +252,7 @@ def unpack_bitstring(string):
         bytes  = 'bytes to decode'
         result = unpack_bitstring(bytes)
     """
-    byte_count = len(string)
-    bits = []
-    for byte in range(byte_count):
-        if IS_PYTHON3:
-            value = byte2int(int(string[byte]))
-        else:
-            value = byte2int(string[byte])
-        for _ in range(8):
-            bits.append((value & 1) == 1)
-            value >>= 1
-    return bits
+    return list(map(bool, unpack_bits(string)))
 
 
 def make_byte_string(s):
@@ -213,6 +286,25 @@ def __generate_crc16_table():
 __crc16_table = __generate_crc16_table()
 
 
+def __generate_crc16_word_table():
+    """ Generates a crc16 lookup table which consumes two bytes
+    per step, indexed by the bytes as a native order 16 bit word.
+
+    .. note:: This will only be generated once, on first use
+    """
+    table = __crc16_table
+    result = [0] * 65536
+    for word in range(65536):
+        crc = (word >> 8) ^ table[word & 0xff]
+        crc = (crc >> 8) ^ table[crc & 0xff]
+        if sys.byteorder == 'big':
+            word = ((word << 8) & 0xff00) | (word >> 8)
+        result[word] = crc
+    return result
+
+__crc16_word_table = None
+
+
 def computeCRC(data):
     """ Computes a crc16 on the passed in string. For modbus,
     this is only used on the binary serial protocols (in this
@@ -221,13 +313,26 @@ def computeCRC(data):
     The difference between modbus's crc16 and a normal crc16
     is that modbus starts the crc value out at 0xffff.
 
+    Two bytes are consumed per step through a 64k entry table,
+    the last odd byte (if any) through the byte table.
+
     :param data: The data to create a crc16 of
     :returns: The calculated CRC
     """
+    global __crc16_word_table
+    if __crc16_word_table is None:
+        __crc16_word_table = __generate_crc16_word_table()
+
+    table = __crc16_word_table
+    view = memoryview(data)
+    even = len(view) & ~1
+
     crc = 0xffff
-    for a in data:
-        idx = __crc16_table[(crc ^ byte2int(a)) & 0xff]
-        crc = ((crc >> 8) & 0xff) ^ idx
+    for word in view[:even].cast('H'):
+        crc = table[crc ^ word]
+    if even != len(view):
+        crc = (crc >> 8) ^ __crc16_table[(crc ^ view[even]) & 0xff]
+
     swapped = ((crc << 8) & 0xff00) | ((crc >> 8) & 0x00ff)
     return swapped
 